@@ -0,0 +1,256 @@
+import argparse  # 独立运行时的命令行参数
+import asyncio  # 模拟模型推理与图片下载的延迟
+import json  # 响应序列化
+import random  # 延迟抖动与错误注入
+import struct  # 生成 PNG 文件块
+import time  # 响应里的 created 字段
+import uuid  # request_id / completion id
+import zlib  # PNG 压缩与 CRC
+from dataclasses import dataclass, fields  # 延迟与错误率配置
+from typing import AsyncIterator, Dict, List, Optional, Tuple  # 类型注解
+
+from fastapi import FastAPI, Request  # 假上游服务
+from fastapi.responses import JSONResponse, Response, StreamingResponse  # 普通 / SSE / 图片响应
+
+# 本地假上游：同时扮演 DashScope 原生接口（/api/v1/...）、OpenAI 兼容接口（/compatible-mode/v1/...）
+# 和图片 CDN（/images/...），延迟与错误率可配置；被测服务通过环境变量指向这里，压测时不消耗真实配额
+
+SAMPLE_ANALYSIS = {
+    "summary": "整体评价正面，主要关注性价比",
+    "sentiment_score": 7.5,
+    "sentiment_keywords": ["性价比", "续航", "做工"],
+    "user_persona": "价格敏感的学生党",
+    "pain_points": ["售后响应慢"],
+    "gain_points": ["续航长", "价格实惠"],
+    "marketing_suspicion": "低",
+    "verdict": "买入",
+    "confidence": 0.85,
+}
+
+
+@dataclass
+class FakeUpstreamConfig:
+    ttft_ms: float = 300.0  # 首个分片前的等待（排队 + 预填充）
+    chunk_ms: float = 15.0  # 相邻分片的间隔（解码速度）
+    chunks: int = 24  # 一次回答拆成的分片数
+    jitter: float = 0.2  # 延迟的随机浮动比例
+    error_rate: float = 0.0  # 模型调用返回错误的概率
+    error_status: Tuple[int, ...] = (429, 500)  # 注入错误时随机选取的状态码
+    image_latency_ms: float = 30.0  # 图片下载的响应延迟
+    image_size: int = 256  # 生成图片的边长（像素），未压缩约 边长² × 3 字节
+
+
+def _jittered(ms: float, jitter: float) -> float:
+    return max(0.0, ms * (1 + random.uniform(-jitter, jitter))) / 1000
+
+
+def _split(text: str, parts: int) -> List[str]:
+    step = max(1, -(-len(text) // max(1, parts)))
+    return [text[i : i + step] for i in range(0, len(text), step)]
+
+
+def make_png(size: int, seed: int) -> bytes:
+    # 随机像素 + 不压缩的 zlib 流：体积稳定、解码开销接近真实照片，不依赖 Pillow
+    rng = random.Random(seed)
+    row = size * 3
+    raw = b"".join(b"\x00" + rng.randbytes(row) for _ in range(size))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 0)) + chunk(b"IEND", b"")
+
+
+def create_app(config: Optional[FakeUpstreamConfig] = None) -> FastAPI:
+    config = config or FakeUpstreamConfig()
+    app = FastAPI()
+    app.state.config = config
+    app.state.calls = {"dashscope": 0, "openai": 0, "images": 0, "errors": 0}
+    images: Dict[Tuple[str, int], bytes] = {}
+
+    def answer() -> str:
+        return json.dumps(SAMPLE_ANALYSIS, ensure_ascii=False)
+
+    def inject_error() -> Optional[int]:
+        if config.error_rate and random.random() < config.error_rate:
+            app.state.calls["errors"] += 1
+            return random.choice(config.error_status)
+        return None
+
+    async def decode(parts: List[str]) -> AsyncIterator[str]:
+        await asyncio.sleep(_jittered(config.ttft_ms, config.jitter))
+        for index, part in enumerate(parts):
+            if index:
+                await asyncio.sleep(_jittered(config.chunk_ms, config.jitter))
+            yield part
+
+    # ---- DashScope 原生多模态接口（dashscope SDK）----
+
+    def dashscope_body(text: str, request_id: str, output_tokens: int) -> str:
+        return json.dumps(
+            {
+                "output": {"choices": [{"finish_reason": "null", "message": {"role": "assistant", "content": [{"text": text}]}}]},
+                "usage": {"input_tokens": 800, "output_tokens": output_tokens},
+                "request_id": request_id,
+            },
+            ensure_ascii=False,
+        )
+
+    @app.post("/api/v1/services/aigc/multimodal-generation/generation")
+    async def dashscope_generation(request: Request):
+        app.state.calls["dashscope"] += 1
+        request_id = uuid.uuid4().hex
+        status = inject_error()
+        if status:
+            await asyncio.sleep(_jittered(config.ttft_ms / 4, config.jitter))
+            return JSONResponse(
+                {"code": "Throttling" if status == 429 else "InternalError", "message": "injected", "request_id": request_id},
+                status_code=status,
+            )
+        parts = _split(answer(), config.chunks)
+        if request.headers.get("X-DashScope-SSE") != "enable":
+            text = "".join([part async for part in decode(parts)])
+            return Response(dashscope_body(text, request_id, len(parts)), media_type="application/json")
+
+        async def events() -> AsyncIterator[str]:
+            index = 0
+            async for part in decode(parts):
+                index += 1
+                yield f"id:{index}\nevent:result\n:HTTP_STATUS/200\ndata:{dashscope_body(part, request_id, index)}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    # ---- OpenAI 兼容接口（pydantic-ai / openai SDK）----
+
+    def completion_message(body: dict, text: str) -> dict:
+        tools = body.get("tools") or []
+        if tools:  # pydantic-ai 默认以工具调用返回结构化输出
+            return {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {"id": "call_0", "type": "function", "function": {"name": tools[0]["function"]["name"], "arguments": text}}
+                ],
+            }
+        return {"role": "assistant", "content": text}
+
+    @app.get("/compatible-mode/v1/models")
+    async def models():
+        return {"object": "list", "data": []}
+
+    @app.post("/compatible-mode/v1/chat/completions")
+    async def chat_completions(request: Request):
+        app.state.calls["openai"] += 1
+        body = await request.json()
+        status = inject_error()
+        if status:
+            await asyncio.sleep(_jittered(config.ttft_ms / 4, config.jitter))
+            return JSONResponse({"error": {"message": "injected", "type": "injected", "code": str(status)}}, status_code=status)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = body.get("model", "fake")
+        parts = _split(answer(), config.chunks)
+        usage = {"prompt_tokens": 800, "completion_tokens": len(parts), "total_tokens": 800 + len(parts)}
+        if not body.get("stream"):
+            text = "".join([part async for part in decode(parts)])
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": completion_message(body, text), "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        tool = (body.get("tools") or [None])[0]
+
+        def frame(delta: dict, finish: Optional[str] = None, with_usage: bool = False) -> str:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            if with_usage:
+                chunk["usage"] = usage
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+        async def events() -> AsyncIterator[str]:
+            first = True
+            async for part in decode(parts):
+                if tool is None:
+                    yield frame({"role": "assistant", "content": part} if first else {"content": part})
+                else:
+                    call = {"index": 0, "function": {"arguments": part}}
+                    if first:
+                        call.update(id="call_0", type="function")
+                        call["function"]["name"] = tool["function"]["name"]
+                    yield frame({"role": "assistant", "tool_calls": [call]} if first else {"tool_calls": [call]})
+                first = False
+            yield frame({}, "tool_calls" if tool else "stop", with_usage=True)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    # ---- 图片 CDN ----
+
+    @app.get("/images/{name}")
+    async def image(name: str, size: Optional[int] = None):
+        app.state.calls["images"] += 1
+        size = size or config.image_size
+        await asyncio.sleep(_jittered(config.image_latency_ms, config.jitter))
+        key = (name, size)
+        if key not in images:
+            images[key] = make_png(size, zlib.crc32(name.encode()))
+        return Response(
+            images[key],
+            media_type="image/png",
+            headers={"Cache-Control": "max-age=60", "ETag": f'"{name}-{size}"'},
+        )
+
+    @app.get("/_stats")
+    async def stats():
+        return app.state.calls
+
+    return app
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = FakeUpstreamConfig()
+    for field in fields(FakeUpstreamConfig):
+        value = getattr(defaults, field.name)
+        flag = f"--{field.name.replace('_', '-')}"
+        if isinstance(value, tuple):
+            parser.add_argument(flag, default=",".join(map(str, value)))
+        else:
+            parser.add_argument(flag, type=type(value), default=value)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeUpstreamConfig:
+    values = {field.name: getattr(args, field.name) for field in fields(FakeUpstreamConfig)}
+    values["error_status"] = tuple(int(item) for item in str(values["error_status"]).split(",") if item)
+    return FakeUpstreamConfig(**values)
+
+
+def config_to_argv(config: FakeUpstreamConfig) -> List[str]:
+    argv = []
+    for field in fields(FakeUpstreamConfig):
+        value = getattr(config, field.name)
+        argv += [f"--{field.name.replace('_', '-')}", ",".join(map(str, value)) if isinstance(value, tuple) else str(value)]
+    return argv
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="本地假 DashScope / 图片 CDN")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+import argparse  # 命令行参数
+import asyncio  # 并发驱动请求
+import json  # 结果输出与基线对比
+import os  # 被测服务的环境变量
+import socket  # 选取空闲端口
+import subprocess  # 启动假上游与被测服务
+import sys  # 当前解释器
+import tempfile  # 图片、任务队列等临时文件
+import time  # 计时
+from contextlib import ExitStack, contextmanager  # 子进程的生命周期
+from pathlib import Path  # 路径
+from typing import Any, Dict, Iterator, List, Optional  # 类型注解
+
+import httpx  # 压测客户端
+from prometheus_client.parser import text_string_to_metric_families  # 解析 /metrics
+
+from .fake_upstream import add_config_arguments, config_from_args, config_to_argv
+from .workload import ROUTES, RouteStats, Workload, parse_mix, percentile
+
+# 压测入口：启动假上游与被测服务（uvicorn main:app），按配置的并发与负载组合发请求，
+# 输出各路由的 p50/p95/p99、RPS、错误率、进程内存，以及探测请求（GET /）的延迟——
+# 模型请求都在等待上游时，探测延迟升高说明有代码阻塞了事件循环
+#
+#   python -m bench.run --concurrency 32 --duration 30
+#   python -m bench.run --routes pydanticai --mix base64=1 --env IMAGE_PREPROCESS_ENABLED=1
+#   python -m bench.run --json bench-main.json                     # 保存基线
+#   python -m bench.run --baseline bench-main.json --tolerance 0.2 # 与基线对比，退化时退出码为 1
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"进程已退出（exit {process.returncode}）: {process.args}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"等待 {url} 就绪超时")
+
+
+@contextmanager
+def _spawn(args: List[str], env: Dict[str, str], log_path: Path, ready_url: str) -> Iterator[subprocess.Popen]:
+    with open(log_path, "wb") as log:
+        process = subprocess.Popen(args, cwd=SERVICE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            _wait_ready(ready_url, process)
+            yield process
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def _parse_metrics(text: str) -> Dict[str, Any]:
+    # 进程 RSS 与各阶段耗时的累计值；前后两次相减得到本轮压测的数据
+    snapshot: Dict[str, Any] = {"stages": {}}
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            if sample.name == "process_resident_memory_bytes":
+                snapshot["rss"] = sample.value
+            elif sample.name in ("vibe_stage_duration_seconds_sum", "vibe_stage_duration_seconds_count"):
+                key = f"{sample.labels['pipeline']}/{sample.labels['stage']}"
+                field = "sum" if sample.name.endswith("_sum") else "count"
+                snapshot["stages"].setdefault(key, {"sum": 0.0, "count": 0.0})[field] = sample.value
+    return snapshot
+
+
+async def _scrape(client: httpx.AsyncClient) -> Dict[str, Any]:
+    try:
+        response = await client.get("/metrics")
+    except httpx.HTTPError:
+        return {}
+    return _parse_metrics(response.text) if response.status_code == 200 else {}
+
+
+def _stage_means(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    result = {}
+    for key, end in after.get("stages", {}).items():
+        start = before.get("stages", {}).get(key, {"sum": 0.0, "count": 0.0})
+        count = end["count"] - start["count"]
+        if count:
+            result[key] = {"count": int(count), "mean_ms": round((end["sum"] - start["sum"]) / count * 1000, 1)}
+    return dict(sorted(result.items()))
+
+
+async def _send(client: httpx.AsyncClient, workload: Workload, route: str, stats: RouteStats) -> None:
+    path, params, kind, body = workload.next_request(route)
+    started = time.perf_counter()
+    first_byte = 0.0
+    try:
+        async with client.stream("POST", path, params=params, json=body) as response:
+            status = str(response.status_code)
+            if params.get("stream"):
+                # 流式接口以 200 开始，失败体现在最后的 error 事件里
+                async for line in response.aiter_lines():
+                    if not first_byte:
+                        first_byte = time.perf_counter() - started
+                    if line and json.loads(line).get("type") == "error":
+                        status = "stream_error"
+            else:
+                await response.aread()
+                first_byte = time.perf_counter() - started
+    except httpx.HTTPError as exc:
+        status = type(exc).__name__
+    stats.record(kind, status, time.perf_counter() - started, first_byte)
+
+
+async def _probe(client: httpx.AsyncClient, interval: float, samples: List[float], stop: asyncio.Event) -> None:
+    # GET / 不做任何 I/O，耗时基本等于在事件循环里排队的时间
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await client.get("/")
+            samples.append(time.perf_counter() - started)
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _drive(target: str, workload: Workload, args: argparse.Namespace) -> Dict[str, Any]:
+    routes = args.routes.split(",")
+    stats = {route: RouteStats() for route in routes}
+    limits = httpx.Limits(max_connections=args.concurrency + 4, max_keepalive_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(base_url=target, timeout=args.timeout, limits=limits) as client:
+        # 预热：建立连接、触发懒加载，不计入结果
+        await asyncio.gather(*(_send(client, workload, route, RouteStats()) for route in routes for _ in range(2)))
+
+        issued = 0
+        deadline = time.perf_counter() + args.duration
+
+        def take() -> Optional[str]:
+            nonlocal issued
+            if (args.requests and issued >= args.requests) or (not args.requests and time.perf_counter() >= deadline):
+                return None
+            issued += 1
+            return routes[issued % len(routes)]
+
+        async def user() -> None:
+            # 闭环：每个并发用户收到响应后立即发下一个请求
+            while (route := take()) is not None:
+                await _send(client, workload, route, stats[route])
+
+        probes: List[float] = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_probe(client, args.probe_interval, probes, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+
+    total = RouteStats()
+    for route_stats in stats.values():
+        total.latencies += route_stats.latencies
+        total.first_bytes += route_stats.first_bytes
+        for key, value in route_stats.statuses.items():
+            total.statuses[key] = total.statuses.get(key, 0) + value
+        for key, value in route_stats.kinds.items():
+            total.kinds[key] = total.kinds.get(key, 0) + value
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "routes": {route: route_stats.summary(elapsed) for route, route_stats in stats.items()},
+        "total": total.summary(elapsed),
+        "loop_probe": {
+            "samples": len(probes),
+            "p50_ms": round(percentile(probes, 50) * 1000, 2),
+            "p99_ms": round(percentile(probes, 99) * 1000, 2),
+            "max_ms": round(max(probes, default=0.0) * 1000, 2),
+        },
+    }
+
+
+def _service_env(args: argparse.Namespace, upstream: str, workdir: Path) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update(
+        {
+            "DASHSCOPE_API_KEY": "bench",
+            "DASHSCOPE_HTTP_BASE_URL": f"{upstream}/api/v1",
+            "DASHSCOPE_COMPAT_BASE_URL": f"{upstream}/compatible-mode/v1",
+            # 默认关闭结果缓存与限流，测的是每个请求都走完整链路时的吞吐；需要时用 --env 覆盖
+            "SENTIMENT_CACHE_BACKEND": "off",
+            "DASHSCOPE_RATE_LIMIT": "0",
+            "SENTIMENT_JOB_DB": str(workdir / "jobs.sqlite3"),
+            "LOG_LEVEL": "WARNING",
+        }
+    )
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+def _compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    for route, current in result["routes"].items():
+        previous = baseline.get("routes", {}).get(route)
+        if not previous:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if previous[key] and current[key] > previous[key] * (1 + tolerance):
+                regressions.append(f"{route} {key}: {previous[key]} -> {current[key]}")
+        if previous["rps"] and current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{route} rps: {previous['rps']} -> {current['rps']}")
+        if current["error_rate"] > previous["error_rate"] + tolerance / 10:
+            regressions.append(f"{route} error_rate: {previous['error_rate']} -> {current['error_rate']}")
+    previous_rss = baseline.get("memory", {}).get("rss_after_mb")
+    current_rss = result.get("memory", {}).get("rss_after_mb")
+    if previous_rss and current_rss and current_rss > previous_rss * (1 + tolerance):
+        regressions.append(f"rss_after_mb: {previous_rss} -> {current_rss}")
+    return regressions
+
+
+def _print_report(result: Dict[str, Any]) -> None:
+    header = f"{'route':<20}{'reqs':>7}{'ok':>7}{'err%':>7}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'ttfb95':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, row in [*result["routes"].items(), ("total", result["total"])]:
+        print(
+            f"{name:<20}{row['requests']:>7}{row['ok']:>7}{row['error_rate'] * 100:>7.1f}{row['rps']:>9.1f}"
+            f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}{row['ttfb_p95_ms']:>9.1f}"
+        )
+    print(f"\nstatuses: {result['total']['statuses']}  kinds: {result['total']['kinds']}")
+    probe = result["loop_probe"]
+    print(f"event-loop probe (GET /): p50 {probe['p50_ms']} ms, p99 {probe['p99_ms']} ms, max {probe['max_ms']} ms")
+    memory = result.get("memory")
+    if memory:
+        print(f"service RSS: {memory.get('rss_before_mb')} MB -> {memory.get('rss_after_mb')} MB (peak {memory.get('rss_peak_mb')} MB)")
+    if result.get("stages"):
+        print("\nstage means:")
+        for key, value in result["stages"].items():
+            print(f"  {key:<40}{value['count']:>8}{value['mean_ms']:>10.1f} ms")
+    if result.get("upstream_calls"):
+        print(f"\nfake upstream calls: {result['upstream_calls']}")
+
+
+async def _watch_rss(client: httpx.AsyncClient, samples: List[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        snapshot = await _scrape(client)
+        if "rss" in snapshot:
+            samples.append(snapshot["rss"])
+        try:
+            await asyncio.wait_for(stop.wait(), 1.0)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _measure(target: str, workload: Workload, args: argparse.Namespace) -> Dict[str, Any]:
+    async with httpx.AsyncClient(base_url=target, timeout=5.0) as client:
+        before = await _scrape(client)
+        samples: List[float] = []
+        stop = asyncio.Event()
+        watcher = asyncio.create_task(_watch_rss(client, samples, stop))
+        try:
+            result = await _drive(target, workload, args)
+        finally:
+            stop.set()
+            await watcher
+        after = await _scrape(client)
+    if "rss" in after:
+        mb = 1024 * 1024
+        result["memory"] = {
+            "rss_before_mb": round(before.get("rss", 0) / mb, 1),
+            "rss_after_mb": round(after["rss"] / mb, 1),
+            "rss_peak_mb": round(max(samples + [after["rss"]]) / mb, 1),
+        }
+    result["stages"] = _stage_means(before, after)
+    return result
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="情感分析接口压测（本地假上游）")
+    parser.add_argument("--routes", default="sentiment,pydanticai", help=f"逗号分隔，可选 {','.join(ROUTES)}")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发用户数（闭环）")
+    parser.add_argument("--duration", type=float, default=20.0, help="压测时长（秒）")
+    parser.add_argument("--requests", type=int, default=0, help="总请求数；设置后忽略 --duration")
+    parser.add_argument("--timeout", type=float, default=60.0, help="单个请求超时（秒）")
+    parser.add_argument("--mix", default="text=3,url=4,local=1,base64=2", help="负载类型权重")
+    parser.add_argument("--image-pool", type=int, default=32, help="不同图片的数量")
+    parser.add_argument("--max-images", type=int, default=3, help="每个请求最多几张图片")
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="复用已发送文本的比例")
+    parser.add_argument("--probe-interval", type=float, default=0.05, help="事件循环探测间隔（秒）")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=1, help="被测服务的 uvicorn worker 数")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="传给被测服务的环境变量")
+    parser.add_argument("--target", help="压测已运行的服务，不再自动启动")
+    parser.add_argument("--upstream", help="使用已运行的假上游，不再自动启动")
+    parser.add_argument("--json", dest="json_path", help="把结果写入 JSON 文件")
+    parser.add_argument("--baseline", help="与之前保存的 JSON 结果对比")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="与基线对比时允许的退化比例")
+    add_config_arguments(parser)  # 假上游的延迟、分片、错误率等
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    unknown = set(args.routes.split(",")) - set(ROUTES)
+    if unknown:
+        raise SystemExit(f"未知路由: {', '.join(sorted(unknown))}")
+
+    with ExitStack() as stack:
+        workdir = Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="vibe-bench-")))
+        upstream = args.upstream
+        if not upstream:
+            port = _free_port()
+            upstream = f"http://127.0.0.1:{port}"
+            command = [sys.executable, "-m", "bench.fake_upstream", "--port", str(port)]
+            command += config_to_argv(config_from_args(args))
+            stack.enter_context(_spawn(command, dict(os.environ), workdir / "upstream.log", f"{upstream}/_stats"))
+
+        target = args.target
+        if not target:
+            port = _free_port()
+            target = f"http://127.0.0.1:{port}"
+            command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(args.workers),
+                       "--log-level", "warning", "--no-access-log"]
+            stack.enter_context(_spawn(command, _service_env(args, upstream, workdir), workdir / "service.log", target))
+
+        workload = Workload(
+            upstream_url=upstream,
+            image_dir=workdir / "images",
+            mix=parse_mix(args.mix),
+            image_pool=args.image_pool,
+            image_size=args.image_size,
+            max_images=args.max_images,
+            repeat_ratio=args.repeat_ratio,
+            seed=args.seed,
+        )
+        result = asyncio.run(_measure(target, workload, args))
+        try:
+            result["upstream_calls"] = httpx.get(f"{upstream}/_stats", timeout=5.0).json()
+        except httpx.HTTPError:
+            pass
+        result["config"] = {key: value for key, value in vars(args).items() if key not in ("json_path", "baseline")}
+
+        _print_report(result)
+        if not args.target and result["total"]["error_rate"] > 0.5:
+            print(f"\n错误率过高，被测服务日志: {workdir / 'service.log'}")
+            print((workdir / "service.log").read_text(errors="replace")[-4000:])
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.baseline:
+        regressions = _compare(result, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        if regressions:
+            print("\n性能退化:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\n与基线相比无明显退化")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+import base64  # base64 图片负载
+import random  # 按权重抽取请求类型
+import uuid  # 每个请求独立的文本，避免命中结果缓存 / 请求合并
+from dataclasses import dataclass, field  # 路由与统计结构
+from pathlib import Path  # 本地图片文件
+from typing import Any, Dict, List, Optional, Tuple  # 类型注解
+
+from .fake_upstream import make_png
+
+# 压测负载：按权重混合纯文本、图片 URL、本地路径与 base64 图片，驱动两条情感分析路由
+# 原生 DashScope 路由只接受 URL（图片由模型侧拉取），本地路径与 base64 只发给 pydanticai 路由
+
+TEXTS = [
+    "刚入手这款耳机，音质不错但是降噪一般，续航确实能撑一整天。",
+    "第三次买这家的咖啡豆了，香气足、价格也合适，就是物流有点慢。",
+    "博主推荐的面霜用了两周，脸反而有点泛红，不太确定是不是过敏。",
+    "这家新开的火锅店排队两小时，锅底一般，服务态度很好，性价比不高。",
+]
+
+ROUTES = {
+    # 名称 -> (路径, 查询参数, 支持的图片类型)
+    "sentiment": ("/api/analyze/sentiment", {}, ("text", "url")),
+    "sentiment-stream": ("/api/analyze/sentiment", {"stream": "ndjson"}, ("text", "url")),
+    "pydanticai": ("/api/vibe/pydanticai/sentiment", {}, ("text", "url", "local", "base64")),
+    "pydanticai-stream": ("/api/vibe/pydanticai/sentiment", {"stream": "ndjson"}, ("text", "url", "local", "base64")),
+}
+
+DEFAULT_MIX = {"text": 3, "url": 4, "local": 1, "base64": 2}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    # "text=3,url=4,local=1,base64=2"
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise ValueError(f"未知的负载类型: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+@dataclass
+class Workload:
+    upstream_url: str  # 假上游地址，图片 URL 指向其 /images
+    image_dir: Path  # 本地图片目录
+    mix: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_MIX))
+    image_pool: int = 32  # 不同图片的数量，决定图片缓存的命中率
+    image_size: int = 256
+    max_images: int = 3  # 每个请求的最大图片数
+    repeat_ratio: float = 0.0  # 复用之前文本的比例，用于观察结果缓存 / 请求合并的效果
+    seed: Optional[int] = None
+    _rng: random.Random = field(init=False)
+    _base64_pool: List[str] = field(init=False, default_factory=list)
+    _sent: List[str] = field(init=False, default_factory=list)
+
+    def __post_init__(self) -> None:
+        self._rng = random.Random(self.seed)
+        self.image_dir.mkdir(parents=True, exist_ok=True)
+        for index in range(self.image_pool):
+            path = self.image_dir / f"bench-{index}.png"
+            if not path.exists():
+                path.write_bytes(make_png(self.image_size, index))
+        # base64 负载只准备少量，编码本身不计入被测服务的耗时
+        for index in range(min(self.image_pool, 8)):
+            data = (self.image_dir / f"bench-{index}.png").read_bytes()
+            self._base64_pool.append("data:image/png;base64," + base64.b64encode(data).decode())
+
+    def _sources(self, kind: str) -> List[str]:
+        count = self._rng.randint(1, self.max_images)
+        picks = [self._rng.randrange(self.image_pool) for _ in range(count)]
+        if kind == "url":
+            return [f"{self.upstream_url}/images/bench-{i}.png?size={self.image_size}" for i in picks]
+        if kind == "local":
+            return [str(self.image_dir / f"bench-{i}.png") for i in picks]
+        return [self._base64_pool[i % len(self._base64_pool)] for i in picks]
+
+    def next_request(self, route: str) -> Tuple[str, Dict[str, str], str, Dict[str, Any]]:
+        """返回 (路径, 查询参数, 负载类型, 请求体)。"""
+        path, params, kinds = ROUTES[route]
+        allowed = [(kind, weight) for kind, weight in self.mix.items() if kind in kinds and weight > 0]
+        if not allowed:
+            allowed = [("text", 1.0)]
+        kind = self._rng.choices([k for k, _ in allowed], weights=[w for _, w in allowed])[0]
+
+        if self._sent and self._rng.random() < self.repeat_ratio:
+            text = self._rng.choice(self._sent)
+        else:
+            text = f"{self._rng.choice(TEXTS)} #{uuid.uuid4().hex[:8]}"
+            self._sent.append(text)
+            del self._sent[:-1000]
+
+        body: Dict[str, Any] = {"text": text}
+        if kind == "url":
+            body["image_urls"] = self._sources(kind)
+        elif kind == "local":
+            body["image_sources"] = self._sources(kind)
+        elif kind == "base64":
+            body["image_base64"] = self._sources(kind)
+        return path, params, kind, body
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = q / 100 * (len(ordered) - 1)
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+@dataclass
+class RouteStats:
+    latencies: List[float] = field(default_factory=list)  # 完整响应耗时（秒），只统计 2xx
+    first_bytes: List[float] = field(default_factory=list)  # 首字节耗时（流式接口关心）
+    statuses: Dict[str, int] = field(default_factory=dict)
+    kinds: Dict[str, int] = field(default_factory=dict)
+
+    def record(self, kind: str, status: str, latency: float, first_byte: float) -> None:
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.kinds[kind] = self.kinds.get(kind, 0) + 1
+        if status.startswith("2"):
+            self.latencies.append(latency)
+            self.first_bytes.append(first_byte)
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        total = sum(self.statuses.values())
+        ok = len(self.latencies)
+        return {
+            "requests": total,
+            "ok": ok,
+            "error_rate": round(1 - ok / total, 4) if total else 0.0,
+            "rps": round(ok / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(self.latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(self.latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(self.latencies, 99) * 1000, 1),
+            "max_ms": round(max(self.latencies, default=0.0) * 1000, 1),
+            "ttfb_p95_ms": round(percentile(self.first_bytes, 95) * 1000, 1),
+            "statuses": dict(sorted(self.statuses.items())),
+            "kinds": dict(sorted(self.kinds.items())),
+        }
@@ -3,13 +3,26 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI()
+from vibe.logging_setup import configure_logging, request_id_middleware  # noqa: E402
 
+# 先装好日志处理器，各模块导入时输出的告警也走结构化日志
+configure_logging()
+
+from vibe.metrics import metrics_middleware, router as vibe_metrics_router  # noqa: E402
+from vibe.resources import lifespan  # noqa: E402
 from vibe.sentiment import router as vibe_sentiment_router  # noqa: E402
 from vibe.pydanticai_demo import router as vibe_pydanticai_router  # noqa: E402
+from vibe.prompt_service import router as vibe_prompt_router  # noqa: E402
+
+# lifespan：启动时建立 DashScope 连接池与 Agent 并预热，关闭时释放连接池与进程池
+app = FastAPI(lifespan=lifespan)
+app.middleware("http")(metrics_middleware)
+app.middleware("http")(request_id_middleware)  # 最后注册的中间件在最外层，整条链路的日志都带上请求 ID
 
 app.include_router(vibe_sentiment_router)
 app.include_router(vibe_pydanticai_router)
+app.include_router(vibe_prompt_router)
+app.include_router(vibe_metrics_router)
 
 
 @app.get("/")
@@ -0,0 +1,186 @@
+import asyncio
+
+import httpx
+import pytest
+
+from vibe import image_loader as image_loader_module
+from vibe.image_cache import ImageCache, content_digest
+from vibe.image_loader import AsyncImageLoader
+
+
+def disk_files(root):
+    return sorted(path for path in root.glob("*/*") if path.is_file())
+
+
+# ---------- 内存层 ----------
+
+
+def test_memory_tier_evicts_least_recently_used_within_byte_budget():
+    cache = ImageCache(max_bytes=10, disk_dir=None)
+    a = cache.store_blob(b"aaaa").digest
+    b = cache.store_blob(b"bbbb").digest
+    assert cache.get_blob(a) == b"aaaa"  # a 变为最近使用
+    c = cache.store_blob(b"cccc").digest
+
+    assert cache.get_blob(b) is None
+    assert cache.get_blob(a) == b"aaaa" and cache.get_blob(c) == b"cccc"
+    stats = cache.stats()
+    assert stats["memory_bytes"] == 8 and stats["evictions"] == 1
+
+
+def test_blob_larger_than_budget_is_returned_but_not_kept():
+    cache = ImageCache(max_bytes=4, disk_dir=None)
+    stored = cache.store_blob(b"too large")
+    assert stored.data == b"too large"
+    assert cache.get_blob(stored.digest) is None
+
+
+def test_same_content_under_different_keys_is_stored_once():
+    cache = ImageCache(disk_dir=None)
+    first = cache.store_base64("b64-key", bytes(bytearray(b"same image")), "image/png")
+    second = cache.store_variant("variant-key", bytes(bytearray(b"same image")), "image/webp")
+
+    assert first.digest == second.digest == content_digest(b"same image")
+    assert second.data is first.data  # 共享同一个 bytes 对象
+    assert cache.get_variant("variant-key").media_type == "image/webp"
+    stats = cache.stats()
+    assert stats["memory_entries"] == 1 and stats["dedup_hits"] == 1
+
+
+def test_index_lookups_count_hits_and_misses():
+    cache = ImageCache(disk_dir=None)
+    assert cache.get_base64("missing") is None
+    cache.store_base64("k", b"png", "image/png")
+    assert cache.get_base64("k").data == b"png"
+    stats = cache.stats()
+    assert (stats["base64_hits"], stats["base64_misses"]) == (1, 1)
+
+
+# ---------- URL 新鲜度与重新验证 ----------
+
+
+class Origin:
+    """模拟图片源站：返回 ETag，收到匹配的 If-None-Match 时回 304。"""
+
+    def __init__(self, cache_control: str) -> None:
+        self.cache_control = cache_control
+        self.requests: list[httpx.Request] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        headers = {"ETag": '"v1"', "Cache-Control": self.cache_control, "Content-Type": "image/png"}
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304, headers=headers)
+        return httpx.Response(200, headers=headers, content=b"png-bytes")
+
+
+def fetch_twice(origin: Origin, monkeypatch) -> tuple:
+    cache = ImageCache(disk_dir=None)
+    monkeypatch.setattr(image_loader_module, "image_cache", cache)
+
+    async def scenario():
+        loader = AsyncImageLoader()
+        loader._client = httpx.AsyncClient(transport=httpx.MockTransport(origin))
+        try:
+            url = "https://cdn.example.com/a.png"
+            return await loader.load(url), await loader.load(url)
+        finally:
+            await loader.aclose()
+
+    first, second = asyncio.run(scenario())
+    return cache, first, second
+
+
+def test_fresh_url_is_served_without_a_request(monkeypatch):
+    origin = Origin("max-age=60")
+    cache, first, second = fetch_twice(origin, monkeypatch)
+    assert len(origin.requests) == 1
+    assert second.data is first.data
+    assert cache.stats()["url_hits"] == 1
+
+
+def test_stale_url_revalidates_with_etag_and_reuses_cached_bytes(monkeypatch):
+    origin = Origin("no-cache")
+    cache, first, second = fetch_twice(origin, monkeypatch)
+    assert [request.headers.get("If-None-Match") for request in origin.requests] == [None, '"v1"']
+    assert second.data is first.data  # 304 直接复用缓存中的内容
+    assert second.media_type == "image/png"
+    stats = cache.stats()
+    assert (stats["url_misses"], stats["url_revalidated"]) == (1, 1)
+
+
+def test_last_modified_is_sent_as_validator():
+    cache = ImageCache(disk_dir=None)
+    cache.store_url("u", b"x", "image/png", {"Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT"})
+    assert cache.validators("u") == {"If-Modified-Since": "Wed, 01 Jan 2025 00:00:00 GMT"}
+    assert cache.validators("other") == {}
+
+
+def test_no_store_response_is_not_indexed():
+    cache = ImageCache(disk_dir=None)
+    cache.store_url("u", b"x", "image/png", {"Cache-Control": "no-store"})
+    assert cache.get_fresh("u") is None and cache.validators("u") == {}
+
+
+# ---------- 磁盘层 ----------
+
+
+def test_disk_tier_survives_restart_by_content_hash(tmp_path):
+    digest = ImageCache(disk_dir=str(tmp_path)).store_blob(b"persisted").digest
+    restarted = ImageCache(disk_dir=str(tmp_path))
+    assert restarted.get_blob(digest) == b"persisted"
+    assert restarted.stats()["disk_hits"] == 1
+    assert restarted.get_blob(digest) == b"persisted"
+    assert restarted.stats()["disk_hits"] == 1  # 已提升回内存层
+
+
+def test_disk_tier_trims_oldest_files_and_tracks_size(tmp_path):
+    cache = ImageCache(max_bytes=1, disk_dir=str(tmp_path), disk_max_bytes=2500)
+    digests = [cache.store_blob(bytes([index]) * 1000).digest for index in range(5)]
+
+    files = disk_files(tmp_path)
+    assert sum(path.stat().st_size for path in files) <= 2500
+    assert cache.stats()["disk_bytes"] == sum(path.stat().st_size for path in files)
+    assert {path.name for path in files} == set(digests[-2:])  # 最早写入的被淘汰
+    assert cache.get_blob(digests[0]) is None
+    assert cache.get_blob(digests[-1]) == bytes([4]) * 1000
+
+
+def test_restart_counts_existing_files_toward_disk_budget(tmp_path):
+    first = ImageCache(max_bytes=1, disk_dir=str(tmp_path), disk_max_bytes=2500)
+    for index in range(2):
+        first.store_blob(bytes([index]) * 1000)
+    restarted = ImageCache(max_bytes=1, disk_dir=str(tmp_path), disk_max_bytes=2500)
+    restarted.store_blob(b"\xff" * 1000)
+    assert sum(path.stat().st_size for path in disk_files(tmp_path)) <= 2500
+
+
+def test_async_variant_lookup_reads_disk_off_the_loop(tmp_path, monkeypatch):
+    cache = ImageCache(max_bytes=1, disk_dir=str(tmp_path))
+    cache.store_variant("k", b"variant", "image/webp")  # 超过内存预算，只留在磁盘层
+    offloaded = []
+    real_to_thread = asyncio.to_thread
+
+    async def tracking_to_thread(fn, *args):
+        offloaded.append(fn.__name__)
+        return await real_to_thread(fn, *args)
+
+    monkeypatch.setattr(asyncio, "to_thread", tracking_to_thread)
+    cached = asyncio.run(cache.get_variant_async("k"))
+    assert cached.data == b"variant" and cached.media_type == "image/webp"
+    assert offloaded == ["_read_disk"]
+
+
+def test_disk_write_leaves_no_temp_files(tmp_path):
+    cache = ImageCache(disk_dir=str(tmp_path))
+    cache.store_blob(b"one")
+    cache.store_blob(b"one")
+    assert [path.name for path in disk_files(tmp_path)] == [content_digest(b"one")]
+    assert not [path for path in tmp_path.rglob(".*") if path.is_file()]
+
+
+@pytest.mark.parametrize("disk", [False, True])
+def test_missing_keys_return_none(tmp_path, disk):
+    cache = ImageCache(disk_dir=str(tmp_path) if disk else None)
+    assert cache.get_blob("0" * 64) is None
+    assert asyncio.run(cache.get_fresh_async("https://example.com/none.png")) is None
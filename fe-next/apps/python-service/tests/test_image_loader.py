@@ -0,0 +1,155 @@
+import asyncio
+from collections import Counter
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from vibe import image_loader as image_loader_module
+from vibe import pydanticai_demo
+from vibe.image_cache import ImageCache
+from vibe.image_loader import AsyncImageLoader, ImageFetchError, LoadedImage
+from vibe.image_utils import ImageTooLargeError
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    # 每个用例使用独立的内存缓存，避免命中其他用例下载过的图片
+    monkeypatch.setattr(image_loader_module, "image_cache", ImageCache(disk_dir=None))
+
+
+def mock_loader(handler, **kwargs) -> AsyncImageLoader:
+    loader = AsyncImageLoader(**kwargs)
+    loader._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return loader
+
+
+def load_many(loader: AsyncImageLoader, sources):
+    async def scenario():
+        try:
+            return await loader.load_many(sources)
+        finally:
+            await loader.aclose()
+
+    return asyncio.run(scenario())
+
+
+def png(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, headers={"Content-Type": "image/png"}, content=request.url.path.encode())
+
+
+# ---------- load_many ----------
+
+
+def test_results_follow_input_order_and_failures_stay_in_place():
+    def origin(request):
+        if request.url.path == "/404.png":
+            return httpx.Response(404)
+        return png(request)
+
+    sources = ["https://a.example.com/1.png", "https://a.example.com/404.png", "https://b.example.com/2.png"]
+    results = load_many(mock_loader(origin), sources)
+
+    assert [type(item) for item in results] == [LoadedImage, ImageFetchError, LoadedImage]
+    assert [results[0].data, results[2].data] == [b"/1.png", b"/2.png"]
+    assert str(results[1]) == "404 Client Error: Not Found for url: https://a.example.com/404.png"
+
+
+def test_overall_deadline_turns_slow_downloads_into_timeouts():
+    async def origin(request):
+        if request.url.path == "/slow.png":
+            await asyncio.sleep(5)
+        return png(request)
+
+    loader = mock_loader(origin, deadline=0.1)
+    results = load_many(loader, ["https://cdn.example.com/fast.png", "https://cdn.example.com/slow.png"])
+
+    assert isinstance(results[0], LoadedImage)
+    assert isinstance(results[1], TimeoutError) and "0.1s" in str(results[1])
+
+
+def test_per_host_concurrency_is_capped():
+    inflight, peak = Counter(), Counter()
+
+    async def origin(request):
+        host = request.url.host
+        inflight[host] += 1
+        peak[host] = max(peak[host], inflight[host])
+        await asyncio.sleep(0.02)
+        inflight[host] -= 1
+        return png(request)
+
+    loader = mock_loader(origin, per_host=2)
+    sources = [f"https://{host}.example.com/{index}.png" for host in ("a", "b") for index in range(6)]
+    results = load_many(loader, sources)
+
+    assert all(isinstance(item, LoadedImage) for item in results)
+    assert peak == {"a.example.com": 2, "b.example.com": 2}
+    assert len(loader._host_slots) == 0  # 没有在途下载后槽位被回收
+
+
+def test_declared_oversize_is_rejected_before_reading_body():
+    def origin(request):
+        return httpx.Response(200, headers={"Content-Length": "1000"}, content=b"x" * 1000)
+
+    [result] = load_many(mock_loader(origin, max_bytes=100), ["https://cdn.example.com/big.png"])
+    assert isinstance(result, ImageTooLargeError) and "1000" in str(result)
+
+
+def test_streamed_oversize_is_rejected_without_content_length():
+    chunks_sent = 0
+
+    async def body():
+        nonlocal chunks_sent
+        for _ in range(100):
+            chunks_sent += 1
+            yield b"x" * 40
+
+    def origin(request):
+        return httpx.Response(200, content=body())  # 分块传输，没有 Content-Length
+
+    [result] = load_many(mock_loader(origin, max_bytes=100), ["https://cdn.example.com/big.png"])
+    assert isinstance(result, ImageTooLargeError)
+    assert chunks_sent < 100  # 超限后立即停止读取
+
+
+def test_empty_sources_make_no_requests():
+    def origin(request):
+        raise AssertionError("不应发起请求")
+
+    assert load_many(mock_loader(origin), []) == []
+
+
+# ---------- 聚合后的 400 错误 ----------
+
+
+def test_gather_images_aggregates_failures_into_one_400(monkeypatch, tmp_path):
+    def origin(request):
+        return httpx.Response(404) if request.url.path == "/404.png" else png(request)
+
+    loader = mock_loader(origin)
+    monkeypatch.setattr(pydanticai_demo, "image_loader", loader)
+    missing = str(tmp_path / "missing.png")
+    request = pydanticai_demo.PydanticAISentimentRequest(
+        text="帖子",
+        image_urls=["https://cdn.example.com/ok.png", "https://cdn.example.com/404.png"],
+        image_sources=[missing],
+    )
+
+    async def scenario():
+        try:
+            await pydanticai_demo._gather_images(request)
+        finally:
+            await loader.aclose()
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(scenario())
+
+    assert excinfo.value.status_code == 400
+    errors = excinfo.value.detail.split("; ")
+    assert len(errors) == 2
+    assert errors[0] == (
+        "图片获取失败: https://cdn.example.com/404.png -> "
+        "404 Client Error: Not Found for url: https://cdn.example.com/404.png"
+    )
+    assert errors[1].startswith(f"图片获取失败: {missing} -> ")
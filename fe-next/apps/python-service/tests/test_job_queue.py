@@ -0,0 +1,181 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from vibe import job_queue as job_queue_module
+from vibe.job_queue import JobQueue, JobStore
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(job_queue_module.time, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"), max_attempts=2)
+
+
+def test_claim_respects_lease_until_it_expires(store, clock):
+    job_id = store.submit("kind", {"n": 1})
+    assert store.claim(lease=10)[:3] == (job_id, "kind", {"n": 1})
+    assert store.claim(lease=10) is None  # 租约有效期内不会被其他 worker 领取
+
+    clock.now += 11  # worker 失联，租约过期
+    assert store.claim(lease=10)[:3] == (job_id, "kind", {"n": 1})
+    assert store.get(job_id)["attempts"] == 2
+
+
+def test_renew_extends_lease(store, clock):
+    job_id = store.submit("kind", {})
+    token = store.claim(lease=10)[3]
+    clock.now += 8
+    assert store.renew(job_id, token, lease=10)
+    clock.now += 8  # 超过最初的租约，但仍在续租后的有效期内
+    assert store.claim(lease=10) is None
+
+
+def test_stale_worker_cannot_write_after_lease_is_taken_over(store, clock):
+    job_id = store.submit("kind", {})
+    stale = store.claim(lease=10)[3]
+    clock.now += 11
+    fresh = store.claim(lease=10)[3]
+
+    assert not store.renew(job_id, stale, lease=10)
+    assert not store.complete(job_id, stale, {"from": "stale"})
+    assert not store.fail(job_id, stale, "stale")
+    assert not store.requeue(job_id, stale)
+    assert store.get(job_id)["status"] == "running"
+
+    assert store.complete(job_id, fresh, {"from": "fresh"})
+    assert store.get(job_id)["result"] == {"from": "fresh"}
+    assert not store.complete(job_id, fresh, {"from": "again"})  # 已结束的任务不会被再次写入
+
+
+def test_existing_database_gains_lease_token_column(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL, "
+        "result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+        "created_at REAL NOT NULL, updated_at REAL NOT NULL, available_at REAL NOT NULL, lease_until REAL)"
+    )
+    conn.close()
+    store = JobStore(str(path))
+    job_id = store.submit("kind", {})
+    assert store.complete(job_id, store.claim(lease=10)[3], {"ok": True})
+
+
+def test_expired_lease_beyond_max_attempts_fails_the_job(store, clock):
+    job_id = store.submit("kind", {})
+    store.claim(lease=10)
+    clock.now += 11
+    store.claim(lease=10)
+    clock.now += 11
+    assert store.claim(lease=10) is None
+    job = store.get(job_id)
+    assert job["status"] == "failed"
+    assert "超过最大执行次数" in job["error"]
+
+
+def test_requeue_with_delay(store, clock):
+    job_id = store.submit("kind", {})
+    token = store.claim(lease=10)[3]
+    store.requeue(job_id, token, delay=5, error="429")
+    job = store.get(job_id)
+    assert job["status"] == "queued" and job["error"] == "429" and job["attempts"] == 1
+    assert store.claim(lease=10) is None  # 未到 available_at
+    clock.now += 5
+    assert store.claim(lease=10)[0] == job_id
+
+
+def test_requeue_on_shutdown_does_not_count_attempt(store):
+    job_id = store.submit("kind", {})
+    token = store.claim(lease=10)[3]
+    store.requeue(job_id, token, count_attempt=False)
+    assert store.get(job_id)["attempts"] == 0
+
+
+def test_complete_and_fail(store):
+    done = store.submit("kind", {})
+    store.complete(done, store.claim(lease=10)[3], {"ok": True})
+    failed = store.submit("kind", {})
+    store.fail(failed, store.claim(lease=10)[3], "boom")
+    assert store.get(done)["result"] == {"ok": True}
+    assert store.get(failed)["status"] == "failed"
+    assert store.counts() == {"succeeded": 1, "failed": 1}
+
+
+def test_worker_requeues_rejected_jobs_then_succeeds(tmp_path):
+    class Rejected(Exception):
+        retry_after = 0.0
+
+    async def scenario():
+        queue = JobQueue(JobStore(str(tmp_path / "jobs.sqlite3")), workers=1, poll_interval=0.01)
+        calls = 0
+
+        async def handler(payload):
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise Rejected("rate limited")
+            return {"echo": payload["n"]}
+
+        queue.register("kind", handler)
+        job_id = await queue.submit("kind", {"n": 7})
+        job = await queue.wait(job_id, timeout=5)
+        await queue.stop()
+        return job, queue
+
+    job, queue = asyncio.run(scenario())
+    assert job["status"] == "succeeded"
+    assert job["result"] == {"echo": 7}
+    assert job["attempts"] == 2
+    assert queue._changed == {} and queue._waiters == {}  # 等待结束后登记表被回收
+
+
+def test_heartbeat_keeps_long_job_from_being_reclaimed(tmp_path):
+    async def scenario():
+        # 执行时间是租约的数倍；空闲的第二个 worker 一直在轮询，没有续租时会重新领取并再执行一次
+        queue = JobQueue(JobStore(str(tmp_path / "jobs.sqlite3")), workers=2, poll_interval=0.01, lease=0.1)
+        calls = 0
+
+        async def handler(payload):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.4)
+            return {"done": True}
+
+        queue.register("kind", handler)
+        job_id = await queue.submit("kind", {})
+        job = await queue.wait(job_id, timeout=5)
+        await queue.stop()
+        return job, calls
+
+    job, calls = asyncio.run(scenario())
+    assert job["status"] == "succeeded"
+    assert calls == 1 and job["attempts"] == 1
+
+
+def test_wait_timeout_cleans_up_waiter_registry(tmp_path):
+    async def scenario():
+        queue = JobQueue(JobStore(str(tmp_path / "jobs.sqlite3")), workers=0, poll_interval=0.01)
+        queue.register("kind", lambda payload: asyncio.sleep(0))
+        job_id = await queue.submit("kind", {})
+        job = await queue.wait(job_id, timeout=0.05)
+        return job, queue
+
+    job, queue = asyncio.run(scenario())
+    assert job["status"] == "queued"
+    assert queue._changed == {} and queue._waiters == {}
@@ -0,0 +1,43 @@
+import json
+
+from vibe.json_extract import JsonObjectExtractor, extract_json_object
+
+
+def feed_all(chunks):
+    extractor = JsonObjectExtractor()
+    for chunk in chunks:
+        result = extractor.feed(chunk)
+        if result is not None:
+            return result
+    return None
+
+
+def test_ignores_surrounding_text_and_code_fence():
+    text = '好的，结果如下：\n```json\n{"a": 1, "b": {"c": [1, 2]}}\n```\n以上。'
+    assert json.loads(extract_json_object(text)) == {"a": 1, "b": {"c": [1, 2]}}
+
+
+def test_braces_and_escaped_quotes_inside_strings_do_not_count():
+    text = r'{"summary": "含有 } 和 { 以及 \"引号\"", "n": 1} 尾部 {"x": 2}'
+    assert json.loads(extract_json_object(text)) == {"summary": '含有 } 和 { 以及 "引号"', "n": 1}
+
+
+def test_object_split_across_chunks():
+    source = '前言 {"k": "v\\"}", "nested": {"a": [1, {"b": 2}]}} 后记'
+    # 逐字符喂入，覆盖转义符、引号与括号落在分片边界上的情况
+    assert json.loads(feed_all(list(source))) == {"k": 'v"}', "nested": {"a": [1, {"b": 2}]}}
+
+
+def test_backslash_at_chunk_end_escapes_next_chunk():
+    assert feed_all(['{"a": "x\\', '"}"}']) == '{"a": "x\\"}"}'
+
+
+def test_incomplete_object_returns_none_and_later_input_is_ignored():
+    extractor = JsonObjectExtractor()
+    assert extractor.feed('{"a": {"b": 1}') is None
+    assert extractor.feed("}") == '{"a": {"b": 1}}'
+    assert extractor.feed('{"other": 2}') == '{"a": {"b": 1}}'
+
+
+def test_no_object():
+    assert extract_json_object("模型没有返回 JSON") is None
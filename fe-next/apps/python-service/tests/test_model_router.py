@@ -0,0 +1,239 @@
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+import pytest
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import AgentInfo, DeltaToolCall, FunctionModel
+
+from vibe import model_router
+from vibe.model_router import ModelRouter, RoutingPolicy
+from vibe.schemas import SentimentAnalysis
+from vibe.upstream import TokenBucket, UpstreamGovernor, UpstreamRejected
+
+
+def analysis(confidence: Optional[float] = 0.9, **overrides: Any) -> Dict[str, Any]:
+    return {
+        "summary": "总结",
+        "sentiment_score": 7,
+        "sentiment_keywords": ["优惠"],
+        "user_persona": "学生党",
+        "pain_points": [],
+        "gain_points": ["折扣"],
+        "marketing_suspicion": "低",
+        "verdict": "买入",
+        "confidence": confidence,
+        **overrides,
+    }
+
+
+class Script:
+    """按顺序给出模型的每次回复：dict 作为结构化输出参数，异常对象直接抛出。"""
+
+    def __init__(self, *replies: Any) -> None:
+        self.replies = list(replies)
+        self.calls = 0
+
+    def next(self) -> Dict[str, Any]:
+        self.calls += 1
+        reply = self.replies.pop(0) if len(self.replies) > 1 else self.replies[0]
+        if isinstance(reply, BaseException):
+            raise reply
+        return reply
+
+    def respond(self, messages: List[Any], info: AgentInfo) -> ModelResponse:
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, json.dumps(self.next()))])
+
+    async def stream(self, messages: List[Any], info: AgentInfo):
+        reply = self.replies[0]
+        if isinstance(reply, dict):
+            # 先推送一半参数，让路由器产出 partial，再补齐
+            text = json.dumps(self.next())
+            half = text.index('"user_persona"')
+            yield {0: DeltaToolCall(name=info.output_tools[0].name, json_args=text[:half])}
+            yield {0: DeltaToolCall(json_args=text[half:])}
+            return
+        self.calls += 1
+        self.replies.pop(0) if len(self.replies) > 1 else None
+        if isinstance(reply, tuple):  # (异常, 出错前是否已经输出一部分)
+            exc, partial = reply
+            if partial:
+                yield {0: DeltaToolCall(name=info.output_tools[0].name, json_args=json.dumps(analysis()))}
+            raise exc
+        raise reply
+
+
+def make_router(flash: Script, plus: Script, **policy: Any) -> ModelRouter:
+    agents = {
+        tier: Agent(
+            FunctionModel(script.respond, stream_function=script.stream, model_name=f"{tier}-model"),
+            output_type=SentimentAnalysis,
+        )
+        for tier, script in (("flash", flash), ("plus", plus))
+    }
+    governor = UpstreamGovernor(bucket=TokenBucket(rate=0), max_attempts=0)
+    return ModelRouter(agents, RoutingPolicy(**{"mode": "auto", **policy}), governor)
+
+
+def run(router: ModelRouter, text: str = "短文本", images: int = 0) -> SentimentAnalysis:
+    return asyncio.run(router.run(["msg"], text, images, router.policy))
+
+
+def run_stream(router: ModelRouter) -> List[Dict[str, Any]]:
+    async def collect():
+        events = []
+        try:
+            async for event in router.run_stream(["msg"], "短文本", 0, router.policy, 0):
+                events.append(event)
+        except Exception as exc:  # noqa: BLE001
+            events.append({"type": "raised", "error": exc})
+        return events
+
+    return asyncio.run(collect())
+
+
+def model_stats(router: ModelRouter, tier: str) -> Dict[str, Any]:
+    return router.stats()["models"][tier]
+
+
+# ---------- RoutingPolicy ----------
+
+
+def test_initial_tier_thresholds():
+    policy = RoutingPolicy(mode="auto", max_flash_images=2, max_flash_text=10)
+    assert policy.initial_tier("short", 2) == "flash"
+    assert policy.initial_tier("short", 3) == "plus"
+    assert policy.initial_tier("x" * 11, 0) == "plus"
+    assert RoutingPolicy(mode="flash").initial_tier("x" * 10_000, 99) == "flash"
+    assert RoutingPolicy(mode="plus").initial_tier("short", 0) == "plus"
+
+
+def test_escalation_reasons_only_in_auto_mode():
+    output = SentimentAnalysis(**analysis(confidence=0.1))
+    assert RoutingPolicy(mode="auto", min_confidence=0.6).escalation_reason(output, 0) == "low_confidence"
+    assert RoutingPolicy(mode="auto", max_flash_retries=0).escalation_reason(
+        SentimentAnalysis(**analysis()), 1
+    ) == "schema_retries"
+    assert RoutingPolicy(mode="flash").escalation_reason(output, 5) is None
+
+
+# ---------- run ----------
+
+
+def test_confident_flash_result_is_returned_without_plus():
+    flash, plus = Script(analysis(summary="flash")), Script(analysis(summary="plus"))
+    router = make_router(flash, plus)
+    assert run(router).summary == "flash"
+    assert plus.calls == 0
+    assert model_stats(router, "flash")["calls"] == 1
+
+
+def test_large_inputs_go_straight_to_plus():
+    flash, plus = Script(analysis(summary="flash")), Script(analysis(summary="plus"))
+    router = make_router(flash, plus, max_flash_images=1)
+    assert run(router, images=2).summary == "plus"
+    assert flash.calls == 0
+
+
+def test_low_confidence_escalates_to_plus():
+    flash, plus = Script(analysis(confidence=0.2)), Script(analysis(summary="plus"))
+    router = make_router(flash, plus, min_confidence=0.6)
+    assert run(router).summary == "plus"
+    stats = model_stats(router, "flash")
+    assert stats["escalations"] == 1 and stats["escalation_reasons"] == {"low_confidence": 1}
+
+
+def test_schema_retries_are_counted_from_retry_prompts():
+    flash = Script(analysis(sentiment_score=99), analysis())  # 第一次超出范围，触发一次校验重试
+    plus = Script(analysis(summary="plus"))
+    router = make_router(flash, plus, max_flash_retries=0)
+    assert run(router).summary == "plus"
+    assert flash.calls == 2
+    assert model_stats(router, "flash")["escalation_reasons"] == {"schema_retries": 1}
+
+
+def test_schema_retries_within_limit_do_not_escalate():
+    flash = Script(analysis(sentiment_score=99), analysis(summary="flash"))
+    router = make_router(flash, Script(analysis()), max_flash_retries=1)
+    assert run(router).summary == "flash"
+
+
+def test_flash_error_falls_back_to_plus():
+    flash, plus = Script(RuntimeError("flash down")), Script(analysis(summary="plus"))
+    router = make_router(flash, plus)
+    assert run(router).summary == "plus"
+    stats = model_stats(router, "flash")
+    assert stats["failures"] == 1 and stats["escalation_reasons"] == {"flash_error": 1}
+
+
+def test_upstream_rejection_is_not_escalated():
+    flash, plus = Script(UpstreamRejected(429, "quota", 1.0)), Script(analysis())
+    router = make_router(flash, plus)
+    with pytest.raises(UpstreamRejected):
+        run(router)
+    assert plus.calls == 0
+
+
+def test_explicit_mode_does_not_escalate_on_error():
+    flash, plus = Script(RuntimeError("flash down")), Script(analysis())
+    router = make_router(flash, plus, mode="flash")
+    with pytest.raises(RuntimeError):
+        run(router)
+    assert plus.calls == 0
+
+
+def test_per_tier_tokens_and_cost(monkeypatch):
+    monkeypatch.setitem(model_router.MODEL_PRICES, "flash", (1.0, 2.0))
+    router = make_router(Script(analysis()), Script(analysis()))
+    run(router)
+    stats = model_stats(router, "flash")
+    assert stats["input_tokens"] > 0 and stats["output_tokens"] > 0
+    assert stats["cost"] == round((stats["input_tokens"] * 1.0 + stats["output_tokens"] * 2.0) / 1000, 6)
+    assert model_stats(router, "plus")["calls"] == 0
+
+
+# ---------- run_stream ----------
+
+
+def test_stream_emits_partials_then_result():
+    router = make_router(Script(analysis(summary="flash")), Script(analysis()))
+    events = run_stream(router)
+    assert events[0]["type"] == "partial" and events[0]["model"] == "flash"
+    assert events[-1]["type"] == "result" and events[-1]["data"].summary == "flash"
+
+
+def test_stream_low_confidence_escalates_after_result_check():
+    router = make_router(Script(analysis(confidence=0.1)), Script(analysis(summary="plus")), min_confidence=0.6)
+    types = [(event["type"], event.get("model")) for event in run_stream(router)]
+    escalate = types.index(("escalate", None))
+    assert all(kind == "partial" and model == "flash" for kind, model in types[:escalate])
+    assert types[-1] == ("result", "plus")
+
+
+def test_stream_error_before_output_escalates_and_is_recorded():
+    flash, plus = Script((RuntimeError("flash down"), False)), Script(analysis(summary="plus"))
+    router = make_router(flash, plus)
+    events = run_stream(router)
+    assert events[0] == {"type": "escalate", "from": "flash", "to": "plus", "reason": "flash_error"}
+    assert events[-1]["data"].summary == "plus"
+    assert model_stats(router, "flash")["failures"] == 1
+
+
+def test_stream_error_after_partial_output_is_raised_without_escalation():
+    flash, plus = Script((RuntimeError("flash down"), True)), Script(analysis())
+    router = make_router(flash, plus)
+    events = run_stream(router)
+    assert events[0]["type"] == "partial"
+    assert events[-1]["type"] == "raised" and str(events[-1]["error"]) == "flash down"
+    assert plus.calls == 0
+    assert model_stats(router, "flash")["failures"] == 1
+
+
+def test_stream_upstream_rejection_is_not_escalated():
+    flash, plus = Script((UpstreamRejected(503, "breaker open", 5.0), False)), Script(analysis())
+    router = make_router(flash, plus)
+    events = run_stream(router)
+    assert [event["type"] for event in events] == ["raised"]
+    assert isinstance(events[0]["error"], UpstreamRejected)
+    assert plus.calls == 0
@@ -0,0 +1,261 @@
+import codecs
+import json
+import threading
+from pathlib import Path
+
+import pytest
+
+from vibe import project_analysis_prompt_builder as builder
+from vibe.project_analysis_prompt_builder import (
+    DEFAULT_IGNORE,
+    ImportGraph,
+    ProjectIndex,
+    _estimate_tokens,
+    _pack_code_blocks,
+    _read_text,
+    _render_tree,
+    _split_ignore,
+    build_module1_prompt,
+)
+
+
+def write(root: Path, rel: str, content: str | bytes) -> Path:
+    path = root / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if isinstance(content, bytes):
+        path.write_bytes(content)
+    else:
+        path.write_text(content, encoding="utf-8")
+    return path
+
+
+# ---------- _read_text ----------
+
+
+def test_read_text_strips_utf8_bom(tmp_path):
+    path = write(tmp_path, "a.txt", codecs.BOM_UTF8 + "第一行\n".encode("utf-8"))
+    assert _read_text(path) == "第一行\n"
+
+
+def test_read_text_decodes_utf16_with_bom(tmp_path):
+    path = write(tmp_path, "a.txt", "hello\n世界\n".encode("utf-16"))
+    assert _read_text(path) == "hello\n世界\n"
+
+
+def test_read_text_skips_binary(tmp_path):
+    assert _read_text(write(tmp_path, "a.bin", b"\x89PNG\r\n\x1a\n\0\0\0\rIHDR")) is None
+    assert _read_text(write(tmp_path, "b.bin", bytes(range(1, 32)) * 10)) is None
+
+
+def test_read_text_skips_minified_unless_asked(tmp_path):
+    path = write(tmp_path, "app.min.js", "var a=1;" * 1000)
+    assert _read_text(path) is None
+    assert _read_text(path, skip_minified=False) == "var a=1;" * 1000
+
+
+def test_read_text_head_keeps_line_endings_and_blank_lines(tmp_path):
+    path = write(tmp_path, "a.py", "one\n\n\nfour\nfive\n")
+    assert _read_text(path, max_lines=3) == "one\n\n\n"
+
+
+def test_read_text_respects_byte_limit(tmp_path):
+    path = write(tmp_path, "a.txt", "x" * 100)
+    assert _read_text(path, max_bytes=10) == "x" * 10
+
+
+def test_read_text_falls_back_to_latin1(tmp_path):
+    path = write(tmp_path, "a.txt", "caf\xe9 cr\xe8me\n".encode("latin-1"))
+    assert _read_text(path) == "café crème\n"
+
+
+def test_read_text_missing_file_reads_empty(tmp_path):
+    assert _read_text(tmp_path / "missing.txt") == ""
+
+
+# ---------- _render_tree ----------
+
+
+def test_render_tree_collapses_entries_past_per_directory_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(builder, "TREE_DIR_ENTRIES", 4)
+    for index in range(6):
+        write(tmp_path, f"f{index}.py", "x")
+    for index in range(3):
+        write(tmp_path, f"d{index}.md", "x")
+    tree = _render_tree(tmp_path, 3, set())
+    lines = tree.splitlines()
+    assert lines[0].startswith(f"{tmp_path} (9 files")
+    assert len([line for line in lines if line.endswith((".py", ".md"))]) == 4
+    assert any("more .py files" in line or "more .md files" in line for line in lines)
+
+
+def test_render_tree_stops_at_line_budget_and_marks_partial_totals(tmp_path, monkeypatch):
+    monkeypatch.setattr(builder, "TREE_MAX_LINES", 12)
+    for top in range(6):
+        for sub in range(4):
+            write(tmp_path, f"pkg{top}/mod{sub}/file.py", "x")
+    tree = _render_tree(tmp_path, 5, set())
+    lines = tree.splitlines()
+    assert lines[-1].startswith("(目录树已按预算截断")
+    assert len(lines) <= 12 + 1
+    assert "≥" in tree  # 未展开的子树只给出下限
+
+
+def test_render_tree_respects_depth_and_ignore(tmp_path):
+    write(tmp_path, "a/b/c/deep.py", "x")
+    write(tmp_path, "node_modules/pkg/index.js", "x")
+    tree = _render_tree(tmp_path, 2, _split_ignore(DEFAULT_IGNORE))
+    assert "node_modules" not in tree
+    assert "b/" in tree
+    assert "c/" not in tree
+
+
+def test_render_tree_scan_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(builder, "TREE_SCAN_DIRS", 3)
+    for index in range(5):
+        write(tmp_path, f"d{index}/x.py", "x")
+    assert "扫描 3 个目录" in _render_tree(tmp_path, 3, set())
+
+
+
+def test_module1_tree_reflects_files_added_at_max_depth(tmp_path):
+    project = tmp_path / "project"
+    write(project, "sub/a.txt", "ab")
+    index_path = tmp_path / "index.json"
+
+    def build() -> str:
+        with ProjectIndex(project, DEFAULT_IGNORE, index_path) as index:
+            return build_module1_prompt(project, 1, 10, DEFAULT_IGNORE, index=index)
+
+    assert "sub/ (1 file, 2 B)" in build()
+    write(project, "sub/b.txt", "x" * 5000)
+    write(project, "sub/c.txt", "ab")
+    assert "sub/ (3 files, 4.9 KB)" in build()
+
+# ---------- _pack_code_blocks ----------
+
+
+def _function(name: str, body_lines: int) -> str:
+    body = "".join(f"    value_{index} = {index}\n" for index in range(body_lines))
+    return f"def {name}():\n{body}    return None\n\n\n"
+
+
+def test_pack_code_blocks_prefers_scenario_segments_within_budget(tmp_path):
+    entry = write(
+        tmp_path,
+        "service.py",
+        "import os\n\n\n" + "".join(_function(f"unrelated_{index}", 30) for index in range(6))
+        + _function("handle_refund", 5),
+    )
+    core = write(tmp_path, "core.py", "".join(_function(f"helper_{index}", 30) for index in range(4)))
+    budget = 400
+    entry_blocks, core_blocks = _pack_code_blocks(tmp_path, [entry], [core], "refund flow", budget)
+    rendered = "\n\n".join([*entry_blocks, *core_blocks])
+    assert "def handle_refund" in rendered
+    assert "⋮ (省略第" in rendered
+    assert _estimate_tokens(rendered) <= budget
+
+
+def test_pack_code_blocks_includes_everything_when_budget_allows(tmp_path):
+    entry = write(tmp_path, "main.py", _function("main", 3))
+    core = write(tmp_path, "lib.py", _function("helper", 3))
+    entry_blocks, core_blocks = _pack_code_blocks(tmp_path, [entry], [core], "anything", 10_000)
+    assert "⋮" not in entry_blocks[0] + core_blocks[0]
+    assert "def main" in entry_blocks[0] and "def helper" in core_blocks[0]
+
+
+def test_pack_code_blocks_marks_skipped_and_omitted_files(tmp_path):
+    entry = write(tmp_path, "main.py", _function("main", 200))
+    binary = write(tmp_path, "blob.py", b"\0\0\0\0")
+    entry_blocks, core_blocks = _pack_code_blocks(tmp_path, [entry], [binary], "x", 40)
+    assert entry_blocks == ["#### `main.py`\n(超出 token 预算，已省略)"]
+    assert core_blocks == ["#### `blob.py`\n(二进制或压缩文件，已跳过)"]
+
+
+# ---------- ImportGraph ----------
+
+
+@pytest.fixture
+def graph_project(tmp_path):
+    files = {
+        "app/main.py": "from app.services import billing\nfrom .utils import helper\nimport app.models\n",
+        "app/__init__.py": "",
+        "app/services/__init__.py": "",
+        "app/services/billing.py": "from ..models import Invoice\n",
+        "app/utils.py": "from app.models import Invoice\n\ndef helper():\n    return Invoice\n",
+        "app/models.py": "class Invoice:\n    pass\n",
+        "web/package.json": json.dumps({"name": "@acme/web"}),
+        "web/src/index.ts": (
+            "import { api } from './lib/api'\n"
+            "import Button from '@/components/Button'\n"
+            "import { shared } from '@acme/shared/util'\n"
+            "import React from 'react'\n"
+        ),
+        "web/src/lib/api.ts": "export const api = 1\n",
+        "web/src/components/Button.tsx": "export default function Button() { return null }\n",
+        "shared/package.json": json.dumps({"name": "@acme/shared"}),
+        "shared/src/util.ts": "export const shared = 1\n",
+    }
+    for rel, content in files.items():
+        write(tmp_path, rel, content)
+    return tmp_path, list(files)
+
+
+def test_import_graph_resolves_python_imports(graph_project):
+    root, sources = graph_project
+    graph = ImportGraph(root, sources)
+    assert graph._expand("app/main.py") == {
+        "app/services/__init__.py",
+        "app/services/billing.py",
+        "app/utils.py",
+        "app/models.py",
+    }
+    assert graph._expand("app/services/billing.py") == {"app/models.py"}
+
+
+def test_import_graph_resolves_relative_alias_and_workspace_imports(graph_project):
+    root, sources = graph_project
+    graph = ImportGraph(root, sources)
+    assert graph._expand("web/src/index.ts") == {
+        "web/src/lib/api.ts",
+        "web/src/components/Button.tsx",
+        "shared/src/util.ts",
+    }
+
+
+def test_import_graph_ranks_shared_dependencies_first(graph_project):
+    root, sources = graph_project
+    graph = ImportGraph(root, sources)
+    core = graph.core_files([root / "app/main.py"], limit=2)
+    assert core[0] == root / "app/models.py"  # 被 main、billing、utils 共同依赖
+    assert root / "app/main.py" not in core
+
+
+# ---------- ProjectIndex ----------
+
+
+def test_concurrent_index_saves_keep_every_writers_entries(tmp_path):
+    project = tmp_path / "project"
+    write(project, "src/a.py", "x")
+    index_path = tmp_path / "index" / "project.json"
+    rounds = 15
+    errors: list[BaseException] = []
+
+    def writer(name: str) -> None:
+        try:
+            for round_ in range(rounds):
+                index = ProjectIndex(project, DEFAULT_IGNORE, index_path)
+                index.memo(f"{name}-{round_}", 3, lambda: round_)
+                index.save()
+        except BaseException as exc:  # noqa: BLE001
+            errors.append(exc)
+
+    threads = [threading.Thread(target=writer, args=(name,)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    memos = json.loads(index_path.read_text(encoding="utf-8"))["memos"]
+    assert set(memos) == {f"{name}-{round_}" for name in ("a", "b") for round_ in range(rounds)}
+    assert [path.name for path in index_path.parent.iterdir()] == ["project.json"]  # 没有残留的临时文件
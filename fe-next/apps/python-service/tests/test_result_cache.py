@@ -0,0 +1,22 @@
+from vibe.result_cache import normalize_text, result_cache_key
+
+
+def test_normalize_text_folds_width_whitespace_and_case():
+    assert normalize_text("  ＡＢＣ\t新品\n\n优惠！ ") == "abc 新品 优惠!"
+
+
+def test_key_ignores_cosmetic_text_differences():
+    assert result_cache_key("m", "Hello  World", []) == result_cache_key("m", "hello world\n", [])
+    assert result_cache_key("m", "限时折扣１００元", []) == result_cache_key("m", "限时折扣100元", [])
+
+
+def test_key_ignores_image_order():
+    assert result_cache_key("m", "t", ["b", "a"]) == result_cache_key("m", "t", ["a", "b"])
+
+
+def test_key_distinguishes_model_text_and_images():
+    base = result_cache_key("flash", "t", ["a"])
+    assert base != result_cache_key("plus", "t", ["a"])
+    assert base != result_cache_key("flash", "t2", ["a"])
+    assert base != result_cache_key("flash", "t", ["a", "b"])
+    assert base != result_cache_key("flash", "t", [])
@@ -0,0 +1,135 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from vibe import sentiment
+from vibe.metrics import registry
+from vibe.upstream import TokenBucket, UpstreamError, UpstreamGovernor
+
+ANALYSIS = {
+    "summary": "帖子强调品牌优惠",
+    "sentiment_score": 8,
+    "sentiment_keywords": ["优惠"],
+    "user_persona": "学生党",
+    "pain_points": [],
+    "gain_points": ["限时折扣"],
+    "marketing_suspicion": "中",
+    "verdict": "买入",
+}
+
+
+def fake_response(text: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        status_code=200,
+        output=SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=[{"text": text}]))]),
+        usage=SimpleNamespace(input_tokens=10, output_tokens=5),
+    )
+
+
+class FakeConversation:
+    """替代 dashscope.AioMultiModalConversation：每次调用在事件循环上等待一段时间，并记录同时在途的调用数。"""
+
+    def __init__(self, delay: float = 0.05) -> None:
+        self.delay = delay
+        self.inflight = 0
+        self.peak = 0
+        self.calls = 0
+
+    async def call(self, **kwargs):
+        self.calls += 1
+        payload = json.dumps(ANALYSIS, ensure_ascii=False)
+
+        async def chunks():
+            self.inflight += 1
+            self.peak = max(self.peak, self.inflight)
+            try:
+                await asyncio.sleep(self.delay)
+                yield fake_response(payload[: len(payload) // 2])
+                await asyncio.sleep(self.delay)
+                yield fake_response(payload[len(payload) // 2 :])
+            finally:
+                self.inflight -= 1
+
+        return chunks()
+
+
+@pytest.fixture
+def conversation(monkeypatch):
+    fake = FakeConversation()
+    monkeypatch.setattr(sentiment.dashscope, "AioMultiModalConversation", fake)
+    monkeypatch.setattr(sentiment, "dashscope_governor", UpstreamGovernor(bucket=TokenBucket(rate=0)))
+    return fake
+
+
+def test_concurrent_requests_stay_under_slot_limit_without_blocking_loop(conversation, monkeypatch):
+    limit = 3
+
+    async def scenario():
+        monkeypatch.setattr(sentiment, "_dashscope_slots", asyncio.Semaphore(limit))
+        ticks = 0
+        done = asyncio.Event()
+
+        async def ticker():
+            # 模型调用期间事件循环仍能持续调度其他协程
+            nonlocal ticks
+            while not done.is_set():
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        ticking = asyncio.ensure_future(ticker())
+        requests = [sentiment.SentimentRequest(text=f"并发帖子 {index}") for index in range(10)]
+        results = await asyncio.gather(*(sentiment.analyze_sentiment(request, None) for request in requests))
+        done.set()
+        await ticking
+        return results, ticks
+
+    results, ticks = asyncio.run(scenario())
+    assert [result.summary for result in results] == [ANALYSIS["summary"]] * 10
+    assert conversation.calls == 10
+    assert conversation.peak == limit
+    # 10 个请求按 3 个槽位分 4 批，每批约 0.1s；期间 ticker 应被调度数十次
+    assert ticks >= 20
+
+
+def model_calls(outcome: str) -> float:
+    return registry.get_sample_value("vibe_model_calls_total", {"model": "qwen3-vl-flash", "outcome": outcome}) or 0.0
+
+
+class RepairConversation:
+    """修复调用是非流式的：直接返回一个完整响应，并记录调用期间的在途数。"""
+
+    def __init__(self, response) -> None:
+        self.response = response
+        self.inflight = None
+
+    async def call(self, **kwargs):
+        self.inflight = registry.get_sample_value("vibe_model_inflight", {"model": "qwen3-vl-flash"})
+        return self.response
+
+
+@pytest.mark.parametrize("ok", [True, False])
+def test_repair_call_is_counted_in_model_metrics(monkeypatch, ok):
+    if ok:
+        response = fake_response(json.dumps(ANALYSIS, ensure_ascii=False))
+    else:
+        response = SimpleNamespace(status_code=400, code="InvalidParameter", message="bad request")
+    fake = RepairConversation(response)
+    monkeypatch.setattr(sentiment.dashscope, "AioMultiModalConversation", fake)
+    monkeypatch.setattr(sentiment, "dashscope_governor", UpstreamGovernor(bucket=TokenBucket(rate=0)))
+    before = {outcome: model_calls(outcome) for outcome in ("ok", "error")}
+
+    async def scenario():
+        monkeypatch.setattr(sentiment, "_dashscope_slots", asyncio.Semaphore(1))
+        return await sentiment._request_repair("{bad json", ValueError("Expecting value"))
+
+    if ok:
+        assert json.loads(asyncio.run(scenario())) == ANALYSIS
+    else:
+        with pytest.raises(UpstreamError):
+            asyncio.run(scenario())
+    assert fake.inflight >= 1  # 调用期间计入在途数
+    assert registry.get_sample_value("vibe_model_inflight", {"model": "qwen3-vl-flash"}) == 0
+    assert model_calls("ok") - before["ok"] == (1 if ok else 0)
+    assert model_calls("error") - before["error"] == (0 if ok else 1)
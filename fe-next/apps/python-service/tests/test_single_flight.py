@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from vibe.single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    async def scenario():
+        flight: SingleFlight[int] = SingleFlight()
+        calls = 0
+
+        async def fn():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return 42
+
+        results = await asyncio.gather(*(flight.do("k", fn) for _ in range(5)))
+        return results, calls, flight.stats()
+
+    results, calls, stats = asyncio.run(scenario())
+    assert results == [42] * 5
+    assert calls == 1
+    assert stats == {"leaders": 1, "followers": 4, "inflight": 0}
+
+
+def test_error_is_shared_with_every_waiter_and_not_cached():
+    async def scenario():
+        flight: SingleFlight[int] = SingleFlight()
+        calls = 0
+
+        async def failing():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream down")
+
+        results = await asyncio.gather(*(flight.do("k", failing) for _ in range(3)), return_exceptions=True)
+
+        async def ok():
+            return 1
+
+        # 失败结果不会留在在途表里，下一次调用重新执行
+        return results, calls, await flight.do("k", ok)
+
+    results, calls, retried = asyncio.run(scenario())
+    assert calls == 1
+    assert all(isinstance(result, ValueError) and str(result) == "upstream down" for result in results)
+    assert retried == 1
+
+
+def test_cancelled_caller_does_not_cancel_shared_call():
+    async def scenario():
+        flight: SingleFlight[str] = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.02)
+            return "done"
+
+        first = asyncio.ensure_future(flight.do("k", fn))
+        second = asyncio.ensure_future(flight.do("k", fn))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "done"
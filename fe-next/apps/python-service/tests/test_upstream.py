@@ -0,0 +1,149 @@
+import asyncio
+
+import pytest
+
+from vibe import upstream
+from vibe.upstream import CircuitBreaker, RetryBudget, TokenBucket, UpstreamError, UpstreamGovernor, UpstreamRejected
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(upstream.time, "monotonic", fake)
+    return fake
+
+
+def test_token_bucket_burst_then_queues_in_order(clock):
+    bucket = TokenBucket(rate=2, burst=2)
+    assert bucket.reserve(max_wait=5) == 0
+    assert bucket.reserve(max_wait=5) == 0
+    # 令牌耗尽后按顺序排队：第 3、4 个请求分别等待 0.5s、1s
+    assert bucket.reserve(max_wait=5) == pytest.approx(0.5)
+    assert bucket.reserve(max_wait=5) == pytest.approx(1.0)
+
+
+def test_token_bucket_rejects_when_wait_exceeds_limit_without_reserving(clock):
+    bucket = TokenBucket(rate=1, burst=1)
+    bucket.reserve(max_wait=0)
+    with pytest.raises(UpstreamRejected) as info:
+        bucket.reserve(max_wait=0.5)
+    assert info.value.status_code == 429
+    clock.now += 1
+    assert bucket.reserve(max_wait=0) == 0  # 被拒绝的请求没有占用令牌
+
+
+def test_token_bucket_refill_is_capped_at_burst(clock):
+    bucket = TokenBucket(rate=1, burst=2)
+    clock.now += 100
+    assert bucket.reserve(max_wait=5) == 0
+    assert bucket.reserve(max_wait=5) == 0
+    assert bucket.reserve(max_wait=5) == pytest.approx(1.0)
+
+
+def test_token_bucket_disabled():
+    assert TokenBucket(rate=0, burst=1).reserve(max_wait=0) == 0
+
+
+def test_retry_budget_is_bounded_by_deposits():
+    budget = RetryBudget(ratio=0.5, minimum=2)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()  # 0.5 个额度不够一次重试
+    budget.deposit()
+    assert budget.withdraw()
+    for _ in range(10):
+        budget.deposit()
+    assert budget.balance == 2  # 不超过上限
+
+
+def test_circuit_breaker_opens_after_threshold_and_allows_one_probe(clock):
+    breaker = CircuitBreaker(threshold=2, reset_after=10)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(UpstreamRejected) as info:
+        breaker.check()
+    assert info.value.status_code == 503
+
+    clock.now += 10
+    assert breaker.state == "half_open"
+    breaker.check()  # 放行一个探测请求
+    with pytest.raises(UpstreamRejected):
+        breaker.check()  # 探测在途时其余请求继续快速失败
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.check()
+
+
+def test_circuit_breaker_failed_probe_reopens(clock):
+    breaker = CircuitBreaker(threshold=1, reset_after=5)
+    breaker.record_failure()
+    clock.now += 5
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 4
+    assert breaker.state == "open"  # 重新开始计时
+
+
+def test_circuit_breaker_abandoned_probe_releases_slot(clock):
+    breaker = CircuitBreaker(threshold=1, reset_after=5)
+    breaker.record_failure()
+    clock.now += 5
+    breaker.check()
+    breaker.abandon()
+    breaker.check()  # 被取消的探测交还资格，下一个请求可以继续探测
+
+
+def _governor(breaker: CircuitBreaker) -> UpstreamGovernor:
+    return UpstreamGovernor(bucket=TokenBucket(rate=0), budget=RetryBudget(), breaker=breaker, max_attempts=0)
+
+
+async def _server_error():
+    raise UpstreamError(500, "boom")
+
+
+async def _bad_request():
+    raise UpstreamError(400, "bad request")
+
+
+async def _ok():
+    return "ok"
+
+
+def test_non_retryable_probe_failure_releases_probe_in_call():
+    async def scenario():
+        governor = _governor(CircuitBreaker(threshold=1, reset_after=0))
+        with pytest.raises(UpstreamRejected):
+            await governor.call(_server_error)  # 打开熔断；reset_after=0 时立即进入半开
+        with pytest.raises(UpstreamError):
+            await governor.call(_bad_request)  # 探测请求遇到 4xx：与上游健康无关
+        return await governor.call(_ok), governor.breaker.state
+
+    assert asyncio.run(scenario()) == ("ok", "closed")
+
+
+def test_non_retryable_probe_failure_releases_probe_in_slot():
+    async def scenario():
+        governor = _governor(CircuitBreaker(threshold=1, reset_after=0))
+        with pytest.raises(UpstreamRejected):
+            async with governor.slot():
+                await _server_error()
+        with pytest.raises(ValueError):
+            async with governor.slot():
+                raise ValueError("schema validation failed")
+        async with governor.slot():
+            pass
+        return governor.breaker.state
+
+    assert asyncio.run(scenario()) == "closed"
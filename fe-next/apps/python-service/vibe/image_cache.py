@@ -0,0 +1,396 @@
+import asyncio  # 事件循环上的调用把磁盘读取放到线程池
+import hashlib  # 计算内容哈希，作为去重与缓存的主键
+import os  # 读取缓存配置、原子替换磁盘文件
+import re  # 解析 Cache-Control 中的 max-age
+import tempfile  # 每次写盘使用独立的临时文件
+import threading  # 同步下载路径可能在线程池中调用，需要加锁
+import time  # 记录新鲜度截止时间
+from collections import OrderedDict  # 实现 LRU 淘汰顺序
+from dataclasses import dataclass  # 轻量数据载体
+from pathlib import Path  # 磁盘层路径操作
+from typing import Any, Dict, List, Mapping, Optional, Tuple  # 类型注解
+
+# 内容寻址的图片缓存：URL / base64 / 预处理变体只是指向内容哈希的索引，同一张图片在内存中只保留一份
+# 内存层按字节预算做 LRU 淘汰，可选的磁盘层按内容哈希保存二进制
+# 注意：URL / base64 / 变体索引只在内存中，进程重启后磁盘层只能通过内容哈希命中（本地文件先哈希再查）
+# 锁只保护内存中的索引与计数，磁盘读写都在锁外进行；事件循环上请使用 *_async 方法，读盘会放到线程池
+
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))  # 内存层字节预算
+IMAGE_CACHE_MAX_KEYS = int(os.getenv("IMAGE_CACHE_MAX_KEYS", "10000"))  # 各索引的条目上限
+IMAGE_CACHE_FRESH_SECONDS = float(os.getenv("IMAGE_CACHE_FRESH_SECONDS", "300"))  # 无 max-age 时的默认新鲜期
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR")  # 设置后启用磁盘层
+IMAGE_CACHE_DISK_MAX_BYTES = int(os.getenv("IMAGE_CACHE_DISK_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+@dataclass
+class CachedImage:
+    data: bytes  # 图片二进制（多个 URL 指向同一内容时共享同一个 bytes 对象）
+    media_type: str  # MIME
+    digest: str  # sha256 十六进制摘要
+
+
+@dataclass
+class _UrlRecord:
+    digest: str
+    media_type: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fresh_until: float  # 在此时间之前直接命中，不发起任何网络请求
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _freshness_seconds(headers: Mapping[str, str]) -> float:
+    cache_control = headers.get("Cache-Control", "").lower()
+    if "no-cache" in cache_control:
+        return 0.0  # 允许缓存内容，但每次都要重新验证
+    match = _MAX_AGE_RE.search(cache_control)
+    if match:
+        return float(match.group(1))
+    return IMAGE_CACHE_FRESH_SECONDS
+
+
+class ImageCache:
+    def __init__(
+        self,
+        max_bytes: int = IMAGE_CACHE_MAX_BYTES,
+        max_keys: int = IMAGE_CACHE_MAX_KEYS,
+        disk_dir: Optional[str] = IMAGE_CACHE_DIR,
+        disk_max_bytes: int = IMAGE_CACHE_DISK_MAX_BYTES,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.max_keys = max_keys
+        self.disk_dir = Path(disk_dir).expanduser() if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._blobs: "OrderedDict[str, bytes]" = OrderedDict()  # digest -> 内容，内存层
+        self._bytes = 0  # 内存层当前占用
+        self._urls: "OrderedDict[str, _UrlRecord]" = OrderedDict()  # URL -> 内容索引 + 验证器
+        self._base64: "OrderedDict[str, tuple[str, str]]" = OrderedDict()  # base64 文本摘要 -> (digest, MIME)
+        self._variants: "OrderedDict[str, tuple[str, str]]" = OrderedDict()  # 原图 digest + 处理参数 -> (digest, MIME)
+        self._disk_files: "Optional[OrderedDict[str, int]]" = None  # digest -> 文件大小，按访问顺序排列；首次用到磁盘层时扫描一次
+        self._disk_bytes = 0  # 磁盘层当前占用，随写入/删除增减，不再反复遍历目录
+        self._counters: Dict[str, int] = {
+            "url_hits": 0,  # 新鲜期内直接命中
+            "url_revalidated": 0,  # 304 重新验证后命中
+            "url_misses": 0,  # 需要完整下载
+            "base64_hits": 0,
+            "base64_misses": 0,
+            "variant_hits": 0,  # 预处理（缩放/重压缩）结果命中
+            "variant_misses": 0,
+            "dedup_hits": 0,  # 不同 key 命中了已有内容，未产生新的内存占用
+            "disk_hits": 0,
+            "evictions": 0,
+        }
+
+    # ---------- 内容层 ----------
+
+    def _disk_path(self, digest: str) -> Optional[Path]:
+        if self.disk_dir is None:
+            return None
+        return self.disk_dir / digest[:2] / digest
+
+    def _remember_blob(self, digest: str, data: bytes) -> bytes:
+        existing = self._blobs.get(digest)
+        if existing is not None:
+            self._blobs.move_to_end(digest)
+            self._counters["dedup_hits"] += 1
+            return existing  # 复用已有对象，避免同一内容在内存中出现多份
+        if len(data) <= self.max_bytes:
+            self._blobs[digest] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._blobs.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._counters["evictions"] += 1
+        return data
+
+    def _memory_blob(self, digest: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._blobs.get(digest)
+            if data is not None:
+                self._blobs.move_to_end(digest)
+            return data
+
+    def _scan_disk(self) -> None:
+        # 进程启动后第一次用到磁盘层时统计已有文件（锁外遍历），之后只在内存中维护大小与访问顺序
+        if self._disk_files is not None:
+            return
+        found: List[Tuple[float, str, int]] = []
+        for path in self.disk_dir.glob("*/*"):
+            if path.name.startswith("."):
+                continue  # 其他进程写到一半的临时文件
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            found.append((stat.st_atime, path.name, stat.st_size))
+        found.sort()
+        with self._lock:
+            if self._disk_files is None:
+                self._disk_files = OrderedDict((name, size) for _, name, size in found)
+                self._disk_bytes = sum(size for _, _, size in found)
+
+    def _read_disk(self, digest: str) -> Optional[bytes]:
+        path = self._disk_path(digest)
+        if path is None:
+            return None
+        self._scan_disk()
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            with self._lock:
+                self._forget_disk(digest)  # 已被淘汰或被其他进程清理
+            return None
+        with self._lock:
+            if digest in self._disk_files:
+                self._disk_files.move_to_end(digest)
+            else:  # 同一目录下其他进程写入的文件
+                self._disk_files[digest] = len(data)
+                self._disk_bytes += len(data)
+            self._counters["disk_hits"] += 1
+            return self._remember_blob(digest, data)  # 提升回内存层
+
+    def _forget_disk(self, digest: str) -> None:
+        size = self._disk_files.pop(digest, None) if self._disk_files is not None else None
+        if size is not None:
+            self._disk_bytes -= size
+
+    def _write_disk(self, digest: str, data: bytes) -> None:
+        path = self._disk_path(digest)
+        if path is None:
+            return
+        self._scan_disk()
+        with self._lock:
+            if digest in self._disk_files:
+                self._disk_files.move_to_end(digest)
+                return
+            # 先登记再写盘，并发写入同一内容时只有一个线程真正落盘
+            self._disk_files[digest] = len(data)
+            self._disk_bytes += len(data)
+            trimmed = self._trim_disk()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{digest}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as fh:
+                    fh.write(data)
+                os.replace(tmp, path)  # 原子落盘，避免并发读到半个文件
+            except BaseException:
+                Path(tmp).unlink(missing_ok=True)
+                raise
+        except BaseException:
+            with self._lock:
+                self._forget_disk(digest)
+            raise
+        finally:
+            for old in trimmed:
+                self._disk_path(old).unlink(missing_ok=True)
+
+    def _trim_disk(self) -> List[str]:
+        # 持锁时只挑出要删除的文件，实际删除在锁外进行
+        trimmed: List[str] = []
+        if self._disk_bytes <= self.disk_max_bytes:
+            return trimmed
+        while self._disk_files and self._disk_bytes > self.disk_max_bytes * 0.9:
+            digest, size = self._disk_files.popitem(last=False)
+            self._disk_bytes -= size
+            trimmed.append(digest)
+        return trimmed
+
+    def _load_blob(self, digest: str) -> Optional[bytes]:
+        data = self._memory_blob(digest)
+        if data is None:
+            data = self._read_disk(digest)
+        return data
+
+    async def _load_blob_async(self, digest: str) -> Optional[bytes]:
+        data = self._memory_blob(digest)
+        if data is None and self.disk_dir is not None:
+            data = await asyncio.to_thread(self._read_disk, digest)  # 只有内存未命中才读盘
+        return data
+
+    def _store(self, data: bytes, digest: Optional[str] = None) -> CachedImage:
+        digest = digest or content_digest(data)
+        with self._lock:
+            shared = self._remember_blob(digest, data)
+        self._write_disk(digest, data)
+        return CachedImage(data=shared, media_type="", digest=digest)
+
+    def _bound(self, index: OrderedDict) -> None:
+        while len(index) > self.max_keys:
+            index.popitem(last=False)
+
+    def get_blob(self, digest: str) -> Optional[bytes]:
+        """按内容哈希取已缓存的二进制（本地文件先哈希再查，命中时无需再读入一份）。"""
+        return self._load_blob(digest)
+
+    def store_blob(self, data: bytes, digest: Optional[str] = None) -> CachedImage:
+        return self._store(data, digest)
+
+    # ---------- URL 索引 ----------
+
+    def _fresh_record(self, url: str) -> Optional[_UrlRecord]:
+        with self._lock:
+            record = self._urls.get(url)
+            if record is None or record.fresh_until < time.time():
+                return None
+            return record
+
+    def _url_hit(self, url: str, record: Optional[_UrlRecord], data: Optional[bytes]) -> Optional[CachedImage]:
+        if record is None or data is None:
+            return None
+        with self._lock:
+            if url in self._urls:
+                self._urls.move_to_end(url)
+            self._counters["url_hits"] += 1
+        return CachedImage(data=data, media_type=record.media_type, digest=record.digest)
+
+    def get_fresh(self, url: str) -> Optional[CachedImage]:
+        """新鲜期内直接返回缓存内容，调用方无需发起网络请求。"""
+        record = self._fresh_record(url)
+        return self._url_hit(url, record, self._load_blob(record.digest) if record else None)
+
+    async def get_fresh_async(self, url: str) -> Optional[CachedImage]:
+        record = self._fresh_record(url)
+        return self._url_hit(url, record, await self._load_blob_async(record.digest) if record else None)
+
+    def validators(self, url: str) -> Dict[str, str]:
+        """返回条件请求头（If-None-Match / If-Modified-Since），无可用缓存时为空。"""
+        with self._lock:
+            record = self._urls.get(url)
+            # 只查内存中的记录：内容若恰好被淘汰，304 之后会退回完整下载
+            if record is None or not (
+                record.digest in self._blobs or (self._disk_files is not None and record.digest in self._disk_files)
+            ):
+                return {}
+            headers: Dict[str, str] = {}
+            if record.etag:
+                headers["If-None-Match"] = record.etag
+            if record.last_modified:
+                headers["If-Modified-Since"] = record.last_modified
+            return headers
+
+    def _refresh(
+        self, url: str, record: Optional[_UrlRecord], data: Optional[bytes], headers: Mapping[str, str]
+    ) -> Optional[CachedImage]:
+        if record is None or data is None:
+            return None
+        with self._lock:
+            record.fresh_until = time.time() + _freshness_seconds(headers)
+            record.etag = headers.get("ETag", record.etag)
+            record.last_modified = headers.get("Last-Modified", record.last_modified)
+            if url in self._urls:
+                self._urls.move_to_end(url)
+            self._counters["url_revalidated"] += 1
+        return CachedImage(data=data, media_type=record.media_type, digest=record.digest)
+
+    def revalidated(self, url: str, headers: Mapping[str, str]) -> Optional[CachedImage]:
+        """服务器返回 304 时调用：刷新新鲜期并返回缓存内容。"""
+        with self._lock:
+            record = self._urls.get(url)
+        return self._refresh(url, record, self._load_blob(record.digest) if record else None, headers)
+
+    async def revalidated_async(self, url: str, headers: Mapping[str, str]) -> Optional[CachedImage]:
+        with self._lock:
+            record = self._urls.get(url)
+        return self._refresh(url, record, await self._load_blob_async(record.digest) if record else None, headers)
+
+    def store_url(self, url: str, data: bytes, media_type: str, headers: Mapping[str, str]) -> CachedImage:
+        cached = self._store(data)
+        cached.media_type = media_type
+        with self._lock:
+            self._counters["url_misses"] += 1
+            if "no-store" not in headers.get("Cache-Control", "").lower():
+                self._urls[url] = _UrlRecord(
+                    digest=cached.digest,
+                    media_type=media_type,
+                    etag=headers.get("ETag"),
+                    last_modified=headers.get("Last-Modified"),
+                    fresh_until=time.time() + _freshness_seconds(headers),
+                )
+                self._urls.move_to_end(url)
+                self._bound(self._urls)
+        return cached
+
+    # ---------- base64 / 变体索引 ----------
+
+    def _entry(self, index: OrderedDict, key: str) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            return index.get(key)
+
+    def _indexed_hit(
+        self, index: OrderedDict, key: str, entry: Optional[Tuple[str, str]], data: Optional[bytes], counter: str
+    ) -> Optional[CachedImage]:
+        with self._lock:
+            if entry is None or data is None:
+                self._counters[f"{counter}_misses"] += 1
+                return None
+            if key in index:
+                index.move_to_end(key)
+            self._counters[f"{counter}_hits"] += 1
+        return CachedImage(data=data, media_type=entry[1], digest=entry[0])
+
+    def _get_indexed(self, index: OrderedDict, key: str, counter: str) -> Optional[CachedImage]:
+        entry = self._entry(index, key)
+        return self._indexed_hit(index, key, entry, self._load_blob(entry[0]) if entry else None, counter)
+
+    async def _get_indexed_async(self, index: OrderedDict, key: str, counter: str) -> Optional[CachedImage]:
+        entry = self._entry(index, key)
+        data = await self._load_blob_async(entry[0]) if entry else None
+        return self._indexed_hit(index, key, entry, data, counter)
+
+    def _store_indexed(self, index: OrderedDict, key: str, data: bytes, media_type: str) -> CachedImage:
+        cached = self._store(data)
+        cached.media_type = media_type
+        with self._lock:
+            index[key] = (cached.digest, media_type)
+            index.move_to_end(key)
+            self._bound(index)
+        return cached
+
+    def get_base64(self, key: str) -> Optional[CachedImage]:
+        return self._get_indexed(self._base64, key, "base64")
+
+    def store_base64(self, key: str, data: bytes, media_type: str) -> CachedImage:
+        return self._store_indexed(self._base64, key, data, media_type)
+
+    def get_variant(self, key: str) -> Optional[CachedImage]:
+        return self._get_indexed(self._variants, key, "variant")
+
+    async def get_variant_async(self, key: str) -> Optional[CachedImage]:
+        return await self._get_indexed_async(self._variants, key, "variant")
+
+    def store_variant(self, key: str, data: bytes, media_type: str) -> CachedImage:
+        return self._store_indexed(self._variants, key, data, media_type)
+
+    # ---------- 指标 ----------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            lookups = counters["url_hits"] + counters["url_revalidated"] + counters["url_misses"]
+            lookups += counters["base64_hits"] + counters["base64_misses"]
+            lookups += counters["variant_hits"] + counters["variant_misses"]
+            hits = counters["url_hits"] + counters["url_revalidated"]
+            hits += counters["base64_hits"] + counters["variant_hits"]
+            return {
+                **counters,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_bytes": self._bytes,
+                "memory_budget_bytes": self.max_bytes,
+                "memory_entries": len(self._blobs),
+                "url_entries": len(self._urls),
+                "base64_entries": len(self._base64),
+                "variant_entries": len(self._variants),
+                "disk_enabled": self.disk_dir is not None,
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+# 进程内共享的缓存实例，同步与异步加载路径共用
+image_cache = ImageCache()
@@ -0,0 +1,156 @@
+import asyncio  # 并发调度与整体截止时间
+import os  # 读取连接池/超时等部署配置
+import weakref  # host 槽位只在有下载进行时保留
+from dataclasses import dataclass  # 轻量数据载体
+from typing import Dict, List, Optional, Sequence, Tuple, Union  # 类型注解
+from urllib.parse import urlsplit  # 解析 URL 中的 host，用于按域名限流
+
+import httpx  # 支持连接池与 keep-alive 的异步 HTTP 客户端
+
+from .image_cache import image_cache  # 内容寻址缓存，重复图片不再重复下载
+from .image_utils import (  # 复用同步版本的 MIME 推断、大小上限与本地读取
+    IMAGE_MAX_BYTES,
+    ImageTooLargeError,
+    _guess_media_type,
+    check_declared_size,
+    load_local_image,
+)
+from .metrics import stage_timer  # 下载/本地读取耗时
+
+# 异步图片加载器：所有下载共享一个 keep-alive 连接池并发进行，按 host 限制并发，整体设置截止时间
+
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "15"))  # 单张图片的网络超时（秒）
+IMAGE_FETCH_DEADLINE = float(os.getenv("IMAGE_FETCH_DEADLINE", "30"))  # 一次请求内所有图片的整体截止时间（秒）
+IMAGE_FETCH_MAX_CONNECTIONS = int(os.getenv("IMAGE_FETCH_MAX_CONNECTIONS", "64"))  # 连接池总连接数
+IMAGE_FETCH_PER_HOST = int(os.getenv("IMAGE_FETCH_PER_HOST", "6"))  # 同一 host 的并发下载数
+
+
+@dataclass
+class LoadedImage:
+    data: bytes  # 图片二进制
+    media_type: str  # MIME，如 image/png
+    source: str  # 原始来源（URL 或本地路径）
+    digest: str  # 内容 sha256，用于去重与结果缓存
+
+
+class ImageFetchError(Exception):
+    """图片下载失败；非 2xx 响应的消息格式与 requests 的 raise_for_status 保持一致。"""
+
+
+def _is_url(source: str) -> bool:
+    return source.startswith("http://") or source.startswith("https://")
+
+
+class AsyncImageLoader:
+    def __init__(
+        self,
+        timeout: float = IMAGE_FETCH_TIMEOUT,
+        deadline: float = IMAGE_FETCH_DEADLINE,
+        max_connections: int = IMAGE_FETCH_MAX_CONNECTIONS,
+        per_host: int = IMAGE_FETCH_PER_HOST,
+        max_bytes: int = IMAGE_MAX_BYTES,
+    ) -> None:
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.max_bytes = max_bytes
+        self._client: Optional[httpx.AsyncClient] = None  # 首次使用时再创建，避免在导入阶段绑定事件循环
+        # host -> 并发槽位；弱引用保存，没有在途下载的 host 自动移除，不会随访问过的域名无限增长
+        self._host_slots: "weakref.WeakValueDictionary[str, asyncio.Semaphore]" = weakref.WeakValueDictionary()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,  # 与 requests 默认行为一致，CDN 常见 30x 跳转
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _slot_for(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.per_host)
+        return slot
+
+    async def _read_body(self, url: str, headers: Dict[str, str]) -> Tuple[httpx.Response, bytes]:
+        # 流式读取正文：先看 Content-Length，再边读边累计，超过上限立即断开连接
+        async with stage_timer("image_loader", "download"), self.client.stream("GET", url, headers=headers) as resp:
+            if resp.status_code == 304 or resp.is_error:
+                return resp, b""
+            check_declared_size(resp.headers.get("Content-Length"), self.max_bytes)
+            parts = []
+            total = 0
+            async for chunk in resp.aiter_bytes():
+                total += len(chunk)
+                if total > self.max_bytes:
+                    raise ImageTooLargeError(limit=self.max_bytes)
+                parts.append(chunk)
+        return resp, b"".join(parts)  # 唯一一次拼接，之后直接交给缓存与 BinaryContent，不再复制
+
+    async def _fetch_url(self, url: str) -> LoadedImage:
+        cached = await image_cache.get_fresh_async(url)  # 新鲜期内直接命中，不占用连接
+        if cached is not None:
+            return LoadedImage(data=cached.data, media_type=cached.media_type, source=url, digest=cached.digest)
+        async with self._slot_for(url):
+            resp, data = await self._read_body(url, image_cache.validators(url))
+            if resp.status_code == 304:
+                cached = await image_cache.revalidated_async(url, resp.headers)
+                if cached is not None:
+                    return LoadedImage(data=cached.data, media_type=cached.media_type, source=url, digest=cached.digest)
+                resp, data = await self._read_body(url, {})  # 缓存恰好被淘汰，退回完整下载
+        if resp.is_error:
+            kind = "Client" if resp.status_code < 500 else "Server"
+            raise ImageFetchError(f"{resp.status_code} {kind} Error: {resp.reason_phrase} for url: {url}")
+        content_type = resp.headers.get("Content-Type", "")
+        media_type = content_type.split(";")[0].strip() if content_type else _guess_media_type(url)
+        # 计算哈希与可能的落盘放到线程池，避免大图阻塞事件循环
+        cached = await asyncio.to_thread(image_cache.store_url, url, data, media_type or "image/jpeg", resp.headers)
+        return LoadedImage(data=cached.data, media_type=cached.media_type, source=url, digest=cached.digest)
+
+    async def load(self, source: str) -> LoadedImage:
+        if _is_url(source):
+            return await self._fetch_url(source)
+        # 本地文件在线程池中内存映射、哈希，命中缓存时不再读入新的副本
+        with stage_timer("image_loader", "read_local"):
+            cached = await asyncio.to_thread(load_local_image, source)
+        return LoadedImage(data=cached.data, media_type=cached.media_type, source=source, digest=cached.digest)
+
+    async def load_many(self, sources: Sequence[str]) -> List[Union[LoadedImage, Exception]]:
+        """
+        并发加载全部图片，结果与 sources 一一对应；单张失败或超过整体截止时间时对应位置为异常对象。
+        """
+        if not sources:
+            return []
+        tasks = [asyncio.ensure_future(self.load(src)) for src in sources]
+        _, pending = await asyncio.wait(tasks, timeout=self.deadline)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)  # 等待取消完成，避免遗留悬挂任务
+
+        results: List[Union[LoadedImage, Exception]] = []
+        for task in tasks:
+            if task in pending:
+                results.append(TimeoutError(f"超过整体截止时间 {self.deadline:g}s"))
+            elif (exc := task.exception()) is not None:
+                # httpx 的连接类异常常常没有消息文本，补上异常类型名便于排查
+                results.append(exc if str(exc) else ImageFetchError(type(exc).__name__))
+            else:
+                results.append(task.result())
+        return results
+
+
+# 进程内共享的加载器实例，所有请求复用同一个连接池
+image_loader = AsyncImageLoader()
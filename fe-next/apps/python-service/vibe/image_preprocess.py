@@ -0,0 +1,116 @@
+import asyncio  # 把 CPU 密集的图片处理交给进程池并在事件循环上等待
+import logging  # 结构化日志
+import multiprocessing  # 进程池使用 spawn 上下文，避免在多线程进程中 fork
+import os  # 读取预处理配置
+from concurrent.futures import ProcessPoolExecutor  # 图片缩放/编码放到独立进程，绕开 GIL
+from io import BytesIO  # 内存中的图片读写
+from typing import Dict, Optional, Tuple  # 类型注解
+
+from .image_cache import image_cache  # 处理后的变体按 (原图哈希, 参数) 缓存
+
+try:  # Pillow 为可选依赖：pip install "python-service[image]"
+    from PIL import Image, ImageOps
+except ImportError:  # 未安装时预处理阶段自动跳过
+    Image = None
+    ImageOps = None
+
+# 图片预处理：发送给视觉模型前按最长边缩放、重新压缩并去掉 EXIF 等元数据
+# 手机截图动辄 5-10 MB，base64 后再膨胀 33%，缩到模型实际使用的分辨率可以显著降低上传耗时与 token 成本
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PREPROCESS_ENABLED = os.getenv("IMAGE_PREPROCESS_ENABLED", "0") == "1"  # 部署级默认开关，请求可覆盖
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1568"))  # 最长边像素上限
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))  # 重新压缩的 JPEG 质量
+IMAGE_PREPROCESS_WORKERS = int(os.getenv("IMAGE_PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+def _preprocess_sync(data: bytes, max_edge: int, quality: int) -> Optional[Tuple[bytes, str]]:
+    """
+    在子进程中执行：缩放 + 重新编码为 JPEG；返回 None 表示保留原图（动图、或处理后反而更大）。
+    """
+    with Image.open(BytesIO(data)) as img:
+        if getattr(img, "n_frames", 1) > 1:
+            return None  # 动图重新编码会丢帧，保持原样
+        img = ImageOps.exif_transpose(img)  # 先按 EXIF 方向摆正，随后重新编码时元数据被丢弃
+        img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        if img.mode in ("RGBA", "LA", "P"):
+            # JPEG 不支持透明通道：铺白底合成，避免透明区域变黑
+            rgba = img.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        out = BytesIO()
+        img.save(out, format="JPEG", quality=quality, optimize=True)  # 不传 exif/icc_profile，即剥离元数据
+    processed = out.getvalue()
+    if len(processed) >= len(data):
+        return None
+    return processed, "image/jpeg"
+
+
+class ImagePreprocessor:
+    def __init__(
+        self,
+        max_edge: int = IMAGE_MAX_EDGE,
+        quality: int = IMAGE_JPEG_QUALITY,
+        workers: int = IMAGE_PREPROCESS_WORKERS,
+    ) -> None:
+        self.max_edge = max_edge
+        self.quality = quality
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None  # 首次使用时再启动子进程
+        self._inflight: Dict[str, "asyncio.Future[Tuple[bytes, str]]"] = {}  # 同一变体正在处理中时复用结果
+
+    @property
+    def available(self) -> bool:
+        return Image is not None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, variant_key: str, data: bytes, media_type: str) -> Tuple[bytes, str]:
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._pool(), _preprocess_sync, data, self.max_edge, self.quality)
+        except Exception as exc:  # noqa: BLE001 - 无法识别的格式等直接用原图，不影响分析
+            logger.warning("图片预处理失败，使用原图", extra={"error": str(exc)})
+            result = None
+        processed, processed_type = result if result is not None else (data, media_type)
+        # 保留原图的情况也记下来，下次同一张图片不再进入进程池
+        cached = await asyncio.to_thread(image_cache.store_variant, variant_key, processed, processed_type)
+        return cached.data, cached.media_type
+
+    async def process(self, data: bytes, media_type: str, digest: str) -> Tuple[bytes, str]:
+        """返回发送给模型的 (二进制, MIME)；未安装 Pillow 或处理失败时原样返回。"""
+        if not self.available:
+            return data, media_type
+        variant_key = f"{digest}:{self.max_edge}:{self.quality}"
+        cached = await image_cache.get_variant_async(variant_key)
+        if cached is not None:
+            return cached.data, cached.media_type
+
+        task = self._inflight.get(variant_key)
+        if task is None:
+            task = asyncio.ensure_future(self._run(variant_key, data, media_type))
+            self._inflight[variant_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(variant_key, None))
+        return await asyncio.shield(task)  # 某个请求被取消不影响其他等待同一结果的请求
+
+
+if Image is None and IMAGE_PREPROCESS_ENABLED:
+    logger.warning("已开启 IMAGE_PREPROCESS_ENABLED 但未安装 Pillow，图片预处理将被跳过")
+
+# 进程内共享的预处理器
+image_preprocessor = ImagePreprocessor()
@@ -1,52 +1,145 @@
 import base64  # 提供标准的 Base64 编解码
+import binascii  # 直接对 memoryview 做 base64 解码，避免切片复制
 import mimetypes  # 根据文件名/后缀推断 MIME 类型
+import mmap  # 本地文件内存映射：先哈希查缓存，命中时不必把文件读进堆内存
+import os  # 读取大小上限配置
 from pathlib import Path  # 更安全的跨平台路径操作
-from typing import Tuple  # 类型注解：返回 (bytes, str)
+from typing import Iterable, Optional, Tuple  # 类型注解：返回 (bytes, str)
 
 import requests  # 轻量 HTTP 客户端，用于下载图片
 
+from .image_cache import CachedImage, content_digest, image_cache  # 内容寻址缓存，重复图片不再重复下载/解码
+from .metrics import stage_timer  # 下载与解码耗时
+
 # 统一的图片辅助函数：负责从本地或网络加载图片，并完成 Base64 编解码等工作
 
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))  # 单张图片大小上限（字节）
+_CHUNK_SIZE = 64 * 1024  # 流式读取的分块大小
+
+
+class ImageTooLargeError(ValueError):
+    """图片超过 IMAGE_MAX_BYTES；下载时一旦超限立即中止，不再继续读取。"""
+
+    def __init__(self, size: Optional[int] = None, limit: int = IMAGE_MAX_BYTES) -> None:
+        if size is None:
+            super().__init__(f"图片超过大小上限 {limit} 字节")
+        else:
+            super().__init__(f"图片过大（{size} 字节），上限 {limit} 字节")
+
 
 def _guess_media_type(name: str, fallback: str = "image/jpeg") -> str:
     media_type, _ = mimetypes.guess_type(name)  # 尝试根据文件名/扩展名推断 MIME（如 image/png）
     return media_type or fallback  # 若无法判断则退回默认值，保证后续逻辑可用
 
 
+def check_declared_size(content_length: Optional[str], limit: int = IMAGE_MAX_BYTES) -> None:
+    # 服务器声明了 Content-Length 时，在读取正文之前就拒绝超限的图片
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        raise ImageTooLargeError(int(content_length), limit)
+
+
+def read_capped(chunks: Iterable[bytes], limit: int = IMAGE_MAX_BYTES) -> bytes:
+    # 边读边累计，超过上限立即中止；最后一次 join 生成唯一的一份完整数据
+    parts = []
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+        if total > limit:
+            raise ImageTooLargeError(limit=limit)
+        parts.append(chunk)
+    return b"".join(parts)
+
+
+def load_local_image(source: str) -> CachedImage:
+    # 先展开 ~，再转为绝对路径
+    path = Path(source).expanduser().resolve()
+    if not path.is_file():  # 路径不存在或不是文件时直接失败
+        raise FileNotFoundError(f"找不到文件: {path}")
+    size = path.stat().st_size
+    if size > IMAGE_MAX_BYTES:  # 读取之前先按文件大小拦截
+        raise ImageTooLargeError(size)
+    media_type = _guess_media_type(path.name)  # 基于文件名推断 MIME
+    if size == 0:
+        return CachedImage(data=b"", media_type=media_type, digest=content_digest(b""))
+    with path.open("rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        digest = content_digest(mapped)  # 直接对映射区域哈希，不产生堆内存副本
+        data = image_cache.get_blob(digest)
+        if data is None:
+            data = image_cache.store_blob(mapped[:], digest).data  # 未命中时才复制出唯一一份
+    return CachedImage(data=data, media_type=media_type, digest=digest)
+
+
 def load_image_from_source(source: str) -> Tuple[bytes, str]:
     """
     支持 http(s) URL 和本地路径，返回 (二进制数据, media_type)。
     """
+    with stage_timer("image_utils", "load_image_from_source"):
+        return _load_image_from_source(source)
+
+
+def _load_image_from_source(source: str) -> Tuple[bytes, str]:
     # 如果是 URL，走网络下载分支
     if source.startswith("http://") or source.startswith("https://"):
-        resp = requests.get(source, timeout=15)  # 设置超时，避免挂起
-        resp.raise_for_status()  # 非 2xx 主动抛错，便于上层处理
-        content_type = resp.headers.get("Content-Type", "")  # 读取服务器返回的 MIME
-        media_type = content_type.split(";")[0].strip() if content_type else _guess_media_type(source)
-        return resp.content, media_type or "image/jpeg"  # 兜底 MIME，避免 None
+        cached = image_cache.get_fresh(source)  # 新鲜期内直接命中，不发起网络请求
+        if cached is not None:
+            return cached.data, cached.media_type
+        # 带上 ETag / Last-Modified 做条件请求，内容未变时服务器只回 304
+        headers = image_cache.validators(source)
+        resp = requests.get(source, timeout=15, headers=headers, stream=True)  # 设置超时，避免挂起；流式读取正文
+        if resp.status_code == 304:
+            resp.close()
+            cached = image_cache.revalidated(source, resp.headers)
+            if cached is not None:
+                return cached.data, cached.media_type
+            resp = requests.get(source, timeout=15, stream=True)  # 缓存恰好被淘汰，退回完整下载
+        with resp:
+            resp.raise_for_status()  # 非 2xx 主动抛错，便于上层处理
+            check_declared_size(resp.headers.get("Content-Length"))
+            data = read_capped(resp.iter_content(chunk_size=_CHUNK_SIZE))
+            content_type = resp.headers.get("Content-Type", "")  # 读取服务器返回的 MIME
+            media_type = content_type.split(";")[0].strip() if content_type else _guess_media_type(source)
+            cached = image_cache.store_url(source, data, media_type or "image/jpeg", resp.headers)  # 兜底 MIME，避免 None
+        return cached.data, cached.media_type
 
-    # 否则认为是本地路径：先展开 ~，再转为绝对路径
-    path = Path(source).expanduser().resolve()
-    if not path.is_file():  # 路径不存在或不是文件时直接失败
-        raise FileNotFoundError(f"找不到文件: {path}")
-    data = path.read_bytes()  # 直接读取二进制
-    media_type = _guess_media_type(path.name)  # 基于文件名推断 MIME
-    return data, media_type
+    # 否则认为是本地路径
+    cached = load_local_image(source)
+    return cached.data, cached.media_type
+
+
+def load_base64_image(data: str, default_media_type: str = "image/jpeg") -> CachedImage:
+    """
+    支持 data URI（data:image/png;base64,...）或纯 base64 字符串，返回带内容哈希的结果。
+    """
+    encoded = data.encode("utf-8")  # 只编码一次：既用于缓存 key，也直接作为解码输入
+    is_data_uri = encoded.startswith(b"data:")
+    # 以 base64 文本的摘要为 key，重复提交的同一张图片直接复用已解码的内容
+    key = content_digest(encoded)
+    cached = image_cache.get_base64(key)
+    if cached is not None:
+        media_type = cached.media_type if is_data_uri else default_media_type
+        return CachedImage(data=cached.data, media_type=media_type, digest=cached.digest)
+
+    media_type = default_media_type
+    payload = memoryview(encoded)
+    # data URI 形式（内联包含 MIME 信息），形如 data:image/png;base64,xxxx
+    if is_data_uri:
+        comma = encoded.index(b",")  # 只找第一个逗号，防止正文里有逗号
+        media_type = encoded[5:comma].decode("utf-8").split(";")[0] or default_media_type
+        payload = payload[comma + 1 :]  # memoryview 切片不复制底层数据
+    # 解码前按长度估算原始大小（每 4 个字符对应 3 字节），超限直接拒绝
+    if len(payload) * 3 // 4 > IMAGE_MAX_BYTES:
+        raise ImageTooLargeError(len(payload) * 3 // 4)
+    with stage_timer("image_utils", "base64_decode"):
+        raw = binascii.a2b_base64(payload)  # 解码得到原始二进制
+    return image_cache.store_base64(key, raw, media_type)
 
 
 def decode_base64_image(data: str, default_media_type: str = "image/jpeg") -> Tuple[bytes, str]:
     """
     支持 data URI（data:image/png;base64,...）或纯 base64 字符串。
     """
-    # data URI 形式（内联包含 MIME 信息），形如 data:image/png;base64,xxxx
-    if data.startswith("data:"):
-        header, b64_data = data.split(",", 1)  # 仅切一次，防止正文里有逗号
-        media_type = header.split(";")[0].replace("data:", "") or default_media_type
-        raw = base64.b64decode(b64_data)  # 解码得到原始二进制
-        return raw, media_type
-    # 否则认为是纯 base64 字符串，使用默认 MIME
-    raw = base64.b64decode(data)
-    return raw, default_media_type
+    cached = load_base64_image(data, default_media_type)
+    return cached.data, cached.media_type
 
 
 def to_base64(data: bytes) -> str:
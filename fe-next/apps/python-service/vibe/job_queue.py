@@ -0,0 +1,346 @@
+import asyncio  # 后台 worker 与订阅等待
+import json  # 任务参数与结果序列化
+import logging  # 结构化日志
+import os  # 读取队列配置
+import sqlite3  # 本地持久化队列，服务重启后任务不丢失
+import threading  # 串行化同一连接上的读写
+import time  # 租约与过期时间
+import uuid  # 任务 ID
+from pathlib import Path  # 队列文件路径
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple  # 类型注解
+
+from .logging_setup import request_id_var  # 任务日志关联任务 ID
+from .settings import VIBE_DATA_DIR  # 队列文件的默认目录
+
+# 任务队列：提交后立即返回任务 ID，由服务内的后台 worker 池执行，客户端轮询或订阅结果
+# HTTP 连接不再与模型调用耗时绑定；任务存放在 SQLite 中，多个进程可共享同一个队列文件
+# worker 取任务时写入租约（lease），进程崩溃后租约过期，任务会被其他 worker 重新领取
+# 执行期间 worker 定期续租；每次领取生成新的租约令牌，租约被他人接管后旧 worker 的结果不会再写入
+
+SENTIMENT_JOB_DB = os.getenv("SENTIMENT_JOB_DB") or str(VIBE_DATA_DIR / "sentiment_jobs.sqlite3")
+SENTIMENT_JOB_WORKERS = int(os.getenv("SENTIMENT_JOB_WORKERS", "4"))  # 每个进程的后台 worker 数
+SENTIMENT_JOB_POLL_INTERVAL = float(os.getenv("SENTIMENT_JOB_POLL_INTERVAL", "0.5"))  # 空闲时检查新任务的间隔（秒）
+SENTIMENT_JOB_LEASE = float(os.getenv("SENTIMENT_JOB_LEASE", "300"))  # 单次执行的租约（秒），超时视为 worker 已失联
+SENTIMENT_JOB_MAX_ATTEMPTS = int(os.getenv("SENTIMENT_JOB_MAX_ATTEMPTS", "3"))  # 同一任务最多执行次数
+SENTIMENT_JOB_TTL = float(os.getenv("SENTIMENT_JOB_TTL", "86400"))  # 已结束任务的保留时长（秒）
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+class JobStore:
+    def __init__(self, path: str = SENTIMENT_JOB_DB, max_attempts: int = SENTIMENT_JOB_MAX_ATTEMPTS) -> None:
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # check_same_thread=False：连接由线程池中的不同线程复用，并发由 _lock 串行化
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL, "
+            "result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL, available_at REAL NOT NULL, lease_until REAL, "
+            "lease_token TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "lease_token" not in columns:  # 兼容旧版本创建的队列文件
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN lease_token TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_pending ON jobs (status, available_at)")
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, created_at, updated_at, available_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), now, now, now),
+            )
+        return job_id
+
+    def claim(self, lease: float) -> Optional[Tuple[str, str, Dict[str, Any], str]]:
+        """领取一个可执行的任务（排队中，或租约已过期的执行中任务）；返回 (id, kind, payload, 租约令牌)。"""
+        now = time.time()
+        token = uuid.uuid4().hex
+        with self._lock:
+            # BEGIN IMMEDIATE 先拿写锁，多个进程同时领取时不会拿到同一个任务
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = self._conn.execute(
+                        "SELECT id, kind, payload, attempts FROM jobs "
+                        "WHERE (status = 'queued' AND available_at <= ?) OR (status = 'running' AND lease_until < ?) "
+                        "ORDER BY available_at LIMIT 1",
+                        (now, now),
+                    ).fetchone()
+                    if row is None:
+                        self._conn.execute("COMMIT")
+                        return None
+                    job_id, kind, payload, attempts = row
+                    if attempts >= self.max_attempts:  # 反复执行到一半就失联的任务不再重试
+                        self._conn.execute(
+                            "UPDATE jobs SET status = 'failed', error = ?, updated_at = ?, lease_until = NULL, "
+                            "lease_token = NULL WHERE id = ?",
+                            (f"超过最大执行次数 {self.max_attempts}", now, job_id),
+                        )
+                        continue
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ?, lease_until = ?, "
+                        "lease_token = ? WHERE id = ?",
+                        (now, now + lease, token, job_id),
+                    )
+                    self._conn.execute("COMMIT")
+                    return job_id, kind, json.loads(payload), token
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # 以下写操作都要求租约令牌仍然匹配：租约过期后任务可能已被其他 worker 重新领取，
+    # 此时旧 worker 的写入被拒绝（返回 False），避免同一任务的结果被覆盖或重复执行后状态错乱
+
+    def renew(self, job_id: str, token: str, lease: float) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running' AND lease_token = ?",
+                (time.time() + lease, job_id, token),
+            )
+        return cursor.rowcount == 1
+
+    def _finish(self, job_id: str, token: str, status: str, result: Optional[str], error: Optional[str]) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ?, lease_until = NULL, "
+                "lease_token = NULL WHERE id = ? AND status = 'running' AND lease_token = ?",
+                (status, result, error, time.time(), job_id, token),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, token: str, result: Any) -> bool:
+        return self._finish(job_id, token, "succeeded", json.dumps(result, ensure_ascii=False), None)
+
+    def fail(self, job_id: str, token: str, error: str) -> bool:
+        return self._finish(job_id, token, "failed", None, error)
+
+    def requeue(
+        self, job_id: str, token: str, delay: float = 0.0, error: Optional[str] = None, count_attempt: bool = True
+    ) -> bool:
+        # 上游限流等可恢复的失败：延迟后重新排队；进程退出时放回的任务不计入执行次数
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, updated_at = ?, available_at = ?, lease_until = NULL, "
+                "lease_token = NULL, attempts = attempts - ? WHERE id = ? AND status = 'running' AND lease_token = ?",
+                (error, now, now + delay, 0 if count_attempt else 1, job_id, token),
+            )
+        return cursor.rowcount == 1
+
+    def attempts(self, job_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else 0
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, result, error, attempts, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "result": json.loads(row[3]) if row[3] is not None else None,
+            "error": row[4],
+            "attempts": row[5],
+            "created_at": row[6],
+            "updated_at": row[7],
+        }
+
+    def purge(self, ttl: float = SENTIMENT_JOB_TTL) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?", (time.time() - ttl,)
+            )
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+
+class JobQueue:
+    def __init__(
+        self,
+        store: Optional[JobStore] = None,
+        workers: int = SENTIMENT_JOB_WORKERS,
+        poll_interval: float = SENTIMENT_JOB_POLL_INTERVAL,
+        lease: float = SENTIMENT_JOB_LEASE,
+    ) -> None:
+        self._store = store  # 首次使用时再打开数据库文件
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self._handlers: Dict[str, JobHandler] = {}  # 任务类型 -> 处理函数
+        self._tasks: List["asyncio.Task[None]"] = []
+        self._wakeup: Optional[asyncio.Event] = None  # 有新任务提交时唤醒空闲 worker
+        self._changed: Dict[str, asyncio.Event] = {}  # 本进程内等待某个任务状态变化的订阅者
+        self._waiters: Dict[str, int] = {}  # 每个任务当前的等待者数量，最后一个离开时清理 _changed
+        self._last_purge = 0.0
+
+    @property
+    def store(self) -> JobStore:
+        if self._store is None:
+            self._store = JobStore()
+        return self._store
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self._handlers[kind] = handler
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()  # 正在执行的任务会被放回队列，重启后继续
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, kind: str, payload: Dict[str, Any]) -> str:
+        if kind not in self._handlers:
+            raise ValueError(f"未知的任务类型: {kind}")
+        job_id = await asyncio.to_thread(self.store.submit, kind, payload)
+        self.start()  # 未走 lifespan 时在首次提交时启动 worker
+        self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """长轮询：等到任务结束或超时，返回最新状态。"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in TERMINAL_STATUSES or remaining <= 0:
+                return job
+            await self._wait_changed(job_id, min(remaining, self.poll_interval))
+
+    async def subscribe(self, job_id: str):
+        """订阅任务状态：每次状态变化推送一条事件，任务结束后停止。"""
+        last = None
+        while True:
+            job = await self.get(job_id)
+            if job is None:
+                yield {"type": "error", "detail": "任务不存在"}
+                return
+            if (job["status"], job["attempts"]) != last:
+                last = (job["status"], job["attempts"])
+                yield {"type": job["status"], **job}
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            await self._wait_changed(job_id, self.poll_interval)
+
+    async def _wait_changed(self, job_id: str, timeout: float) -> None:
+        # 本进程执行的任务会直接唤醒等待者；其他进程执行的任务靠定时轮询发现
+        event = self._changed.setdefault(job_id, asyncio.Event())
+        self._waiters[job_id] = self._waiters.get(job_id, 0) + 1
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # 超时、取消或由其他进程完成的任务都不会触发 _notify，在这里回收，避免登记表无限增长
+            self._waiters[job_id] -= 1
+            if not self._waiters[job_id]:
+                del self._waiters[job_id]
+                if self._changed.get(job_id) is event:
+                    del self._changed[job_id]
+
+    def _notify(self, job_id: str) -> None:
+        event = self._changed.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def _worker(self) -> None:
+        while True:
+            self._wakeup.clear()
+            claimed = await asyncio.to_thread(self.store.claim, self.lease)
+            if claimed is None:
+                if time.monotonic() - self._last_purge > 600:  # 空闲时顺带清理过期的已结束任务
+                    self._last_purge = time.monotonic()
+                    await asyncio.to_thread(self.store.purge)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._process(*claimed)
+
+    async def _heartbeat(self, job_id: str, token: str) -> None:
+        # 任务执行期间每隔 1/3 租约续租一次，执行时间超过租约的任务不会被其他 worker 当作失联重新领取
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if not await asyncio.to_thread(self.store.renew, job_id, token, self.lease):
+                logger.warning("任务租约已被接管，停止续租", extra={"job_id": job_id})
+                return
+
+    async def _process(self, job_id: str, kind: str, payload: Dict[str, Any], token: str) -> None:
+        self._notify(job_id)  # 排队 -> 执行中
+        request_id_var.set(job_id)  # 任务执行期间的日志以任务 ID 作为请求 ID，便于串联
+        handler = self._handlers.get(kind)
+        heartbeat = asyncio.ensure_future(self._heartbeat(job_id, token))
+        try:
+            try:
+                if handler is None:
+                    raise ValueError(f"未知的任务类型: {kind}")
+                result = await handler(payload)
+            finally:
+                heartbeat.cancel()
+        except asyncio.CancelledError:
+            # 服务关闭：放回队列且不计次数，重启后由其他 worker 继续
+            await asyncio.shield(asyncio.to_thread(self.store.requeue, job_id, token, 0.0, None, False))
+            raise
+        except Exception as exc:  # noqa: BLE001 - 失败原因写入任务记录，供客户端查询
+            detail = getattr(exc, "detail", None) or str(exc) or type(exc).__name__
+            retry_after = getattr(exc, "retry_after", None)
+            attempts = await asyncio.to_thread(self.store.attempts, job_id)
+            if retry_after is not None and attempts < self.store.max_attempts:
+                # 上游限流/熔断：按 Retry-After 延迟后重新排队，而不是直接判定失败
+                written = await asyncio.to_thread(self.store.requeue, job_id, token, retry_after, detail)
+            else:
+                logger.warning("任务执行失败", extra={"job_id": job_id, "error": detail})
+                written = await asyncio.to_thread(self.store.fail, job_id, token, detail)
+        else:
+            if hasattr(result, "model_dump"):
+                result = result.model_dump(mode="json")
+            written = await asyncio.to_thread(self.store.complete, job_id, token, result)
+        if not written:
+            # 租约已过期并被其他 worker 领取：以新的执行为准，丢弃本次结果
+            logger.warning("任务租约已失效，丢弃本次执行结果", extra={"job_id": job_id})
+        self._notify(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers if self.running else 0,
+            "jobs": self.store.counts(),
+        }
+
+
+# 进程内共享实例：各路由注册自己的任务类型，lifespan 负责启动与停止 worker
+job_queue = JobQueue()
@@ -0,0 +1,57 @@
+import re  # 只定位影响括号配对的字符，其余文本整段跳过
+from typing import List, Optional  # 类型注解
+
+# 增量 JSON 提取：模型边输出边喂入，第一个括号配对完整的 JSON 对象出现时立即返回
+# 对象前后的说明文字、```json 代码块标记都会被忽略；字符串内的括号与转义引号不参与配对
+
+_SPECIAL = re.compile(r'[{}"\\]')
+
+
+class JsonObjectExtractor:
+    def __init__(self) -> None:
+        self._parts: List[str] = []  # 对象开始后收到的文本片段
+        self._depth = 0  # 当前括号深度
+        self._in_string = False  # 是否位于 JSON 字符串内
+        self._escape_next = False  # 上一片段以反斜杠结尾，下一个字符被转义
+        self.result: Optional[str] = None  # 完整对象的文本
+
+    def feed(self, text: str) -> Optional[str]:
+        """喂入新的文本片段；对象完整时返回对象文本，之后的输入不再处理。"""
+        if self.result is not None:
+            return self.result
+        start = 0 if self._depth else None  # 本片段中对象文本的起始位置
+        skip = 0 if self._escape_next else -1  # 被转义字符的位置
+        self._escape_next = False
+        for match in _SPECIAL.finditer(text):
+            pos = match.start()
+            if pos == skip:
+                continue
+            char = match.group()
+            if self._in_string:
+                if char == "\\":
+                    skip = pos + 1
+                    self._escape_next = skip == len(text)
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == "{":
+                if self._depth == 0:
+                    start = pos
+                self._depth += 1
+            elif char == "}" and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(text[start : pos + 1])
+                    self.result = "".join(self._parts)
+                    self._parts = []
+                    return self.result
+            elif char == '"' and self._depth:
+                self._in_string = True
+        if start is not None:
+            self._parts.append(text[start:])
+        return None
+
+
+def extract_json_object(text: str) -> Optional[str]:
+    # 一次性版本：返回文本中第一个完整的 JSON 对象，没有则返回 None
+    return JsonObjectExtractor().feed(text)
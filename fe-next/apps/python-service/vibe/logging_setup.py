@@ -0,0 +1,140 @@
+import atexit  # 进程退出前把队列里剩余的日志写完
+import contextvars  # 请求 ID 随协程上下文传递
+import copy  # 入队前复制日志记录，避免其他处理器看到被修改的记录
+import json  # 结构化日志输出
+import logging  # 标准日志体系
+import logging.handlers  # QueueHandler / QueueListener
+import os  # 读取日志配置
+import queue  # 日志记录在内存队列中交给后台线程写出
+import random  # 大字段日志采样
+import sys  # 输出到 stdout
+import time  # 请求耗时
+import uuid  # 生成请求 ID
+from typing import Any, Optional  # 类型注解
+
+from fastapi import Request  # 请求 ID 中间件
+
+# 结构化日志：每条记录输出为一行 JSON，带上请求 ID；事件循环里只把记录放进内存队列，
+# 真正的格式化与 stdout 写入由 QueueListener 的后台线程完成，不阻塞请求处理
+# 模型原始输出等大字段按比例采样并截断，避免高峰期日志量失控
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text（本地调试时更易读）
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.05"))  # 大字段（模型原始输出等）的采样比例
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))  # 大字段保留的最大字符数
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # 队列满时丢弃新记录，而不是阻塞事件循环
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# LogRecord 自带的属性；其余通过 extra 传入的都作为结构化字段输出
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        # 在产生日志的协程里读取 contextvar；到了后台线程就拿不到了
+        if getattr(record, "request_id", None) is None:
+            record.request_id = request_id_var.get()
+        return True
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 只做必要的处理：合并 msg 与 args、把异常转为文本（traceback 对象不能跨线程长期持有），
+        # 其余格式化留给后台线程
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass  # 日志积压时宁可丢弃，也不让请求等待 I/O
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> None:
+    """安装基于队列的根日志处理器；重复调用无副作用。"""
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(
+        JsonFormatter() if fmt == "json" else logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+    )
+    handler = _DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(_RequestIdFilter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    if root.getEffectiveLevel() > logging.DEBUG:
+        logging.getLogger("httpx").setLevel(logging.WARNING)  # 每次上游请求一行 INFO，量大且与访问日志重复
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def truncate(value: Any, limit: int = LOG_PAYLOAD_MAX_CHARS) -> str:
+    text = value if isinstance(value, str) else str(value)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}…(+{len(text) - limit} chars)"
+
+
+def log_payload(logger: logging.Logger, msg: str, payload: Any, level: int = logging.INFO, **fields: Any) -> None:
+    """记录大字段：按 LOG_PAYLOAD_SAMPLE_RATE 采样，并截断到 LOG_PAYLOAD_MAX_CHARS；DEBUG 级别时全部记录。"""
+    if not logger.isEnabledFor(level):
+        return
+    if not logger.isEnabledFor(logging.DEBUG) and random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    text = payload if isinstance(payload, str) else str(payload)
+    logger.log(level, msg, extra={**fields, "payload": truncate(text), "payload_chars": len(text)})
+
+
+async def request_id_middleware(request: Request, call_next):
+    # 沿用上游（网关/前端）传入的请求 ID，没有时生成一个；响应头里原样带回便于串联排查
+    request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers[REQUEST_ID_HEADER] = request_id
+    logging.getLogger("vibe.access").info(
+        "request",
+        extra={
+            "request_id": request_id,
+            "method": request.method,
+            "path": request.url.path,
+            "status": response.status_code,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        },
+    )
+    return response
@@ -0,0 +1,156 @@
+import time  # 请求耗时
+from typing import Iterator  # 类型注解
+
+from fastapi import APIRouter, Request, Response  # /metrics 路由与中间件
+from prometheus_client import (  # Prometheus 指标类型与文本格式输出
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    ProcessCollector,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily  # 自定义 Collector 的输出类型
+from starlette.routing import Match  # 中间件里解析请求对应的路由模板
+
+from .image_cache import image_cache  # 图片缓存命中计数
+from .result_cache import sentiment_cache  # 分析结果缓存命中计数
+from .upstream import dashscope_governor  # 上游限流/重试/熔断计数
+
+# Prometheus 指标：HTTP 请求、分析链路各阶段耗时、模型在途数与 token 用量、缓存命中率
+# 阶段耗时统一记在 vibe_stage_duration_seconds{pipeline, stage} 上，可以直接对比图片下载、解码、模型与解析各占多少时间
+# 使用独立的 registry，避免与依赖库（如 opentelemetry）注册到默认 registry 的指标冲突
+
+router = APIRouter()
+
+registry = CollectorRegistry()
+ProcessCollector(registry=registry)  # CPU、内存、文件描述符等进程指标
+
+# 覆盖几十毫秒的缓存命中到几十秒的多模态推理
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+HTTP_REQUESTS = Counter(
+    "vibe_http_requests_total", "HTTP 请求数", ["method", "route", "status"], registry=registry
+)
+HTTP_LATENCY = Histogram(
+    "vibe_http_request_duration_seconds",
+    "HTTP 请求耗时（流式接口只统计到响应头发出）",
+    ["method", "route"],
+    buckets=_LATENCY_BUCKETS,
+    registry=registry,
+)
+HTTP_INFLIGHT = Gauge("vibe_http_requests_inflight", "正在处理的 HTTP 请求数", ["route"], registry=registry)
+
+STAGE_LATENCY = Histogram(
+    "vibe_stage_duration_seconds",
+    "分析链路各阶段耗时",
+    ["pipeline", "stage"],
+    buckets=_LATENCY_BUCKETS,
+    registry=registry,
+)
+STAGE_INFLIGHT = Gauge("vibe_stage_inflight", "各阶段正在执行的数量", ["pipeline", "stage"], registry=registry)
+
+MODEL_CALLS = Counter("vibe_model_calls_total", "模型调用次数", ["model", "outcome"], registry=registry)
+MODEL_INFLIGHT = Gauge("vibe_model_inflight", "在途的模型调用数", ["model"], registry=registry)
+MODEL_TOKENS = Counter("vibe_model_tokens_total", "模型 token 用量", ["model", "direction"], registry=registry)
+
+
+class _StageTimer:
+    __slots__ = ("pipeline", "stage", "_started")
+
+    def __init__(self, pipeline: str, stage: str) -> None:
+        self.pipeline = pipeline
+        self.stage = stage
+
+    def __enter__(self) -> "_StageTimer":
+        STAGE_INFLIGHT.labels(self.pipeline, self.stage).inc()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        STAGE_LATENCY.labels(self.pipeline, self.stage).observe(time.perf_counter() - self._started)
+        STAGE_INFLIGHT.labels(self.pipeline, self.stage).dec()
+
+    async def __aenter__(self) -> "_StageTimer":
+        return self.__enter__()
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.__exit__(*exc_info)
+
+
+def stage_timer(pipeline: str, stage: str) -> _StageTimer:
+    """with / async with 均可使用：统计耗时并维护该阶段的在途数。"""
+    return _StageTimer(pipeline, stage)
+
+
+def record_tokens(model: str, input_tokens: int, output_tokens: int) -> None:
+    MODEL_TOKENS.labels(model, "input").inc(input_tokens or 0)
+    MODEL_TOKENS.labels(model, "output").inc(output_tokens or 0)
+
+
+class _StatsCollector:
+    # 缓存与上游治理本身已有计数，抓取时直接读取，不在热路径上重复计数
+    def collect(self) -> Iterator:
+        hits = CounterMetricFamily("vibe_cache_hits", "缓存命中次数", labels=["cache"])
+        misses = CounterMetricFamily("vibe_cache_misses", "缓存未命中次数", labels=["cache"])
+        ratio = GaugeMetricFamily("vibe_cache_hit_ratio", "缓存命中率", labels=["cache"])
+        size = GaugeMetricFamily("vibe_cache_bytes", "缓存占用字节数", labels=["cache"])
+
+        image = image_cache.stats()
+        for kind in ("url", "base64", "variant"):
+            kind_hits = image[f"{kind}_hits"] + image.get(f"{kind}_revalidated", 0)  # 304 复用也算命中
+            kind_misses = image[f"{kind}_misses"]
+            hits.add_metric([f"image_{kind}"], kind_hits)
+            misses.add_metric([f"image_{kind}"], kind_misses)
+            lookups = kind_hits + kind_misses
+            ratio.add_metric([f"image_{kind}"], kind_hits / lookups if lookups else 0.0)
+        ratio.add_metric(["image"], image["hit_ratio"])
+        size.add_metric(["image"], image["memory_bytes"])
+
+        result = sentiment_cache.stats()
+        hits.add_metric(["sentiment_result"], result["hits"])
+        misses.add_metric(["sentiment_result"], result["misses"])
+        ratio.add_metric(["sentiment_result"], result["hit_ratio"])
+        yield from (hits, misses, ratio, size)
+
+        upstream = dashscope_governor.stats()
+        calls = CounterMetricFamily("vibe_upstream_events", "上游治理计数", labels=["event"])
+        for event in ("calls", "retries", "rejected", "upstream_errors"):
+            calls.add_metric([event], upstream[event])
+        yield calls
+        breaker = GaugeMetricFamily("vibe_upstream_breaker_open", "熔断器是否打开（半开也计为 1）")
+        breaker.add_metric([], 0 if upstream["breaker_state"] == "closed" else 1)
+        yield breaker
+
+
+registry.register(_StatsCollector())
+
+
+def _route_template(request: Request) -> str:
+    # 按路由模板（而不是实际路径）聚合，避免 /jobs/{job_id} 这类路径撑爆标签
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+async def metrics_middleware(request: Request, call_next):
+    route = _route_template(request)
+    HTTP_INFLIGHT.labels(route).inc()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_INFLIGHT.labels(route).dec()
+        HTTP_REQUESTS.labels(request.method, route, str(status)).inc()
+        HTTP_LATENCY.labels(request.method, route).observe(time.perf_counter() - started)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,210 @@
+import os  # 读取部署级路由配置与单价
+import time  # 统计各模型耗时
+from dataclasses import asdict, dataclass, field, replace  # 路由策略与统计结构
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Sequence, Tuple, Union  # 类型注解
+
+from pydantic_ai import Agent  # flash / plus 两个 Agent 由调用方注入
+from pydantic_ai.messages import BinaryContent, ModelRequest, RetryPromptPart  # 统计结构化输出的重试次数
+
+from .metrics import MODEL_CALLS, MODEL_INFLIGHT, record_tokens  # 各模型在途数、调用次数与 token 用量
+from .schemas import SentimentAnalysis  # 路由结果统一为同一结构
+from .upstream import UpstreamGovernor, UpstreamRejected  # 上游限流、重试与熔断
+
+# 自适应模型路由：短文本、少图片的帖子走 flash；图片多、文本长，或 flash 结果置信度低、
+# 反复校验重试、直接失败时再升级到 plus。策略可按部署（环境变量）和按请求（model 字段）配置
+
+RoutingMode = Literal["auto", "flash", "plus"]
+
+SENTIMENT_ROUTING_MODE: RoutingMode = os.getenv("SENTIMENT_ROUTING_MODE", "auto")  # type: ignore[assignment]
+SENTIMENT_ROUTING_MAX_FLASH_IMAGES = int(os.getenv("SENTIMENT_ROUTING_MAX_FLASH_IMAGES", "4"))
+SENTIMENT_ROUTING_MAX_FLASH_TEXT = int(os.getenv("SENTIMENT_ROUTING_MAX_FLASH_TEXT", "2000"))
+SENTIMENT_ROUTING_MIN_CONFIDENCE = float(os.getenv("SENTIMENT_ROUTING_MIN_CONFIDENCE", "0.6"))
+SENTIMENT_ROUTING_MAX_FLASH_RETRIES = int(os.getenv("SENTIMENT_ROUTING_MAX_FLASH_RETRIES", "0"))
+
+# 每千 token 单价（元），按 DashScope 价目表配置后即可得到成本计数；默认 0 表示不计费
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "flash": (
+        float(os.getenv("SENTIMENT_PRICE_FLASH_INPUT", "0")),
+        float(os.getenv("SENTIMENT_PRICE_FLASH_OUTPUT", "0")),
+    ),
+    "plus": (
+        float(os.getenv("SENTIMENT_PRICE_PLUS_INPUT", "0")),
+        float(os.getenv("SENTIMENT_PRICE_PLUS_OUTPUT", "0")),
+    ),
+}
+
+
+@dataclass(frozen=True)
+class RoutingPolicy:
+    mode: RoutingMode = SENTIMENT_ROUTING_MODE
+    max_flash_images: int = SENTIMENT_ROUTING_MAX_FLASH_IMAGES  # 图片数超过时直接用 plus
+    max_flash_text: int = SENTIMENT_ROUTING_MAX_FLASH_TEXT  # 文本长度超过时直接用 plus
+    min_confidence: float = SENTIMENT_ROUTING_MIN_CONFIDENCE  # flash 自评置信度低于此值时升级
+    max_flash_retries: int = SENTIMENT_ROUTING_MAX_FLASH_RETRIES  # flash 结构化校验重试超过此次数时升级
+
+    def initial_tier(self, text: str, image_count: int) -> str:
+        if self.mode != "auto":
+            return self.mode
+        if image_count > self.max_flash_images or len(text) > self.max_flash_text:
+            return "plus"
+        return "flash"
+
+    def escalation_reason(self, output: SentimentAnalysis, retries: int) -> Optional[str]:
+        if self.mode != "auto":
+            return None
+        if output.confidence is not None and output.confidence < self.min_confidence:
+            return "low_confidence"
+        if retries > self.max_flash_retries:
+            return "schema_retries"
+        return None
+
+
+@dataclass
+class _TierStats:
+    calls: int = 0
+    failures: int = 0
+    escalations: int = 0  # 从该层升级出去的次数
+    latency_seconds: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+    reasons: Dict[str, int] = field(default_factory=dict)
+
+
+def _count_retries(messages: Sequence[Any]) -> int:
+    return sum(
+        1
+        for message in messages
+        if isinstance(message, ModelRequest)
+        for part in message.parts
+        if isinstance(part, RetryPromptPart)
+    )
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        agents: Dict[str, Agent],
+        policy: Optional[RoutingPolicy] = None,
+        governor: Optional[UpstreamGovernor] = None,
+    ) -> None:
+        self.agents = agents  # {"flash": Agent, "plus": Agent}
+        self.policy = policy or RoutingPolicy()
+        self.governor = governor or UpstreamGovernor()  # 限流、重试与熔断；两层模型共用同一份配额
+        self._stats: Dict[str, _TierStats] = {tier: _TierStats() for tier in agents}
+
+    def resolve(self, mode: Optional[RoutingMode]) -> RoutingPolicy:
+        # 请求级 model 字段覆盖部署默认，其余阈值沿用部署配置
+        return self.policy if mode is None else replace(self.policy, mode=mode)
+
+    def cache_label(self, policy: RoutingPolicy) -> str:
+        # 结果缓存按路由方式区分：显式指定时用模型名，auto 模式单独成一类
+        if policy.mode == "auto":
+            return "auto"
+        return self.agents[policy.mode].model.model_name
+
+    def _record(self, tier: str, started: float, result: Any = None, failed: bool = False) -> int:
+        stats = self._stats[tier]
+        stats.calls += 1
+        stats.latency_seconds += time.perf_counter() - started
+        model_name = self.agents[tier].model.model_name
+        MODEL_CALLS.labels(model_name, "error" if failed else "ok").inc()
+        if failed:
+            stats.failures += 1
+            return 0
+        usage = result.usage()
+        stats.input_tokens += usage.input_tokens
+        stats.output_tokens += usage.output_tokens
+        record_tokens(model_name, usage.input_tokens, usage.output_tokens)
+        input_price, output_price = MODEL_PRICES.get(tier, (0.0, 0.0))
+        stats.cost += (usage.input_tokens * input_price + usage.output_tokens * output_price) / 1000
+        return _count_retries(result.all_messages())
+
+    def _escalated(self, tier: str, reason: str) -> None:
+        stats = self._stats[tier]
+        stats.escalations += 1
+        stats.reasons[reason] = stats.reasons.get(reason, 0) + 1
+
+    async def run(
+        self,
+        user_message: List[Union[str, BinaryContent]],
+        text: str,
+        image_count: int,
+        policy: RoutingPolicy,
+    ) -> SentimentAnalysis:
+        tier = policy.initial_tier(text, image_count)
+        started = time.perf_counter()
+        try:
+            with MODEL_INFLIGHT.labels(self.agents[tier].model.model_name).track_inprogress():
+                result = await self.governor.call(lambda: self.agents[tier].run(user_message))
+        except Exception as exc:
+            self._record(tier, started, failed=True)
+            # 被限流/熔断拒绝时 plus 同样会被拒绝，不做升级
+            if tier != "flash" or policy.mode != "auto" or isinstance(exc, UpstreamRejected):
+                raise
+            self._escalated(tier, "flash_error")  # flash 直接失败（如多次校验不通过）时交给 plus 兜底
+            return await self.run(user_message, text, image_count, replace(policy, mode="plus"))
+        retries = self._record(tier, started, result)
+
+        reason = policy.escalation_reason(result.output, retries) if tier == "flash" else None
+        if reason is None:
+            return result.output
+        self._escalated(tier, reason)
+        return await self.run(user_message, text, image_count, replace(policy, mode="plus"))
+
+    async def run_stream(
+        self,
+        user_message: List[Union[str, BinaryContent]],
+        text: str,
+        image_count: int,
+        policy: RoutingPolicy,
+        debounce: float,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        tier = policy.initial_tier(text, image_count)
+        started = time.perf_counter()
+        sent = False  # 是否已经向客户端推送过部分结果
+        try:
+            # 模型边生成边做部分校验，每得到一个更完整的结构就推送一次 partial
+            with MODEL_INFLIGHT.labels(self.agents[tier].model.model_name).track_inprogress():
+                async with self.governor.slot(), self.agents[tier].run_stream(user_message) as result:
+                    async for partial in result.stream_output(debounce_by=debounce):
+                        sent = True
+                        yield {"type": "partial", "model": tier, "data": partial}
+                    output = await result.get_output()
+        except Exception as exc:
+            self._record(tier, started, failed=True)
+            # 与 run 一致：被限流/熔断拒绝时不升级；已推送过部分结果时客户端无法区分新旧输出，直接抛出
+            if sent or tier != "flash" or policy.mode != "auto" or isinstance(exc, UpstreamRejected):
+                raise
+            reason = "flash_error"
+        else:
+            retries = self._record(tier, started, result)
+            reason = policy.escalation_reason(output, retries) if tier == "flash" else None
+
+        if reason is None:
+            yield {"type": "result", "model": tier, "data": output}
+            return
+        # 升级时先告知客户端丢弃之前的部分结果，再推送 plus 的输出
+        self._escalated(tier, reason)
+        yield {"type": "escalate", "from": tier, "to": "plus", "reason": reason}
+        async for event in self.run_stream(user_message, text, image_count, replace(policy, mode="plus"), debounce):
+            yield event
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policy": asdict(self.policy),
+            "models": {
+                tier: {
+                    "model": self.agents[tier].model.model_name,
+                    "calls": stats.calls,
+                    "failures": stats.failures,
+                    "escalations": stats.escalations,
+                    "escalation_reasons": dict(stats.reasons),
+                    "avg_latency_seconds": round(stats.latency_seconds / stats.calls, 4) if stats.calls else 0.0,
+                    "input_tokens": stats.input_tokens,
+                    "output_tokens": stats.output_tokens,
+                    "cost": round(stats.cost, 6),
+                }
+                for tier, stats in self._stats.items()
+            },
+        }
@@ -3,17 +3,66 @@
 from __future__ import annotations
 
 import argparse
+import ast
+import codecs
+import hashlib
 import json
-import subprocess
+import os
+import posixpath
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
-from typing import Sequence
+from typing import Any, Callable, Mapping, Sequence
 
 import tomllib
 
 
 DEFAULT_IGNORE = "node_modules|dist|.git|.venv|__pycache__|.next|.uv_cache"
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+ENTRY_SCAN_DEPTH = 5
+CORE_SCAN_DEPTH = 6
+BUDGET_SEGMENT_MAX_LINES = 40
+BUDGET_BLOCK_OVERHEAD = 16
+BUDGET_GAP_OVERHEAD = 8
+GRAPH_SOURCE_SUFFIXES = (".py", ".ts", ".tsx", ".js", ".jsx", ".mjs", ".cjs")
+GRAPH_MANIFESTS = ("package.json", "tsconfig.json")
+GRAPH_MAX_FILES = 1500
+GRAPH_DAMPING = 0.85
+GRAPH_ITERATIONS = 30
+SYMBOLS_KIND = "symbols:1"
+CORE_STRATEGIES = ("hints", "graph")
+DEFAULT_CORE_STRATEGY = "hints"
+TREE_MAX_LINES = 300
+TREE_DIR_ENTRIES = 25
+TREE_COLLAPSE_GROUPS = 3
+TREE_SCAN_DIRS = 2000
+READ_SNIFF_BYTES = 8192
+READ_MAX_BYTES = 1 << 20
+READ_CONTROL_RATIO = 0.3
+MINIFIED_AVG_LINE_BYTES = 500
+INDEX_DIRNAME = ".index"
+INDEX_VERSION = 4
+INDEX_RACY_WINDOW_NS = 2_000_000_000
 MODULE1_FILENAME = "module1_architecture_prompt"
 MODULE2_FILENAME = "module2_dataflow_prompt"
+BATCH_FILENAMES = {"module1": MODULE1_FILENAME, "module2": MODULE2_FILENAME}
+BATCH_OPTION_KEYS = (
+    "scenario",
+    "entry",
+    "core",
+    "max_depth",
+    "readme_lines",
+    "max_lines",
+    "token_budget",
+    "core_strategy",
+    "ignore",
+    "index_dir",
+    "no_index",
+)
 
 ENTRY_FILE_HINTS = (
     "__main__.py",
@@ -28,6 +77,38 @@ ENTRY_FILE_HINTS = (
     "commands.py",
 )
 
+_TERM_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}|[\u4e00-\u9fff]{2,}")
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_$][\w$]*")
+_DEFINITION_RE = re.compile(
+    r"(?:@|(?:async\s+)?def\s|class\s|export\s|function\s|(?:const|let|var)\s+[\w$]+\s*=|interface\s|type\s+\w+\s*=)"
+)
+_DEFINED_NAME_RE = re.compile(r"(?:def|class|function|interface|type|const|let|var)\s+([A-Za-z_$][\w$]*)")
+_HEADER_LINE_RE = re.compile(
+    r"\s*(?:import\s|from\s+\S+\s+import\s|(?:const|let|var)\s+.+=\s*require\(|#|//|/\*|\*|['\"]use |\"\"\"|'\'\'|\)|\}\s*from\s|\w+,?$)"
+)
+_JS_IMPORT_RE = re.compile(
+    r"""(?:^|[\s;])(?:import|export)\s+(?:type\s+)?(?:(?P<names>[\w$*{}\s,]+?)\s+from\s+)?['"](?P<spec>[^'"\n]+)['"]"""
+    r"""|\brequire\(\s*['"](?P<require>[^'"\n]+)['"]\s*\)|\bimport\(\s*['"](?P<dynamic>[^'"\n]+)['"]\s*\)"""
+)
+_JS_DEF_RE = re.compile(
+    r"(?:export\s+(?:default\s+)?)?(?:declare\s+)?(?:async\s+)?"
+    r"(?:function\*?|class|const|let|var|interface|type|enum)\s+([A-Za-z_$][\w$]*)"
+)
+_JS_RESOLVE_SUFFIXES = (
+    "",
+    ".ts",
+    ".tsx",
+    ".js",
+    ".jsx",
+    ".mjs",
+    ".cjs",
+    "/index.ts",
+    "/index.tsx",
+    "/index.js",
+    "/index.jsx",
+)
+_HANDLER_RE = re.compile(r"@(?:app|router|\w+_router)\.\w+\(|\b(?:app|router)\.(?:get|post|put|delete|patch|use)\(|\bexport\s+default\b")
+
 CORE_NAME_HINTS = (
     "service",
     "services",
@@ -121,88 +202,522 @@ MODULE2_TEMPLATE = """# Role: 全栈系统分析师 (System Analyst)
 """
 
 
+Lister = Callable[[str], tuple[list[str], list[str]]]
+
+
 def _split_ignore(ignore_pattern: str) -> set[str]:
     return {item.strip() for item in ignore_pattern.split("|") if item.strip()}
 
 
 def _depth_within(path: Path, root: Path) -> int:
-    rel = path.relative_to(root)
-    return len(rel.parts)
+    return len(path.parts) - len(root.parts)
 
 
-def _walk_files(project_path: Path, ignore_names: set[str], max_depth: int) -> list[Path]:
-    files: list[Path] = []
-    for path in sorted(project_path.rglob("*")):
-        if any(part in ignore_names for part in path.parts):
-            continue
-        if _depth_within(path, project_path) > max_depth:
-            continue
-        if path.is_file():
-            files.append(path)
+def _list_directory(directory: str, ignore_names: set[str]) -> tuple[list[str], list[str]]:
+    files: list[str] = []
+    subdirs: list[str] = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name in ignore_names:
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.is_file():
+                        files.append(entry.name)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return sorted(files), sorted(subdirs)
+
+
+def _scan_directory(directory: str, depth: int, max_depth: int, lister: Lister) -> tuple[list[str], list[str]]:
+    files, subdirs = lister(directory)
+    found = [os.path.join(directory, name) for name in files]
+    if depth + 1 >= max_depth:
+        return found, []
+    return found, [os.path.join(directory, name) for name in subdirs]
+
+
+def _scan_subtree(directory: str, depth: int, max_depth: int, lister: Lister) -> list[str]:
+    files: list[str] = []
+    stack = [(directory, depth)]
+    while stack:
+        current, current_depth = stack.pop()
+        found, subdirs = _scan_directory(current, current_depth, max_depth, lister)
+        files.extend(found)
+        stack.extend((subdir, current_depth + 1) for subdir in subdirs)
     return files
 
 
-def _run_tree(project_path: Path, max_depth: int, ignore_pattern: str) -> str:
-    command = [
-        "tree",
-        "-I",
-        ignore_pattern,
-        "-L",
-        str(max_depth),
-        str(project_path),
-    ]
-    try:
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-        return result.stdout.strip() or f"{project_path} (empty)"
-    except (FileNotFoundError, subprocess.CalledProcessError):
-        return _fallback_tree(project_path, max_depth, _split_ignore(ignore_pattern))
+def _walk_files(
+    project_path: Path,
+    ignore_names: set[str],
+    max_depth: int,
+    index: ProjectIndex | None = None,
+) -> list[Path]:
+    lister: Lister = index.listing if index else partial(_list_directory, ignore_names=ignore_names)
+    files, frontier = _scan_directory(str(project_path), 0, max_depth, lister)
+    depth = 1
+    while frontier and depth < 2 and len(frontier) < SCAN_WORKERS * 2:
+        next_frontier: list[str] = []
+        for directory in frontier:
+            found, subdirs = _scan_directory(directory, depth, max_depth, lister)
+            files.extend(found)
+            next_frontier.extend(subdirs)
+        frontier = next_frontier
+        depth += 1
+
+    if frontier:
+        with ThreadPoolExecutor(max_workers=min(SCAN_WORKERS, len(frontier))) as pool:
+            for found in pool.map(lambda directory: _scan_subtree(directory, depth, max_depth, lister), frontier):
+                files.extend(found)
+
+    return sorted((Path(path) for path in files), key=lambda path: path.parts)
+
+
+class ProjectIndex:
+    """On-disk cache of directory listings, file hashes, formatted snippets and tree-derived results for one project.
+
+    Directory listings are reused while the directory mtime is unchanged, so an unchanged tree costs one
+    ``stat`` per directory. Snippets are keyed by content hash and survive mtime-only changes; file selections
+    are keyed by a fingerprint of the listings they were computed from. The rendered tree is not memoized: it
+    reports per-directory file counts and sizes, which a name-only fingerprint cannot see change.
+    """
+
+    def __init__(self, project_path: Path, ignore_pattern: str, path: Path | None = None) -> None:
+        self.project_path = project_path
+        self.ignore_pattern = ignore_pattern
+        self.ignore_names = _split_ignore(ignore_pattern)
+        self.path = path
+        self._root = str(project_path)
+        self._dirs: dict[str, list] = {}
+        self._files: dict[str, list] = {}
+        self._snippets: dict[str, list] = {}
+        self._memos: dict[str, list] = {}
+        self._fingerprints: dict[int, str] = {}
+        self._dirty = False
+        self._load()
+
+    @classmethod
+    def open(cls, project_path: Path, ignore_pattern: str, index_dir: Path | None = None) -> ProjectIndex:
+        directory = index_dir or _output_dir() / INDEX_DIRNAME
+        digest = hashlib.sha1(str(project_path).encode("utf-8")).hexdigest()[:12]
+        return cls(project_path, ignore_pattern, directory / f"{project_path.name}-{digest}.json")
+
+    def __enter__(self) -> ProjectIndex:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.save()
+
+    def _read(self) -> dict[str, Any] | None:
+        if self.path is None or not self.path.exists():
+            return None
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != INDEX_VERSION or data.get("root") != self._root:
+            return None
+        return data
+
+    def _load(self) -> None:
+        data = self._read()
+        if data is None:
+            return
+        if data.get("ignore") == self.ignore_pattern:
+            self._dirs = data.get("dirs", {})
+            self._memos = data.get("memos", {})
+        self._files = data.get("files", {})
+        self._snippets = data.get("snippets", {})
+
+    def _relative(self, path: str) -> str:
+        if path == self._root:
+            return "."
+        if path.startswith(self._root + os.sep):
+            return path[len(self._root) + 1 :]
+        return path
+
+    def listing(self, directory: str) -> tuple[list[str], list[str]]:
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            return [], []
+        rel = self._relative(directory)
+        cached = self._dirs.get(rel)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1], cached[2]
+        files, subdirs = _list_directory(directory, self.ignore_names)
+        self._dirs[rel] = [_trusted_mtime(mtime_ns), files, subdirs]
+        self._dirty = True
+        return files, subdirs
+
+    def _digest(self, path: Path) -> str | None:
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        rel = self._relative(str(path))
+        cached = self._files.get(rel)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        try:
+            with path.open("rb") as handle:
+                digest = hashlib.file_digest(handle, "sha1").hexdigest()
+        except OSError:
+            return None
+        self._files[rel] = [stat.st_size, _trusted_mtime(stat.st_mtime_ns), digest]
+        self._dirty = True
+        return digest
+
+    def file_data(self, path: Path, kind: str, build: Callable[[], Any]) -> Any:
+        digest = self._digest(path)
+        if digest is None:
+            return build()
+        derived = self._snippets.setdefault(self._relative(str(path)), {})
+        cached = derived.get(kind)
+        if cached is not None and cached[0] == digest:
+            return cached[1]
+        value = build()
+        derived[kind] = [digest, value]
+        self._dirty = True
+        return value
+
+    def snippet(self, path: Path, kind: str, build: Callable[[], str]) -> str:
+        return self.file_data(path, kind, build)
+
+    def fingerprint(self, max_depth: int) -> str:
+        if max_depth in self._fingerprints:
+            return self._fingerprints[max_depth]
+        digest = hashlib.sha1()
+        stack = [(self._root, 0)]
+        while stack:
+            directory, depth = stack.pop()
+            files, subdirs = self.listing(directory)
+            digest.update(f"{self._relative(directory)}\0{'/'.join(files)}\0{'/'.join(subdirs)}\n".encode("utf-8"))
+            if depth + 1 < max_depth:
+                stack.extend((os.path.join(directory, name), depth + 1) for name in reversed(subdirs))
+        self._fingerprints[max_depth] = digest.hexdigest()
+        return self._fingerprints[max_depth]
+
+    def memo(self, key: str, max_depth: int, build: Callable[[], Any]) -> Any:
+        fingerprint = self.fingerprint(max_depth)
+        cached = self._memos.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        value = build()
+        self._memos[key] = [fingerprint, value]
+        self._dirty = True
+        return value
+
+    def _prune(self) -> None:
+        live_dirs = {"."}
+        for rel, (_, _, subdirs) in self._dirs.items():
+            live_dirs.update(name if rel == "." else os.path.join(rel, name) for name in subdirs)
+        self._dirs = {rel: entry for rel, entry in self._dirs.items() if rel in live_dirs}
+
+        live_files: set[str] = set()
+        for rel, (_, files, _) in self._dirs.items():
+            live_files.update(name if rel == "." else os.path.join(rel, name) for name in files)
+
+        def alive(rel: str) -> bool:
+            parent = os.path.dirname(rel) or "."
+            return parent not in self._dirs or rel in live_files
+
+        self._files = {rel: entry for rel, entry in self._files.items() if alive(rel)}
+        self._snippets = {rel: entry for rel, entry in self._snippets.items() if alive(rel)}
+
+    def _merge_saved(self) -> None:
+        data = self._read()
+        if data is None:
+            return
+        if data.get("ignore") == self.ignore_pattern:
+            self._dirs = {**data.get("dirs", {}), **self._dirs}
+            self._memos = {**data.get("memos", {}), **self._memos}
+        self._files = {**data.get("files", {}), **self._files}
+        snippets = data.get("snippets", {})
+        for rel, derived in self._snippets.items():
+            snippets[rel] = {**snippets.get(rel, {}), **derived}
+        self._snippets = snippets
+
+    def save(self) -> None:
+        """Write the index, first merging in entries another writer saved since it was loaded."""
+        if self.path is None or not self._dirty:
+            return
+        with _index_lock(self.path):
+            self._merge_saved()
+            self._prune()
+            data = {
+                "version": INDEX_VERSION,
+                "root": self._root,
+                "ignore": self.ignore_pattern,
+                "dirs": self._dirs,
+                "files": self._files,
+                "snippets": self._snippets,
+                "memos": self._memos,
+            }
+            _write_atomic(self.path, json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+        self._dirty = False
 
 
-def _fallback_tree(project_path: Path, max_depth: int, ignore_names: set[str]) -> str:
-    def should_skip(path: Path) -> bool:
-        return any(part in ignore_names for part in path.parts)
+_INDEX_LOCKS: dict[Path, threading.Lock] = {}
+_INDEX_LOCKS_GUARD = threading.Lock()
 
-    lines = [str(project_path)]
 
-    def walk(current: Path, prefix: str, depth: int) -> None:
-        if depth >= max_depth:
-            return
-        entries = [
-            entry
-            for entry in sorted(current.iterdir(), key=lambda p: (p.is_file(), p.name.lower()))
-            if not should_skip(entry)
-        ]
-        total = len(entries)
-        for index, entry in enumerate(entries, start=1):
-            connector = "└── " if index == total else "├── "
-            lines.append(f"{prefix}{connector}{entry.name}")
-            if entry.is_dir():
-                extension = "    " if index == total else "│   "
-                walk(entry, prefix + extension, depth + 1)
-
-    walk(project_path, "", 0)
-    return "\n".join(lines)
+def _index_lock(path: Path) -> threading.Lock:
+    with _INDEX_LOCKS_GUARD:
+        return _INDEX_LOCKS.setdefault(path, threading.Lock())
+
+
+def _trusted_mtime(mtime_ns: int) -> int:
+    if time.time_ns() - mtime_ns < INDEX_RACY_WINDOW_NS:
+        return -1
+    return mtime_ns
+
 
+def _cached_snippet(index: ProjectIndex | None, path: Path, kind: str, build: Callable[[], str]) -> str:
+    if index is None:
+        return build()
+    return index.snippet(path, kind, build)
 
-def _safe_read(path: Path) -> str:
-    for encoding in ("utf-8", "utf-8-sig", "latin-1"):
+
+def _files_within(files: Sequence[Path], project_path: Path, max_depth: int) -> list[Path]:
+    return [path for path in files if _depth_within(path, project_path) <= max_depth]
+
+
+class _TreeNode:
+    __slots__ = ("path", "name", "depth", "files", "subdirs", "children", "listed", "expanded")
+
+    def __init__(self, path: str, name: str, depth: int) -> None:
+        self.path = path
+        self.name = name
+        self.depth = depth
+        self.files: list[tuple[str, int]] = []
+        self.subdirs: list[str] = []
+        self.children: list[_TreeNode] = []
+        self.listed = False
+        self.expanded = False
+
+    def list(self, ignore_names: set[str]) -> None:
+        files: list[tuple[str, int]] = []
+        subdirs: list[str] = []
         try:
-            return path.read_text(encoding=encoding)
-        except UnicodeDecodeError:
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    if entry.name in ignore_names:
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        elif entry.is_file():
+                            files.append((entry.name, entry.stat().st_size))
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        self.files = sorted(files, key=lambda item: item[0].lower())
+        self.subdirs = sorted(subdirs, key=str.lower)
+        self.listed = True
+
+    def shown(self) -> tuple[list[str], list[tuple[str, int]]]:
+        dir_slots = min(len(self.subdirs), max(TREE_DIR_ENTRIES - len(self.files), TREE_DIR_ENTRIES // 2))
+        return self.subdirs[:dir_slots], self.files[: TREE_DIR_ENTRIES - dir_slots]
+
+    def line_cost(self) -> int:
+        subdirs, files = self.shown()
+        hidden_dirs = len(self.subdirs) - len(subdirs)
+        hidden_files = len(self.files) - len(files)
+        return len(subdirs) + len(files) + (hidden_dirs > 0) + min(hidden_files, TREE_COLLAPSE_GROUPS + 1)
+
+    def rollup(self) -> tuple[int, int, bool]:
+        count = len(self.files)
+        size = sum(item[1] for item in self.files)
+        complete = self.listed and len(self.children) == len(self.subdirs)
+        for child in self.children:
+            child_count, child_size, child_complete = child.rollup()
+            count += child_count
+            size += child_size
+            complete = complete and child_complete
+        return count, size, complete
+
+
+def _format_size(size: int) -> str:
+    value = float(size)
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024 or unit == "GB":
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{size} B"
+
+
+def _collapse_files(files: Sequence[tuple[str, int]]) -> list[str]:
+    groups: dict[str, list[int]] = {}
+    for name, size in files:
+        suffix = os.path.splitext(name)[1].lower()
+        group = groups.setdefault(suffix, [0, 0])
+        group[0] += 1
+        group[1] += size
+    ordered = sorted(groups.items(), key=lambda item: (-item[1][0], item[0]))
+    lines: list[str] = []
+    if len(ordered) > TREE_COLLAPSE_GROUPS + 1:
+        rest = ordered[TREE_COLLAPSE_GROUPS:]
+        ordered = ordered[:TREE_COLLAPSE_GROUPS]
+    else:
+        rest = []
+    for suffix, (count, size) in ordered:
+        noun = "file" if count == 1 else "files"
+        kind = f"{suffix} {noun}" if suffix else f"{noun} without extension"
+        lines.append(f"… {count} more {kind} ({_format_size(size)})")
+    if rest:
+        count = sum(group[0] for _, group in rest)
+        size = sum(group[1] for _, group in rest)
+        lines.append(f"… {count} more files of {len(rest)} other types ({_format_size(size)})")
+    return lines
+
+
+def _render_tree(project_path: Path, max_depth: int, ignore_names: set[str]) -> str:
+    """Breadth-first, budgeted directory tree.
+
+    Each directory shows at most ``TREE_DIR_ENTRIES`` entries and collapses the rest into per-extension
+    summaries. Directories are expanded level by level while the output stays under ``TREE_MAX_LINES``, and
+    no more than ``TREE_SCAN_DIRS`` directories are listed; everything past either budget is shown as a
+    rolled-up line. Totals that do not cover the whole subtree are prefixed with ``≥``.
+    """
+    root = _TreeNode(str(project_path), str(project_path), 0)
+    queue = [root]
+    lines_used = 1
+    scanned = 0
+    truncated = False
+    position = 0
+    while position < len(queue):
+        node = queue[position]
+        position += 1
+        if scanned >= TREE_SCAN_DIRS:
+            truncated = True
+            break
+        node.list(ignore_names)
+        scanned += 1
+        if node.depth >= max_depth:
+            continue
+        cost = node.line_cost()
+        if node is not root and lines_used + cost > TREE_MAX_LINES:
+            truncated = True
             continue
-    return ""
+        node.expanded = True
+        lines_used += cost
+        subdirs, _ = node.shown()
+        node.children = [_TreeNode(os.path.join(node.path, name), name, node.depth + 1) for name in subdirs]
+        queue.extend(node.children)
+
+    def label(node: _TreeNode) -> str:
+        if not node.listed:
+            return node.name if node is root else f"{node.name}/"
+        count, size, complete = node.rollup()
+        at_least = "" if complete else "≥"
+        noun = "file" if count == 1 and complete else "files"
+        name = node.name if node is root else f"{node.name}/"
+        return f"{name} ({at_least}{count} {noun}, {at_least}{_format_size(size)})"
+
+    lines = [label(root)]
+
+    def walk(node: _TreeNode, prefix: str) -> None:
+        subdirs, files = node.shown()
+        rows: list[tuple[str, _TreeNode | None]] = [(label(child), child if child.expanded else None) for child in node.children]
+        rows.extend((name, None) for name, _ in files)
+        hidden_dirs = len(node.subdirs) - len(subdirs)
+        if hidden_dirs:
+            rows.append((f"… {hidden_dirs} more directories", None))
+        rows.extend((line, None) for line in _collapse_files(node.files[len(files) :]))
+        for position, (text, child) in enumerate(rows, start=1):
+            last = position == len(rows)
+            lines.append(f"{prefix}{'└── ' if last else '├── '}{text}")
+            if child is not None:
+                walk(child, prefix + ("    " if last else "│   "))
+
+    if root.expanded:
+        walk(root, "")
+    if truncated:
+        lines.append(f"(目录树已按预算截断：最多 {TREE_MAX_LINES} 行、扫描 {TREE_SCAN_DIRS} 个目录)")
+    return "\n".join(lines)
+
+
+def _sniff_encoding(prefix: bytes, skip_minified: bool) -> str | None:
+    if prefix.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if prefix.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    if b"\0" in prefix:
+        return None
+    control = sum(1 for byte in prefix if byte < 32 and byte not in b"\t\n\r\f\b\x1b")
+    if prefix and control / len(prefix) > READ_CONTROL_RATIO:
+        return None
+    if (
+        skip_minified
+        and len(prefix) >= 4 * MINIFIED_AVG_LINE_BYTES
+        and len(prefix) / (prefix.count(b"\n") + 1) > MINIFIED_AVG_LINE_BYTES
+    ):
+        return None
+    try:
+        prefix.decode("utf-8")
+    except UnicodeDecodeError as exc:
+        if exc.end < len(prefix) or len(prefix) - exc.start > 3:
+            return "latin-1"
+    return "utf-8"
+
+
+def _read_text(
+    path: Path,
+    max_lines: int | None = None,
+    max_bytes: int = READ_MAX_BYTES,
+    skip_minified: bool = True,
+) -> str | None:
+    """Read at most ``max_lines`` lines and ``max_bytes`` bytes of ``path``.
+
+    The encoding is picked once from the first ``READ_SNIFF_BYTES``; binary files (and, unless
+    ``skip_minified`` is false, minified ones) return ``None`` without reading further. Unreadable files
+    read as ``""``.
+    """
+    try:
+        with path.open("rb") as handle:
+            prefix = handle.read(min(READ_SNIFF_BYTES, max_bytes))
+            encoding = _sniff_encoding(prefix, skip_minified)
+            if encoding is None:
+                return None
+            decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+            parts = [decoder.decode(prefix)]
+            newlines = parts[0].count("\n")
+            remaining = max_bytes - len(prefix)
+            while remaining > 0 and (max_lines is None or newlines < max_lines):
+                chunk = handle.readline(remaining) if max_lines is not None else handle.read(min(remaining, 1 << 16))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                parts.append(decoder.decode(chunk))
+                newlines += parts[-1].count("\n")
+            parts.append(decoder.decode(b"", final=True))
+    except OSError:
+        return ""
+    content = "".join(parts)
+    if max_lines is not None:
+        content = "".join(content.splitlines(keepends=True)[:max_lines])
+    return content
 
 
 def _read_head_lines(path: Path, line_limit: int) -> str:
-    content = _safe_read(path)
+    content = _read_text(path, max_lines=line_limit)
+    if content is None:
+        return "(二进制或压缩文件，已跳过)"
     if not content:
         return "(内容为空或无法读取)"
-    return "\n".join(content.splitlines()[:line_limit]).strip() or "(文件为空)"
+    return content.strip() or "(文件为空)"
 
 
 def _format_json_snippet(path: Path) -> str:
     try:
-        parsed = json.loads(_safe_read(path))
+        parsed = json.loads(_read_text(path, skip_minified=False) or "")
     except json.JSONDecodeError:
         return _read_head_lines(path, 220)
 
@@ -221,7 +736,7 @@ def _format_json_snippet(path: Path) -> str:
 
 def _format_pyproject_snippet(path: Path) -> str:
     try:
-        parsed = tomllib.loads(_safe_read(path))
+        parsed = tomllib.loads(_read_text(path, skip_minified=False) or "")
     except tomllib.TOMLDecodeError:
         return _read_head_lines(path, 220)
 
@@ -281,18 +796,24 @@ def build_module1_prompt(
     max_depth: int,
     readme_lines: int,
     ignore_pattern: str,
+    index: ProjectIndex | None = None,
 ) -> str:
-    tree_output = _run_tree(project_path, max_depth=max_depth, ignore_pattern=ignore_pattern)
+    tree_output = _render_tree(project_path, max_depth=max_depth, ignore_names=_split_ignore(ignore_pattern))
 
     dependency_files = _collect_dependency_files(project_path)
     if dependency_files:
-        dependency_blocks = "\n\n".join(_format_dependency_block(path) for path in dependency_files)
+        dependency_blocks = "\n\n".join(
+            _cached_snippet(index, path, "dependency", partial(_format_dependency_block, path))
+            for path in dependency_files
+        )
     else:
         dependency_blocks = "未找到 package.json / pyproject.toml / requirements.txt。"
 
     readme_path = _locate_readme(project_path)
     if readme_path:
-        readme_head = _read_head_lines(readme_path, readme_lines)
+        readme_head = _cached_snippet(
+            index, readme_path, f"head:{readme_lines}", partial(_read_head_lines, readme_path, readme_lines)
+        )
     else:
         readme_head = "(未找到 README.md)"
 
@@ -317,18 +838,18 @@ def _resolve_paths(project_path: Path, user_paths: Sequence[str] | None) -> list
     return resolved
 
 
-def _auto_pick_entry_files(project_path: Path, ignore_names: set[str]) -> list[Path]:
-    files = _walk_files(project_path, ignore_names=ignore_names, max_depth=5)
-    entries = [path for path in files if path.name in ENTRY_FILE_HINTS]
+def _auto_pick_entry_files(project_path: Path, files: Sequence[Path]) -> list[Path]:
+    candidates = _files_within(files, project_path, ENTRY_SCAN_DEPTH)
+    entries = [path for path in candidates if path.name in ENTRY_FILE_HINTS]
     return entries[:4]
 
 
-def _auto_pick_core_files(project_path: Path, ignore_names: set[str]) -> list[Path]:
-    files = _walk_files(project_path, ignore_names=ignore_names, max_depth=6)
+def _auto_pick_core_files(project_path: Path, files: Sequence[Path]) -> list[Path]:
+    files = _files_within(files, project_path, CORE_SCAN_DEPTH)
 
     scored: list[tuple[int, Path]] = []
     for path in files:
-        lowered = str(path.relative_to(project_path)).lower()
+        lowered = str(path)[len(str(project_path)) + 1 :].lower()
         score = sum(2 for hint in CORE_NAME_HINTS if f"/{hint}/" in f"/{lowered}")
         score += sum(1 for hint in CORE_NAME_HINTS if hint in path.stem.lower())
         if score > 0 and path.suffix in {".py", ".ts", ".tsx", ".js"}:
@@ -345,6 +866,292 @@ def _auto_pick_core_files(project_path: Path, ignore_names: set[str]) -> list[Pa
     return selected
 
 
+def _parse_python_symbols(text: str) -> dict[str, Any]:
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return {"imports": [], "defs": [], "refs": []}
+
+    imports: list[list[Any]] = []
+    refs: set[str] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.extend([alias.name, []] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imports.append(["." * node.level + (node.module or ""), [alias.name for alias in node.names]])
+        elif isinstance(node, ast.Attribute):
+            refs.add(node.attr)
+        elif isinstance(node, ast.Name):
+            refs.add(node.id)
+
+    defs: list[list[Any]] = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            start = min([node.lineno, *(decorator.lineno for decorator in node.decorator_list)])
+            defs.append([node.name, start, node.end_lineno or node.lineno])
+    return {"imports": imports, "defs": defs, "refs": sorted(refs)}
+
+
+def _js_imported_names(clause: str | None) -> list[str]:
+    if not clause:
+        return []
+    names: list[str] = []
+    default, _, named = clause.partition("{")
+    default = default.strip().rstrip(",").strip()
+    if default and not default.startswith("*"):
+        names.append("default")
+    for item in named.rstrip("}").replace("}", "").split(","):
+        name = item.strip().split(" as ")[0].strip()
+        if name.startswith("type "):
+            name = name[5:].strip()
+        if name:
+            names.append(name)
+    return names
+
+
+def _parse_js_symbols(text: str) -> dict[str, Any]:
+    imports: list[list[Any]] = []
+    for match in _JS_IMPORT_RE.finditer(text):
+        spec = match.group("spec") or match.group("require") or match.group("dynamic")
+        imports.append([spec, _js_imported_names(match.group("names"))])
+
+    lines = text.splitlines()
+    starts = [
+        (position, match.group(1), line.startswith("export default"))
+        for position, line in enumerate(lines)
+        if (match := _JS_DEF_RE.match(line))
+    ]
+    defs: list[list[Any]] = []
+    for order, (start, name, is_default) in enumerate(starts):
+        limit = starts[order + 1][0] if order + 1 < len(starts) else len(lines)
+        end = start
+        depth = 0
+        opened = False
+        for position in range(start, limit):
+            line = lines[position]
+            depth += line.count("{") - line.count("}")
+            opened = opened or "{" in line
+            end = position
+            if (opened and depth <= 0) or (not opened and line.rstrip().endswith(";")):
+                break
+        defs.append([name, start + 1, end + 1])
+        if is_default:
+            defs.append(["default", start + 1, end + 1])
+    return {"imports": imports, "defs": defs, "refs": sorted(set(_IDENTIFIER_RE.findall(text)))}
+
+
+def _parse_symbols(path: Path) -> dict[str, Any]:
+    text = _read_text(path) or ""
+    if path.suffix == ".py":
+        return _parse_python_symbols(text)
+    return _parse_js_symbols(text)
+
+
+class ImportGraph:
+    """Import graph over the project's Python and TS/JS sources, expanded lazily from the entry files."""
+
+    def __init__(self, project_path: Path, sources: Sequence[str], index: ProjectIndex | None = None) -> None:
+        self.project_path = project_path
+        self.index = index
+        self.sources = {source.replace(os.sep, "/") for source in sources}
+        self._symbols: dict[str, dict[str, Any]] = {}
+        self._importers: dict[str, list[tuple[str, list[str]]]] = {}
+        self._edges: dict[str, set[str]] = {}
+        self._python_modules: dict[str, list[str]] = {}
+        for rel in self.sources:
+            if rel.endswith(".py"):
+                parts = rel[:-3].split("/")
+                if parts[-1] == "__init__":
+                    parts = parts[:-1]
+                for start in range(len(parts)):
+                    self._python_modules.setdefault(".".join(parts[start:]), []).append(rel)
+        self._packages: dict[str, str] = {}
+        for rel in self.sources:
+            if rel.endswith("package.json"):
+                try:
+                    name = json.loads(_read_text(self._path(rel), skip_minified=False) or "").get("name")
+                except (ValueError, AttributeError):
+                    continue
+                if isinstance(name, str):
+                    self._packages[name] = posixpath.dirname(rel)
+
+    def _path(self, rel: str) -> Path:
+        return self.project_path / rel
+
+    def _rel(self, path: Path) -> str:
+        return str(path)[len(str(self.project_path)) + 1 :].replace(os.sep, "/")
+
+    def symbols(self, rel: str) -> dict[str, Any]:
+        if rel not in self._symbols:
+            path = self._path(rel)
+            if self.index is None:
+                self._symbols[rel] = _parse_symbols(path)
+            else:
+                self._symbols[rel] = self.index.file_data(path, SYMBOLS_KIND, partial(_parse_symbols, path))
+        return self._symbols[rel]
+
+    def _closest(self, importer: str, candidates: Sequence[str]) -> str | None:
+        if not candidates:
+            return None
+        return max(candidates, key=lambda rel: (len(posixpath.commonprefix([rel, importer])), -len(rel)))
+
+    def _resolve_python(self, importer: str, spec: str, names: Sequence[str]) -> list[str]:
+        level = len(spec) - len(spec.lstrip("."))
+        module = spec[level:]
+        if level:
+            base = importer.split("/")[:-1]
+            base = base[: len(base) - (level - 1)] if level > 1 else base
+            target = [*base, *(module.split(".") if module else [])]
+            found: list[str] = []
+            for parts in [target, *([*target, name] for name in names)]:
+                stem = "/".join(parts)
+                for candidate in (f"{stem}.py", f"{stem}/__init__.py"):
+                    if candidate in self.sources:
+                        found.append(candidate)
+                        break
+            return found
+
+        found = []
+        for dotted in [module, *(f"{module}.{name}" for name in names)]:
+            target = self._closest(importer, self._python_modules.get(dotted, []))
+            if target:
+                found.append(target)
+        return found
+
+    def _resolve_js_path(self, base: str) -> str | None:
+        base = posixpath.normpath(base)
+        for suffix in _JS_RESOLVE_SUFFIXES:
+            if f"{base}{suffix}" in self.sources:
+                return f"{base}{suffix}"
+        return None
+
+    def _resolve_js(self, importer: str, spec: str) -> list[str]:
+        directory = posixpath.dirname(importer)
+        if spec.startswith("."):
+            target = self._resolve_js_path(posixpath.join(directory, spec))
+            return [target] if target else []
+
+        if spec.startswith(("@/", "~/")):
+            root = directory
+            while root and not any(f"{root}/{name}" in self.sources for name in ("package.json", "tsconfig.json")):
+                root = posixpath.dirname(root)
+            for base in (posixpath.join(root, spec[2:]), posixpath.join(root, "src", spec[2:])):
+                target = self._resolve_js_path(base)
+                if target:
+                    return [target]
+            return []
+
+        for name in sorted(self._packages, key=len, reverse=True):
+            if spec == name or spec.startswith(f"{name}/"):
+                package_dir = self._packages[name]
+                rest = spec[len(name) + 1 :]
+                bases = [posixpath.join(package_dir, rest), posixpath.join(package_dir, "src", rest)] if rest else [
+                    posixpath.join(package_dir, "src", "index"),
+                    posixpath.join(package_dir, "index"),
+                ]
+                for base in bases:
+                    target = self._resolve_js_path(base)
+                    if target:
+                        return [target]
+                return []
+        return []
+
+    def _expand(self, rel: str) -> set[str]:
+        if rel in self._edges:
+            return self._edges[rel]
+        targets: set[str] = set()
+        for spec, names in self.symbols(rel)["imports"]:
+            if rel.endswith(".py"):
+                resolved = self._resolve_python(rel, spec, names)
+            else:
+                resolved = self._resolve_js(rel, spec)
+            for target in resolved:
+                if target != rel:
+                    targets.add(target)
+                    self._importers.setdefault(target, []).append((rel, names))
+        self._edges[rel] = targets
+        return targets
+
+    def reachable(self, entries: Sequence[str]) -> list[str]:
+        seen = [entry for entry in dict.fromkeys(entries) if entry in self.sources]
+        visited = set(seen)
+        position = 0
+        while position < len(seen) and len(seen) < GRAPH_MAX_FILES:
+            for target in sorted(self._expand(seen[position])):
+                if target not in visited:
+                    visited.add(target)
+                    seen.append(target)
+            position += 1
+        return seen
+
+    def rank(self, entries: Sequence[str]) -> dict[str, float]:
+        nodes = self.reachable(entries)
+        node_set = set(nodes)
+        seeds = [entry for entry in entries if entry in node_set]
+        if not seeds:
+            return {}
+        teleport = {node: (1.0 / len(seeds) if node in seeds else 0.0) for node in nodes}
+        outgoing = {node: [target for target in self._edges.get(node, ()) if target in node_set] for node in nodes}
+        rank = dict(teleport)
+        for _ in range(GRAPH_ITERATIONS):
+            dangling = sum(rank[node] for node in nodes if not outgoing[node])
+            updated = {node: (1 - GRAPH_DAMPING + GRAPH_DAMPING * dangling) * teleport[node] for node in nodes}
+            for node in nodes:
+                targets = outgoing[node]
+                if targets:
+                    share = GRAPH_DAMPING * rank[node] / len(targets)
+                    for target in targets:
+                        updated[target] += share
+            rank = updated
+        return rank
+
+    def core_files(self, entry_paths: Sequence[Path], limit: int = 6) -> list[Path]:
+        entries = [self._rel(path) for path in entry_paths]
+        rank = self.rank(entries)
+        candidates = [
+            (score, rel) for rel, score in rank.items() if rel not in entries and rel.endswith(GRAPH_SOURCE_SUFFIXES)
+        ]
+        candidates.sort(key=lambda item: (-item[0], len(item[1]), item[1]))
+        return [self._path(rel) for _, rel in candidates[:limit]]
+
+    def focus_ranges(self, path: Path, terms: set[str]) -> list[tuple[int, int]]:
+        rel = self._rel(path)
+        defs = self.symbols(rel)["defs"]
+        names = {name for name, _, _ in defs}
+        wanted: set[str] = set()
+        for importer, imported in self._importers.get(rel, []):
+            matched = set(imported) & names
+            if not matched:
+                matched = set(self.symbols(importer)["refs"]) & names
+            wanted |= matched
+        wanted |= {name for name in names if any(term in name.lower() for term in terms)}
+        return sorted({(start - 1, end) for name, start, end in defs if name in wanted})
+
+
+def _skipped_block(path: Path, project_path: Path) -> str:
+    return f"#### `{path.relative_to(project_path)}`\n(二进制或压缩文件，已跳过)"
+
+
+def _format_focus_block(path: Path, project_path: Path, ranges: list[tuple[int, int]], max_lines: int) -> str:
+    content = _read_text(path)
+    if content is None:
+        return _skipped_block(path, project_path)
+    lines = content.splitlines()
+    kept: list[tuple[int, int]] = []
+    remaining = max_lines
+    for start, end in ranges:
+        if remaining <= 0:
+            break
+        if kept and start < kept[-1][1]:
+            start = kept[-1][1]
+            if start >= end:
+                continue
+        end = min(end, start + remaining)
+        kept.append((start, end))
+        remaining -= end - start
+    return _render_budget_block(path, project_path, lines, kept)
+
+
 def _fence_language(path: Path) -> str:
     mapping = {
         ".py": "python",
@@ -359,14 +1166,134 @@ def _fence_language(path: Path) -> str:
 
 
 def _format_code_block(path: Path, project_path: Path, max_lines: int) -> str:
-    lines = _safe_read(path).splitlines()
-    snippet = lines[:max_lines]
+    content = _read_text(path, max_lines=max_lines)
+    if content is None:
+        return _skipped_block(path, project_path)
+    snippet = content.splitlines()
     numbered = "\n".join(f"{index + 1:>4}: {line}" for index, line in enumerate(snippet))
     rel_path = path.relative_to(project_path)
     fence = _fence_language(path)
     return f"#### `{rel_path}`\n```{fence}\n{numbered}\n```"
 
 
+def _estimate_tokens(text: str) -> int:
+    wide = sum(1 for char in text if ord(char) > 0x2E7F)
+    return (len(text) - wide + 3) // 4 + wide
+
+
+def _scenario_terms(scenario: str) -> set[str]:
+    return {term.lower() for term in _TERM_RE.findall(scenario)}
+
+
+def _split_segments(lines: Sequence[str]) -> list[tuple[int, int, bool]]:
+    segments: list[tuple[int, int, bool]] = []
+    start = 0
+    index = 0
+    while index < len(lines) and (not lines[index].strip() or _HEADER_LINE_RE.match(lines[index])):
+        index += 1
+    if index:
+        segments.append((0, index, True))
+        start = index
+
+    for position in range(index, len(lines)):
+        line = lines[position]
+        if position == start or not _DEFINITION_RE.match(line):
+            continue
+        if lines[position - 1].startswith("@"):
+            continue
+        segments.append((start, position, False))
+        start = position
+    if start < len(lines):
+        segments.append((start, len(lines), False))
+
+    bounded: list[tuple[int, int, bool]] = []
+    for seg_start, seg_end, is_header in segments:
+        for chunk_start in range(seg_start, seg_end, BUDGET_SEGMENT_MAX_LINES):
+            bounded.append((chunk_start, min(seg_end, chunk_start + BUDGET_SEGMENT_MAX_LINES), is_header))
+    return bounded
+
+
+def _score_segment(
+    lines: Sequence[str],
+    start: int,
+    end: int,
+    is_header: bool,
+    terms: set[str],
+    external_names: set[str],
+) -> float:
+    text = "\n".join(lines[start:end])
+    lowered = text.lower()
+    score = 0.2 if is_header else 1.0
+    score += 2.0 * sum(1 for term in terms if term in lowered)
+    defined = set(_DEFINED_NAME_RE.findall(text))
+    score += 1.5 * len(defined & external_names)
+    score += 1.0 * len(_HANDLER_RE.findall(text))
+    return score
+
+
+def _render_budget_block(path: Path, project_path: Path, lines: Sequence[str], ranges: list[tuple[int, int]]) -> str:
+    rel_path = path.relative_to(project_path)
+    fence = _fence_language(path)
+    if not ranges:
+        return f"#### `{rel_path}`\n(超出 token 预算，已省略)"
+
+    rendered: list[str] = []
+    cursor = 0
+    for start, end in sorted(ranges):
+        if start > cursor:
+            rendered.append(f"   ⋮ (省略第 {cursor + 1}-{start} 行)")
+        rendered.extend(f"{index + 1:>4}: {lines[index]}" for index in range(start, end))
+        cursor = end
+    if cursor < len(lines):
+        rendered.append(f"   ⋮ (省略第 {cursor + 1}-{len(lines)} 行)")
+    body = "\n".join(rendered)
+    return f"#### `{rel_path}`\n```{fence}\n{body}\n```"
+
+
+def _pack_code_blocks(
+    project_path: Path,
+    entry_paths: Sequence[Path],
+    core_paths: Sequence[Path],
+    scenario: str,
+    budget: int,
+) -> tuple[list[str], list[str]]:
+    paths = [*entry_paths, *core_paths]
+    texts = {path: _read_text(path) for path in paths}
+    skipped = {path for path, text in texts.items() if text is None}
+    paths = [path for path in paths if path not in skipped]
+    contents = {path: (texts[path] or "").splitlines() for path in paths}
+    identifiers = {path: set(_IDENTIFIER_RE.findall("\n".join(lines))) for path, lines in contents.items()}
+    terms = _scenario_terms(scenario)
+    entry_set = set(entry_paths)
+
+    remaining = budget - BUDGET_BLOCK_OVERHEAD * (len(paths) + len(skipped))
+    candidates: list[tuple[float, int, Path, int, int]] = []
+    for path, lines in contents.items():
+        external = set().union(*(names for other, names in identifiers.items() if other != path))
+        for start, end, is_header in _split_segments(lines):
+            tokens = sum(_estimate_tokens(line) + 2 for line in lines[start:end]) + BUDGET_GAP_OVERHEAD
+            score = _score_segment(lines, start, end, is_header, terms, external)
+            if path in entry_set:
+                score *= 1.5
+            candidates.append((score / max(tokens, 1), tokens, path, start, end))
+
+    selected: dict[Path, list[tuple[int, int]]] = {path: [] for path in paths}
+    for _, tokens, path, start, end in sorted(candidates, key=lambda item: -item[0]):
+        if tokens <= remaining:
+            selected[path].append((start, end))
+            remaining -= tokens
+
+    def render(group: Sequence[Path]) -> list[str]:
+        return [
+            _skipped_block(path, project_path)
+            if path in skipped
+            else _render_budget_block(path, project_path, contents[path], selected[path])
+            for path in group
+        ]
+
+    return render(entry_paths), render(core_paths)
+
+
 def _ensure_nonempty(paths: list[Path], label: str) -> str:
     if paths:
         return ""
@@ -380,28 +1307,69 @@ def build_module2_prompt(
     core_files: Sequence[str] | None,
     max_lines: int,
     ignore_pattern: str,
+    index: ProjectIndex | None = None,
+    token_budget: int | None = None,
+    core_strategy: str = DEFAULT_CORE_STRATEGY,
 ) -> str:
     ignore_names = _split_ignore(ignore_pattern)
+    graph: ImportGraph | None = None
 
     resolved_entry = _resolve_paths(project_path, entry_files)
     resolved_core = _resolve_paths(project_path, core_files)
 
-    if not resolved_entry:
-        resolved_entry = _auto_pick_entry_files(project_path, ignore_names=ignore_names)
-    if not resolved_core:
-        resolved_core = _auto_pick_core_files(project_path, ignore_names=ignore_names)
+    if not resolved_entry or not resolved_core:
+        scan_depth = max(ENTRY_SCAN_DEPTH, CORE_SCAN_DEPTH)
+
+        def auto_pick() -> dict[str, list[str]]:
+            files = _walk_files(project_path, ignore_names=ignore_names, max_depth=scan_depth, index=index)
+            root_length = len(str(project_path)) + 1
+            return {
+                "entry": [str(path) for path in _auto_pick_entry_files(project_path, files)],
+                "core": [str(path) for path in _auto_pick_core_files(project_path, files)],
+                "sources": [
+                    str(path)[root_length:]
+                    for path in files
+                    if path.suffix in GRAPH_SOURCE_SUFFIXES or path.name in GRAPH_MANIFESTS
+                ],
+            }
+
+        picked = index.memo("scan", scan_depth, auto_pick) if index else auto_pick()
+        if not resolved_entry:
+            resolved_entry = [Path(path) for path in picked["entry"]]
+        if not resolved_core and core_strategy == "graph" and resolved_entry:
+            graph = ImportGraph(project_path, picked["sources"], index)
+            resolved_core = graph.core_files(resolved_entry)
+        if not resolved_core:
+            graph = None
+            resolved_core = [Path(path) for path in picked["core"]]
 
     entry_hint = _ensure_nonempty(resolved_entry, "入口文件")
     core_hint = _ensure_nonempty(resolved_core, "核心逻辑文件")
 
-    entry_blocks = "\n\n".join(
-        _format_code_block(path, project_path=project_path, max_lines=max_lines)
-        for path in resolved_entry
-    )
-    core_blocks = "\n\n".join(
-        _format_code_block(path, project_path=project_path, max_lines=max_lines)
-        for path in resolved_core
-    )
+    def code_block(path: Path) -> str:
+        return _cached_snippet(
+            index,
+            path,
+            f"code:{max_lines}",
+            partial(_format_code_block, path, project_path=project_path, max_lines=max_lines),
+        )
+
+    def core_block(path: Path) -> str:
+        ranges = graph.focus_ranges(path, _scenario_terms(scenario)) if graph else []
+        if not ranges:
+            return code_block(path)
+        return _format_focus_block(path, project_path, ranges, max_lines)
+
+    if token_budget is None:
+        entry_blocks = "\n\n".join(code_block(path) for path in resolved_entry)
+        core_blocks = "\n\n".join(core_block(path) for path in resolved_core)
+    else:
+        overhead = _estimate_tokens(MODULE2_TEMPLATE) + _estimate_tokens(scenario)
+        packed_entry, packed_core = _pack_code_blocks(
+            project_path, resolved_entry, resolved_core, scenario, max(token_budget - overhead, 0)
+        )
+        entry_blocks = "\n\n".join(packed_entry)
+        core_blocks = "\n\n".join(packed_core)
 
     entry_blocks = "\n\n".join(filter(None, [entry_hint, entry_blocks]))
     core_blocks = "\n\n".join(filter(None, [core_hint, core_blocks]))
@@ -413,17 +1381,39 @@ def build_module2_prompt(
     )
 
 
+def _output_dir() -> Path:
+    return Path(__file__).resolve().parent / "vibe_output"
+
+
 def _default_output(project_name: str, module_name: str) -> Path:
-    base = Path(__file__).resolve().parent / "vibe_output"
+    base = _output_dir()
     base.mkdir(parents=True, exist_ok=True)
     return base / f"{project_name}_{module_name}.md"
 
 
+def _write_atomic(path: Path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=path.parent, prefix=f".{path.name}.", suffix=".tmp", delete=False
+    ) as handle:
+        handle.write(content)
+    try:
+        os.replace(handle.name, path)
+    except OSError:
+        os.unlink(handle.name)
+        raise
+
+
 def _write_output(content: str, output: Path) -> None:
     output.parent.mkdir(parents=True, exist_ok=True)
     output.write_text(content, encoding="utf-8")
 
 
+def _add_index_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--index-dir", help=f"Persistent scan index directory (default: vibe_output/{INDEX_DIRNAME})")
+    parser.add_argument("--no-index", action="store_true", help="Rescan and reread everything without the index")
+
+
 def _build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Build architecture/dataflow analysis prompts")
     subparsers = parser.add_subparsers(dest="module", required=True)
@@ -434,6 +1424,7 @@ def _build_parser() -> argparse.ArgumentParser:
     parser_m1.add_argument("--readme-lines", type=int, default=50, help="README head lines")
     parser_m1.add_argument("--ignore", default=DEFAULT_IGNORE, help="Tree ignore pattern")
     parser_m1.add_argument("--output", help="Output markdown path")
+    _add_index_arguments(parser_m1)
 
     parser_m2 = subparsers.add_parser("module2", help="Generate module2 dataflow prompt")
     parser_m2.add_argument("--project", required=True, help="Target project path")
@@ -441,8 +1432,42 @@ def _build_parser() -> argparse.ArgumentParser:
     parser_m2.add_argument("--entry", action="append", help="Entry file path (repeatable)")
     parser_m2.add_argument("--core", action="append", help="Core file path (repeatable)")
     parser_m2.add_argument("--max-lines", type=int, default=220, help="Max lines per snippet")
+    parser_m2.add_argument(
+        "--token-budget",
+        type=int,
+        help="Approximate prompt token budget; packs the most relevant code instead of --max-lines heads",
+    )
     parser_m2.add_argument("--ignore", default=DEFAULT_IGNORE, help="File scan ignore pattern")
+    parser_m2.add_argument(
+        "--core-strategy",
+        choices=CORE_STRATEGIES,
+        default=DEFAULT_CORE_STRATEGY,
+        help="Pick core files by path name hints (default), or by import-graph centrality from the entry files",
+    )
     parser_m2.add_argument("--output", help="Output markdown path")
+    _add_index_arguments(parser_m2)
+
+    parser_batch = subparsers.add_parser("batch", help="Generate prompts for many projects in parallel")
+    parser_batch.add_argument(
+        "--manifest",
+        help="JSON list / JSON lines / plain list of projects; objects may override any option per project",
+    )
+    parser_batch.add_argument("--project", action="append", help="Target project path (repeatable)")
+    parser_batch.add_argument("--modules", default="module1,module2", help="Comma separated modules to build")
+    parser_batch.add_argument("--scenario", help="Default module2 scenario")
+    parser_batch.add_argument("--entry", action="append", help="Default entry file path (repeatable)")
+    parser_batch.add_argument("--core", action="append", help="Default core file path (repeatable)")
+    parser_batch.add_argument("--max-depth", type=int, default=4, help="Tree max depth")
+    parser_batch.add_argument("--readme-lines", type=int, default=50, help="README head lines")
+    parser_batch.add_argument("--max-lines", type=int, default=220, help="Max lines per snippet")
+    parser_batch.add_argument("--token-budget", type=int, help="Approximate module2 prompt token budget")
+    parser_batch.add_argument(
+        "--core-strategy", choices=CORE_STRATEGIES, default=DEFAULT_CORE_STRATEGY, help="Core file selection"
+    )
+    parser_batch.add_argument("--ignore", default=DEFAULT_IGNORE, help="Tree / file scan ignore pattern")
+    parser_batch.add_argument("--jobs", type=int, help="Worker processes (default: CPU count)")
+    parser_batch.add_argument("--output-dir", help="Output directory (default: vibe_output)")
+    _add_index_arguments(parser_batch)
 
     return parser
 
@@ -454,32 +1479,169 @@ def _normalize_project_path(raw: str) -> Path:
     return project_path
 
 
+def _open_index(project_path: Path, options: Mapping[str, Any]) -> ProjectIndex | None:
+    if options.get("no_index"):
+        return None
+    index_dir = Path(options["index_dir"]).expanduser().resolve() if options.get("index_dir") else None
+    return ProjectIndex.open(project_path, options["ignore"], index_dir)
+
+
+def _build_module(module: str, project_path: Path, options: Mapping[str, Any], index: ProjectIndex | None) -> str:
+    if module == "module1":
+        return build_module1_prompt(
+            project_path=project_path,
+            max_depth=options["max_depth"],
+            readme_lines=options["readme_lines"],
+            ignore_pattern=options["ignore"],
+            index=index,
+        )
+    if not options.get("scenario"):
+        raise ValueError("module2 需要 scenario")
+    return build_module2_prompt(
+        project_path=project_path,
+        scenario=options["scenario"],
+        entry_files=options.get("entry"),
+        core_files=options.get("core"),
+        max_lines=options["max_lines"],
+        ignore_pattern=options["ignore"],
+        index=index,
+        token_budget=options.get("token_budget"),
+        core_strategy=options.get("core_strategy", DEFAULT_CORE_STRATEGY),
+    )
+
+
+def _run_batch_job(job: dict[str, Any]) -> dict[str, Any]:
+    started = time.perf_counter()
+    result: dict[str, Any] = {"project": job["project"], "outputs": [], "timings": {}, "errors": {}}
+    try:
+        project_path = _normalize_project_path(job["project"])
+        index = _open_index(project_path, job)
+    except (OSError, ValueError) as exc:
+        result["errors"]["project"] = str(exc)
+        result["total"] = time.perf_counter() - started
+        return result
+
+    for module in job["modules"]:
+        module_started = time.perf_counter()
+        try:
+            content = _build_module(module, project_path, job, index)
+            output = Path(job["output_dir"]) / f"{job['stem']}_{BATCH_FILENAMES[module]}.md"
+            _write_atomic(output, content)
+            result["outputs"].append(str(output))
+        except Exception as exc:
+            result["errors"][module] = f"{type(exc).__name__}: {exc}"
+        result["timings"][module] = time.perf_counter() - module_started
+
+    if index is not None:
+        try:
+            index.save()
+        except OSError as exc:
+            result["errors"]["index"] = str(exc)
+    result["total"] = time.perf_counter() - started
+    return result
+
+
+def _load_manifest(path: Path) -> list[dict[str, Any]]:
+    text = path.read_text(encoding="utf-8")
+    stripped = text.lstrip()
+    if stripped.startswith("[") or stripped.startswith("{"):
+        try:
+            parsed = json.loads(text)
+        except json.JSONDecodeError:
+            parsed = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        parsed = [line.strip() for line in text.splitlines() if line.strip() and not line.lstrip().startswith("#")]
+    if isinstance(parsed, dict):
+        parsed = parsed.get("projects", [])
+    return [{"project": item} if isinstance(item, str) else dict(item) for item in parsed]
+
+
+def _batch_jobs(args: argparse.Namespace) -> list[dict[str, Any]]:
+    items = _load_manifest(Path(args.manifest).expanduser()) if args.manifest else []
+    items.extend({"project": project} for project in args.project or [])
+    if not items:
+        raise ValueError("batch 需要 --manifest 或 --project")
+
+    defaults = {key: getattr(args, key) for key in BATCH_OPTION_KEYS}
+    defaults["modules"] = [module.strip() for module in args.modules.split(",") if module.strip()]
+    output_dir = Path(args.output_dir).expanduser().resolve() if args.output_dir else _output_dir()
+
+    jobs: list[dict[str, Any]] = []
+    for item in items:
+        job = {**defaults, **{key: value for key, value in item.items() if value is not None}}
+        if isinstance(job["modules"], str):
+            job["modules"] = [module.strip() for module in job["modules"].split(",") if module.strip()]
+        unknown = set(job["modules"]) - set(BATCH_FILENAMES)
+        if unknown:
+            raise ValueError(f"未知模块: {', '.join(sorted(unknown))}")
+        job["project"] = str(Path(job["project"]).expanduser().resolve())
+        job["output_dir"] = str(output_dir)
+        jobs.append(job)
+
+    names: dict[str, int] = {}
+    for job in jobs:
+        name = Path(job["project"]).name
+        names[name] = names.get(name, 0) + 1
+    for job in jobs:
+        name = Path(job["project"]).name
+        if names[name] > 1:
+            name = f"{name}-{hashlib.sha1(job['project'].encode('utf-8')).hexdigest()[:8]}"
+        job.setdefault("stem", name)
+    return jobs
+
+
+def _print_batch_summary(results: Sequence[dict[str, Any]], modules: Sequence[str], elapsed: float) -> None:
+    width = max([len("project"), *(len(Path(result["project"]).name) for result in results)])
+    header = f"{'project':<{width}}" + "".join(f"{module:>10}" for module in modules) + f"{'total':>10}  status"
+    print(header)
+    print("-" * len(header))
+    for result in sorted(results, key=lambda item: -item.get("total", 0.0)):
+        timings = "".join(
+            f"{result['timings'][module]:>9.2f}s" if module in result["timings"] else f"{'-':>10}" for module in modules
+        )
+        status = "ok" if not result["errors"] else "; ".join(f"{key}: {value}" for key, value in result["errors"].items())
+        print(f"{Path(result['project']).name:<{width}}{timings}{result.get('total', 0.0):>9.2f}s  {status}")
+    generated = sum(len(result["outputs"]) for result in results)
+    failed = sum(1 for result in results if result["errors"])
+    print(f"\n✅ {generated} prompts generated for {len(results)} projects in {elapsed:.2f}s ({failed} failed)")
+
+
+def _run_batch(args: argparse.Namespace) -> int:
+    jobs = _batch_jobs(args)
+    workers = max(1, min(args.jobs or os.cpu_count() or 1, len(jobs)))
+    started = time.perf_counter()
+    results: list[dict[str, Any]] = []
+
+    if workers == 1:
+        results = [_run_batch_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_run_batch_job, job) for job in jobs]
+            for future in as_completed(futures):
+                results.append(future.result())
+
+    modules = list(dict.fromkeys(module for job in jobs for module in job["modules"]))
+    _print_batch_summary(results, modules, time.perf_counter() - started)
+    return 1 if any(result["errors"] for result in results) else 0
+
+
 def main(argv: Sequence[str] | None = None) -> int:
     parser = _build_parser()
     args = parser.parse_args(argv)
 
+    if args.module == "batch":
+        return _run_batch(args)
+
     project_path = _normalize_project_path(args.project)
     project_name = project_path.name
 
-    if args.module == "module1":
-        content = build_module1_prompt(
-            project_path=project_path,
-            max_depth=args.max_depth,
-            readme_lines=args.readme_lines,
-            ignore_pattern=args.ignore,
-        )
-        output = Path(args.output).expanduser().resolve() if args.output else _default_output(project_name, MODULE1_FILENAME)
-    else:
-        content = build_module2_prompt(
-            project_path=project_path,
-            scenario=args.scenario,
-            entry_files=args.entry,
-            core_files=args.core,
-            max_lines=args.max_lines,
-            ignore_pattern=args.ignore,
-        )
-        output = Path(args.output).expanduser().resolve() if args.output else _default_output(project_name, MODULE2_FILENAME)
+    index = _open_index(project_path, vars(args))
+    content = _build_module(args.module, project_path, vars(args), index)
+    filename = MODULE1_FILENAME if args.module == "module1" else MODULE2_FILENAME
+    output = Path(args.output).expanduser().resolve() if args.output else _default_output(project_name, filename)
 
+    if index is not None:
+        index.save()
     _write_output(content, output)
     print(f"✅ Prompt generated: {output}")
     return 0
@@ -0,0 +1,235 @@
+import asyncio  # 扫描与构建放到线程池，避免阻塞事件循环
+import hashlib  # 生成缓存 key
+import json  # 序列化 key 的组成部分
+import logging  # 结构化日志
+import os  # 读取配置
+import threading  # LRU 缓存可能被多个线程访问
+import time  # TTL 与构建耗时
+from collections import OrderedDict  # LRU 顺序
+from pathlib import Path  # 项目路径校验
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple  # 类型注解
+
+from fastapi import APIRouter, HTTPException  # FastAPI 路由与标准异常
+from pydantic import BaseModel, Field  # 请求 / 响应结构
+
+from .metrics import stage_timer  # 指纹计算与构建的阶段耗时
+from .project_analysis_prompt_builder import (  # 复用 CLI 的构建逻辑与磁盘索引
+    CORE_SCAN_DEPTH,
+    DEFAULT_CORE_STRATEGY,
+    DEFAULT_IGNORE,
+    ENTRY_SCAN_DEPTH,
+    ProjectIndex,
+    build_module1_prompt,
+    build_module2_prompt,
+)
+from .settings import VIBE_DATA_DIR  # 索引的默认目录
+from .single_flight import SingleFlight  # 相同参数的并发构建只执行一次
+
+# 项目分析提示词服务：把 build_module1_prompt / build_module2_prompt 暴露为 HTTP 接口，
+# 看板按需获取提示词，不再调用 CLI 再读回 vibe_output/ 下的文件
+# 结果按 项目路径 + 参数 + 目录指纹 缓存：目录结构变化（增删文件）后自然失效，文件内容的修改靠 TTL 兜底
+# 目录指纹依赖磁盘索引（每个目录一次 stat），扫描与构建都在线程池中执行
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# 允许扫描的根目录（os.pathsep 分隔）；未配置时不限制，部署到共享环境时务必配置
+PROMPT_PROJECT_ROOTS = [
+    Path(root).expanduser().resolve() for root in os.getenv("PROMPT_PROJECT_ROOTS", "").split(os.pathsep) if root
+]
+# 磁盘索引目录；默认放在数据目录下，不写进 vibe/ 源码目录
+PROMPT_INDEX_DIR = Path(os.getenv("PROMPT_INDEX_DIR") or VIBE_DATA_DIR / "prompt_index").expanduser()
+PROMPT_CACHE_TTL = float(os.getenv("PROMPT_CACHE_TTL", "600"))  # 缓存有效期（秒），兜底文件内容的修改
+PROMPT_CACHE_MAX_ENTRIES = int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", "256"))  # 缓存条目上限
+PROMPT_BUILD_CONCURRENCY = int(os.getenv("PROMPT_BUILD_CONCURRENCY", "4"))  # 同时执行的构建数，扫描大仓库很吃 I/O
+
+if not PROMPT_PROJECT_ROOTS:
+    logger.warning("未配置 PROMPT_PROJECT_ROOTS，提示词接口可读取服务进程有权限访问的任意目录")
+
+
+class Module1PromptRequest(BaseModel):
+    project: str  # 项目目录（服务所在机器上的路径）
+    max_depth: int = Field(default=4, ge=1, le=12)  # 目录树深度
+    readme_lines: int = Field(default=50, ge=1, le=2000)  # README 截取行数
+    ignore: str = DEFAULT_IGNORE  # 忽略的目录 / 文件名，| 分隔
+    refresh: bool = False  # 跳过缓存强制重建
+
+
+class Module2PromptRequest(BaseModel):
+    project: str
+    scenario: str = Field(min_length=1)  # 要分析的业务场景
+    entry: List[str] = []  # 手动指定入口文件（相对项目或绝对路径），为空时自动识别
+    core: List[str] = []  # 手动指定核心文件；为空时按路径名提示自动选取，core_strategy="graph" 时才改用导入图排序
+    max_lines: int = Field(default=220, ge=1, le=5000)  # 每个文件的最大行数
+    token_budget: Optional[int] = Field(default=None, ge=500)  # 提示词的近似 token 预算
+    core_strategy: Literal["hints", "graph"] = DEFAULT_CORE_STRATEGY  # 核心文件的选取方式，默认按路径名提示
+    ignore: str = DEFAULT_IGNORE
+    refresh: bool = False
+
+
+class PromptResponse(BaseModel):
+    module: str
+    project: str
+    prompt: str
+    fingerprint: str  # 构建时的目录指纹
+    cached: bool  # 是否直接命中缓存
+    build_ms: float  # 本次请求的耗时（命中缓存时只包含指纹计算）
+
+
+class PromptCache:
+    def __init__(self, max_entries: int = PROMPT_CACHE_MAX_ENTRIES, ttl: float = PROMPT_CACHE_TTL) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()  # key -> (过期时间, 提示词)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+prompt_cache = PromptCache()
+_flight: SingleFlight[str] = SingleFlight()
+_build_slots = asyncio.Semaphore(max(1, PROMPT_BUILD_CONCURRENCY))
+
+
+def _resolve_project(raw: str) -> Path:
+    project_path = Path(raw).expanduser().resolve()
+    if PROMPT_PROJECT_ROOTS and not any(project_path.is_relative_to(root) for root in PROMPT_PROJECT_ROOTS):
+        raise HTTPException(status_code=403, detail="项目路径不在 PROMPT_PROJECT_ROOTS 允许的范围内")
+    if not project_path.is_dir():
+        raise HTTPException(status_code=404, detail=f"项目路径不存在或不是目录: {project_path}")
+    return project_path
+
+
+def _check_within(project_path: Path, paths: List[str]) -> None:
+    # 手动指定的文件必须在项目目录内，避免借助绝对路径或 .. 读取任意文件
+    for raw in paths:
+        candidate = (project_path / Path(raw).expanduser()).resolve()
+        if not candidate.is_relative_to(project_path):
+            raise HTTPException(status_code=400, detail=f"文件不在项目目录内: {raw}")
+
+
+def _open_with_fingerprint(project_path: Path, ignore: str, depth: int) -> Tuple[ProjectIndex, str]:
+    # 每次请求都打开新的索引实例：实例内的指纹会被记住，长期持有会看不到目录变化
+    index = ProjectIndex.open(project_path, ignore, PROMPT_INDEX_DIR)
+    return index, index.fingerprint(depth)
+
+
+def _build_and_save(build: Callable[[ProjectIndex], str], index: ProjectIndex) -> str:
+    prompt = build(index)
+    try:
+        index.save()
+    except OSError as exc:
+        logger.warning("保存项目索引失败", extra={"project": str(index.project_path), "error": str(exc)})
+    return prompt
+
+
+async def _serve(
+    module: str,
+    raw_project: str,
+    options: Dict[str, Any],
+    depth: int,
+    refresh: bool,
+    build: Callable[[Path, ProjectIndex], str],
+) -> PromptResponse:
+    started = time.perf_counter()
+    project_path = _resolve_project(raw_project)
+    _check_within(project_path, [*options.get("entry", []), *options.get("core", [])])
+    with stage_timer("prompt", "fingerprint"):
+        index, fingerprint = await asyncio.to_thread(_open_with_fingerprint, project_path, options["ignore"], depth)
+
+    payload = json.dumps([module, str(project_path), options, fingerprint], ensure_ascii=False, sort_keys=True)
+    key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    prompt = None if refresh else prompt_cache.get(key)
+    cached = prompt is not None
+
+    if prompt is None:
+
+        async def run() -> str:
+            async with _build_slots:
+                with stage_timer("prompt", module):
+                    result = await asyncio.to_thread(_build_and_save, lambda idx: build(project_path, idx), index)
+            prompt_cache.set(key, result)
+            return result
+
+        # refresh 的请求不与普通请求合并，避免拿到正在构建的旧结果
+        prompt = await (_flight.do(f"{key}:refresh", run) if refresh else _flight.do(key, run))
+
+    return PromptResponse(
+        module=module,
+        project=str(project_path),
+        prompt=prompt,
+        fingerprint=fingerprint,
+        cached=cached,
+        build_ms=round((time.perf_counter() - started) * 1000, 1),
+    )
+
+
+@router.post("/api/vibe/prompts/module1", response_model=PromptResponse)
+async def module1_prompt(request: Module1PromptRequest):
+    options = request.model_dump(exclude={"project", "refresh"})
+
+    def build(project_path: Path, index: ProjectIndex) -> str:
+        return build_module1_prompt(
+            project_path=project_path,
+            max_depth=request.max_depth,
+            readme_lines=request.readme_lines,
+            ignore_pattern=request.ignore,
+            index=index,
+        )
+
+    # 目录树会列出第 max_depth 层目录的文件数与大小，指纹多覆盖一层，这些目录里增删文件时缓存随之失效
+    return await _serve("module1", request.project, options, request.max_depth + 1, request.refresh, build)
+
+
+@router.post("/api/vibe/prompts/module2", response_model=PromptResponse)
+async def module2_prompt(request: Module2PromptRequest):
+    options = request.model_dump(exclude={"project", "refresh"})
+
+    def build(project_path: Path, index: ProjectIndex) -> str:
+        return build_module2_prompt(
+            project_path=project_path,
+            scenario=request.scenario,
+            entry_files=request.entry,
+            core_files=request.core,
+            max_lines=request.max_lines,
+            ignore_pattern=request.ignore,
+            index=index,
+            token_budget=request.token_budget,
+            core_strategy=request.core_strategy,
+        )
+
+    depth = max(ENTRY_SCAN_DEPTH, CORE_SCAN_DEPTH)
+    return await _serve("module2", request.project, options, depth, request.refresh, build)
+
+
+@router.get("/api/vibe/prompts/stats")
+async def prompt_stats():
+    return {"cache": prompt_cache.stats(), "single_flight": _flight.stats()}
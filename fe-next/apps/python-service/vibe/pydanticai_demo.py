@@ -3,7 +3,8 @@
     "text": "分析这段社交媒体文案",
     "image_urls": ["https://example.com/promo.png"],
     "image_sources": ["/path/to/local.png"],
-    "image_base64": ["data:image/png;base64,iVBORw0KGgo..."]
+    "image_base64": ["data:image/png;base64,iVBORw0KGgo..."],
+    "model": "auto"
 }
 
 JSON Response (200):
@@ -15,7 +16,8 @@ JSON Response (200):
     "pain_points": ["价格略高", "等待配送"],
     "gain_points": ["限时折扣", "赠品丰富"],
     "marketing_suspicion": "中",
-    "verdict": "买入"
+    "verdict": "买入",
+    "confidence": 0.82
 }
 
 JSON Response (400):
@@ -24,45 +26,79 @@ JSON Response (400):
 JSON Response (500):
 {"detail": "缺少 DASHSCOPE_API_KEY 环境变量"}
 
+JSON Response (429/503 - 上游限流或熔断，响应头带 Retry-After):
+{"detail": "上游服务暂时不可用（熔断中），请稍后重试"}
+
 Curl Command:
 curl -X POST http://localhost:8000/api/vibe/pydanticai/sentiment \\
   -H \"Content-Type: application/json\" \\
   -d '{\"text\":\"分析这段社交媒体文案\",\"image_urls\":[\"https://example.com/promo.png\"]}'
+
+Batch JSON Request (POST /api/vibe/pydanticai/sentiment/batch):
+{
+    "items": [
+        {"text": "帖子一", "image_urls": ["https://example.com/promo.png"]},
+        {"text": "帖子二", "image_urls": ["https://example.com/promo.png", "https://example.com/404.png"]}
+    ],
+    "max_concurrency": 4
+}
+
+Batch JSON Response (200，单条失败不影响整批):
+{
+    "results": [
+        {"index": 0, "result": {"summary": "…", "sentiment_score": 8.6, "...": "..."}, "error": null},
+        {"index": 1, "result": null, "error": "图片获取失败: https://example.com/404.png -> 404 Client Error: Not Found for url: https://example.com/404.png"}
+    ],
+    "succeeded": 1,
+    "failed": 1
+}
+
+Job Request (POST /api/vibe/pydanticai/sentiment/jobs，请求体与单条接口一致):
+{"text": "分析这段社交媒体文案", "image_urls": ["https://example.com/promo.png"]}
+
+Job Response (202):
+{"job_id": "3f2a…", "status": "queued", "result": null, "error": null, "attempts": 0, "created_at": 1760000000.0, "updated_at": 1760000000.0}
+
+轮询 GET /api/vibe/pydanticai/sentiment/jobs/{job_id}?wait=10，结束后 status 为 succeeded（result 为分析结果）或 failed（error 为原因）；
+订阅 GET /api/vibe/pydanticai/sentiment/jobs/{job_id}/events?stream=sse，每次状态变化推送一条事件。
 """
+import asyncio  # 批量请求的并发控制
+import logging  # 结构化日志
 import os  # 读取环境变量（API Key、Base URL 等配置）
-from typing import List  # 类型注解：列表
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union  # 类型注解
 
-from fastapi import APIRouter, HTTPException  # FastAPI 路由与标准异常
-from openai import AsyncOpenAI  # OpenAI 官方 async 客户端（兼容 DashScope OpenAI 模式）
+from fastapi import APIRouter, HTTPException, Query  # FastAPI 路由、标准异常与查询参数校验
 from pydantic import BaseModel, Field  # Pydantic 数据模型与字段校验
-from pydantic_ai import Agent  # Pydantic AI 的核心 Agent 抽象
 from pydantic_ai.messages import BinaryContent  # 用于携带图片等二进制内容的消息格式
-from pydantic_ai.models.openai import OpenAIChatModel  # 封装 OpenAI Chat 接口的模型定义
-from pydantic_ai.providers.openai import OpenAIProvider  # 适配 OpenAI 协议的 Provider（可替换后端）
 
-from .image_utils import decode_base64_image, load_image_from_source  # 本地工具函数，处理图片下载与 Base64
+from .image_cache import image_cache  # 图片缓存，暴露命中率等指标
+from .image_loader import LoadedImage, image_loader  # 异步图片加载器，共享连接池并发下载
+from .image_preprocess import IMAGE_PREPROCESS_ENABLED, image_preprocessor  # 可选的缩放/重压缩阶段
+from .image_utils import load_base64_image  # 本地工具函数，处理 Base64 解码
+from .job_queue import job_queue  # 持久化任务队列，长耗时分析改为提交 + 轮询/订阅
+from .metrics import stage_timer  # 各阶段耗时（Prometheus）
+from .model_router import RoutingMode  # flash / plus 自适应路由
+from .resources import DASHSCOPE_API_KEY, resources  # 进程级共享的 DashScope 客户端与 Agent
+from .result_cache import result_cache_key, sentiment_cache  # 分析结果缓存，重复帖子不再调用模型
+from .schemas import SentimentAnalysis  # 两条链路共用的输出结构
+from .single_flight import SingleFlight  # 相同请求在途时合并为一次上游调用
+from .streaming import StreamFormat, stream_events  # NDJSON / SSE 流式响应
+from .upstream import UpstreamRejected, dashscope_governor  # 上游限流、重试与熔断
 
 # 创建 FastAPI 路由器，挂载接口路径
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-# 从环境变量读取达摩盘（DashScope）兼容的 OpenAI Key 与 Base URL
-DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
-DASHSCOPE_COMPAT_BASE_URL = os.getenv(
-    "DASHSCOPE_COMPAT_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"
-)
-
-# 提前提醒缺少 Key，方便部署时排查
-if not DASHSCOPE_API_KEY:
-    print("警告: 未找到 DASHSCOPE_API_KEY 环境变量")
-
-# 初始化异步 OpenAI 客户端，底层走 DashScope 兼容模式
-dashscope_client = AsyncOpenAI(
-    api_key=DASHSCOPE_API_KEY,
-    base_url=DASHSCOPE_COMPAT_BASE_URL,
-)
-# 将客户端包装成 Provider，便于在 Pydantic AI 的 Agent 中注入
-dashscope_provider = OpenAIProvider(openai_client=dashscope_client)
+# 相同 cache_key 的在途分析只调用一次模型（单条与批量接口共用）
+_analysis_flights: SingleFlight[SentimentAnalysis] = SingleFlight()
 
+# 批量接口：单批条数上限与同时在途的模型调用数（请求里可再调低）
+PYDANTICAI_BATCH_MAX_ITEMS = int(os.getenv("PYDANTICAI_BATCH_MAX_ITEMS", "100"))
+PYDANTICAI_BATCH_CONCURRENCY = int(os.getenv("PYDANTICAI_BATCH_CONCURRENCY", "8"))
+# 流式模式下推送部分结果的最小间隔（秒），避免每个 token 都推一次
+PYDANTICAI_STREAM_DEBOUNCE = float(os.getenv("PYDANTICAI_STREAM_DEBOUNCE", "0.2"))
+# 任务查询接口长轮询（?wait=）的最长等待时间（秒）
+PYDANTICAI_JOB_MAX_WAIT = float(os.getenv("PYDANTICAI_JOB_MAX_WAIT", "30"))
 
 class PydanticAISentimentRequest(BaseModel):
     text: str  # 输入的用户文本
@@ -72,98 +108,333 @@ class PydanticAISentimentRequest(BaseModel):
     image_sources: List[str] = []
     # 已经准备好的 Base64 或 data URI，直接解码
     image_base64: List[str] = []
+    # 发送前是否缩放/重压缩图片；不传时使用部署默认（IMAGE_PREPROCESS_ENABLED）
+    preprocess: Optional[bool] = None
+    # 模型路由：auto 按策略在 flash/plus 间选择与升级；不传时使用部署默认（SENTIMENT_ROUTING_MODE）
+    model: Optional[RoutingMode] = None
 
 
-class SentimentAnalysis(BaseModel):
-    # 输出的情绪/商业分析结构
-    summary: str  # 总结
-    sentiment_score: float = Field(ge=0, le=10)  # 0-10 的情绪得分，使用 Field 校验范围
-    sentiment_keywords: List[str]  # 关键词
-    user_persona: str  # 用户画像
-    pain_points: List[str]  # 痛点
-    gain_points: List[str]  # 亮点/收获点
-    marketing_suspicion: str  # 是否有营销嫌疑
-    verdict: str  # 结论
-
-
-# 构造一个 Pydantic AI Agent，绑定模型、系统提示和输出 Schema
-sentiment_agent_flash = Agent(
-    model=OpenAIChatModel(
-        "qwen3-vl-flash", provider=dashscope_provider
-    ),  # 选用通义千问多模态版本
-    system_prompt=(
-        "你是一名专业的消费市场分析师。综合文本与可访问的图片链接，给出简洁的商业价值分析。"
-        "直接输出 JSON，字段需满足定义的 Pydantic Schema。"
-    ),
-    output_type=SentimentAnalysis,  # 要求返回的结构体类型，Agent 会自动校验/解析
-)
-sentiment_agent_plus = Agent(
-    model=OpenAIChatModel(
-        "qwen3-vl-plus", provider=dashscope_provider
-    ),  # 选用通义千问多模态版本
-    system_prompt=(
-        "你是一名专业的消费市场分析师。综合文本与可访问的图片链接，给出简洁的商业价值分析。"
-        "直接输出 JSON，字段需满足定义的 Pydantic Schema。"
-    ),
-    output_type=SentimentAnalysis,  # 要求返回的结构体类型，Agent 会自动校验/解析
-)
-
-def _gather_images(request: PydanticAISentimentRequest) -> List[BinaryContent]:
+class SentimentJob(BaseModel):
+    job_id: str
+    status: str  # queued / running / succeeded / failed
+    result: Optional[SentimentAnalysis] = None  # succeeded 时的分析结果
+    error: Optional[str] = None  # failed 时的原因；排队重试中时为上一次失败的原因
+    attempts: int = 0  # 已执行次数（含被限流后重新排队的次数）
+    created_at: float
+    updated_at: float
+
+
+class PydanticAIBatchSentimentRequest(BaseModel):
+    items: List[PydanticAISentimentRequest] = Field(min_length=1)  # 多条帖子，格式与单条接口一致
+    max_concurrency: Optional[int] = Field(default=None, ge=1)  # 本批并行度，不超过部署上限
+
+
+class BatchItemResult(BaseModel):
+    index: int  # 对应 items 中的下标
+    result: Optional[SentimentAnalysis] = None  # 成功时的分析结果
+    error: Optional[str] = None  # 失败原因（图片获取失败 / 模型调用失败等）
+
+
+class PydanticAIBatchSentimentResponse(BaseModel):
+    results: List[BatchItemResult]  # 与 items 顺序一致
+    succeeded: int
+    failed: int
+
+
+async def _load_sources(sources: List[str]) -> Dict[str, Union[LoadedImage, Exception]]:
+    # 相同来源只下载一次：批量请求中多条帖子共享的海报/CDN 图片在这里去重
+    unique = list(dict.fromkeys(sources))
+    loaded = await image_loader.load_many(unique)
+    return dict(zip(unique, loaded))
+
+
+async def _collect_images(
+    request: PydanticAISentimentRequest, loaded: Dict[str, Union[LoadedImage, Exception]]
+) -> Tuple[List[BinaryContent], List[str], List[str]]:
     binaries: List[BinaryContent] = []  # 收集整理后的图片二进制
+    digests: List[str] = []  # 与 binaries 一一对应的内容哈希，用于结果缓存 key
     errors: List[str] = []  # 记录处理过程中出现的错误
 
-    def add_image(data: bytes, media_type: str, identifier: str) -> None:
+    def add_image(data: bytes, media_type: str, identifier: str, digest: str) -> None:
         # BinaryContent 是 Pydantic AI 传递图像的载体，包含二进制、MIME、标识符
         binaries.append(BinaryContent(data=data, media_type=media_type, identifier=identifier))
+        digests.append(digest)
 
-    # 先处理 URL 和本地路径：统一读成二进制
+    # 先处理 URL 和本地路径：取已并发加载好的结果，顺序与输入一致
     for src in [*request.image_urls, *request.image_sources]:
-        try:
-            data, media_type = load_image_from_source(src)  # 根据来源自动下载/读取文件
-            add_image(data, media_type, src)
-        except Exception as exc:  # noqa: BLE001 - 保留广泛捕获，记录后统一返回
-            errors.append(f"图片获取失败: {src} -> {exc}")
+        item = loaded[src]
+        if isinstance(item, Exception):  # 单张失败不影响其他图片，记录后统一返回
+            errors.append(f"图片获取失败: {src} -> {item}")
+        else:
+            add_image(item.data, item.media_type, src, item.digest)
 
-    # 再处理直接传入的 Base64 / data URI
-    for idx, b64 in enumerate(request.image_base64):
-        try:
-            data, media_type = decode_base64_image(b64)  # 解码并拿到 MIME
-            add_image(data, media_type, f"base64-{idx}")
-        except Exception as exc:  # noqa: BLE001
-            errors.append(f"base64 解析失败: index {idx} -> {exc}")
+    # 再处理直接传入的 Base64 / data URI：解码、哈希与缓存可能的读写盘都放到线程池
+    decoded_all = await asyncio.gather(
+        *(asyncio.to_thread(load_base64_image, b64) for b64 in request.image_base64), return_exceptions=True
+    )
+    for idx, decoded in enumerate(decoded_all):
+        if isinstance(decoded, Exception):
+            errors.append(f"base64 解析失败: index {idx} -> {decoded}")
+        else:
+            add_image(decoded.data, decoded.media_type, f"base64-{idx}", decoded.digest)
+
+    return binaries, digests, errors
+
+
+async def _preprocess_images(
+    request: PydanticAISentimentRequest, binaries: List[BinaryContent], digests: List[str]
+) -> List[BinaryContent]:
+    enabled = IMAGE_PREPROCESS_ENABLED if request.preprocess is None else request.preprocess
+    if not enabled or not binaries:
+        return binaries
+    # 各图片并行进入进程池；digest 仍是原图哈希，结果缓存 key 不受预处理参数影响
+    processed = await asyncio.gather(
+        *(image_preprocessor.process(b.data, b.media_type, d) for b, d in zip(binaries, digests))
+    )
+    return [
+        BinaryContent(data=data, media_type=media_type, identifier=b.identifier)
+        for (data, media_type), b in zip(processed, binaries)
+    ]
+
+
+async def _gather_images(request: PydanticAISentimentRequest) -> Tuple[List[BinaryContent], List[str]]:
+    async with stage_timer("pydanticai", "image_fetch"):
+        loaded = await _load_sources([*request.image_urls, *request.image_sources])
+    async with stage_timer("pydanticai", "image_decode"):  # base64 解码与 BinaryContent 组装
+        binaries, digests, errors = await _collect_images(request, loaded)
 
     # 若有任何错误，统一抛出 400，提示前端具体原因
     if errors:
         raise HTTPException(status_code=400, detail="; ".join(errors))
 
-    return binaries
+    async with stage_timer("pydanticai", "image_preprocess"):
+        binaries = await _preprocess_images(request, binaries, digests)
+    return binaries, digests
 
 
-@router.post("/api/vibe/pydanticai/sentiment")
-async def analyze_sentiment_with_pydantic_ai(request: PydanticAISentimentRequest):
-    # 运行时再次校验 Key，防止启动时缺失、热更新等导致的问题
-    if not DASHSCOPE_API_KEY:
-        raise HTTPException(status_code=500, detail="缺少 DASHSCOPE_API_KEY 环境变量")
-
-    binary_images = _gather_images(request)  # 整理所有图片为 BinaryContent 列表
-
+def _build_user_message(text: str, binary_images: List[BinaryContent]) -> List[Union[str, BinaryContent]]:
     # 构造用户消息：文本 + 图片数量提示，要求直接返回 JSON
     prompt = (
         "用户文本：\n"
-        f"{request.text}\n\n"
+        f"{text}\n\n"
         f"图片数量：{len(binary_images)}\n"
         "请按 JSON 返回，不要使用 Markdown 代码块。"
     )
+    return [prompt, *binary_images]  # Pydantic AI 支持消息数组，包含字符串与 BinaryContent
+
+
+async def _analyze(
+    request: PydanticAISentimentRequest, binary_images: List[BinaryContent], image_digests: List[str]
+) -> SentimentAnalysis:
+    policy = resources.model_router.resolve(request.model)
+    # 同一帖子（归一化文本 + 图片内容 + 路由方式）重复提交时直接返回缓存结果
+    cache_key = result_cache_key(resources.model_router.cache_label(policy), request.text, image_digests)
+    async with stage_timer("pydanticai", "cache_lookup"):
+        cached = await sentiment_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    async def call_model() -> SentimentAnalysis:
+        async with stage_timer("pydanticai", "model"):  # 含结构化解析、校验重试与 flash -> plus 升级
+            output = await resources.model_router.run(
+                _build_user_message(request.text, binary_images),
+                text=request.text,
+                image_count=len(binary_images),
+                policy=policy,
+            )  # 按路由策略调用 Agent，自动完成模型推理与结构化解析
+        await sentiment_cache.set(cache_key, output)
+        return output  # 输出已经符合 Pydantic Schema 的数据
+
+    # 缓存未命中但同一帖子正在分析中时，等待那一次调用的结果
+    return await _analysis_flights.do(cache_key, call_model)
 
-    user_message = [prompt, *binary_images]  # Pydantic AI 支持消息数组，包含字符串与 BinaryContent
 
+async def _analyze_stream(
+    request: PydanticAISentimentRequest, binary_images: List[BinaryContent], image_digests: List[str]
+) -> AsyncIterator[Dict[str, Any]]:
+    policy = resources.model_router.resolve(request.model)
+    cache_key = result_cache_key(resources.model_router.cache_label(policy), request.text, image_digests)
+    cached = await sentiment_cache.get(cache_key)
+    if cached is not None:
+        yield {"type": "result", "data": cached}
+        return
+
+    async for event in resources.model_router.run_stream(
+        _build_user_message(request.text, binary_images),
+        text=request.text,
+        image_count=len(binary_images),
+        policy=policy,
+        debounce=PYDANTICAI_STREAM_DEBOUNCE,
+    ):
+        if event["type"] == "result":
+            await sentiment_cache.set(cache_key, event["data"])
+        yield event
+
+
+def _ensure_upstream_available() -> None:
+    # 熔断中时直接返回 503，不再下载图片、排队等待
     try:
-        result = await sentiment_agent_flash.run(
-            user_message
-        )  # 调用 Agent，自动完成模型推理与结构化解析
-        return result.output  # 输出已经符合 Pydantic Schema 的数据
+        dashscope_governor.ensure_available()
+    except UpstreamRejected as exc:
+        raise exc.to_http_exception()
+
+
+@router.post("/api/vibe/pydanticai/sentiment")
+async def analyze_sentiment_with_pydantic_ai(
+    request: PydanticAISentimentRequest, stream: Optional[StreamFormat] = None
+):
+    # 运行时再次校验 Key，防止启动时缺失、热更新等导致的问题
+    if not DASHSCOPE_API_KEY:
+        raise HTTPException(status_code=500, detail="缺少 DASHSCOPE_API_KEY 环境变量")
+
+    _ensure_upstream_available()
+    binary_images, image_digests = await _gather_images(request)  # 整理所有图片为 BinaryContent 列表
+
+    if stream:  # ?stream=ndjson|sse：图片校验仍以 400 返回，之后逐条推送部分结果
+        return stream_events(_analyze_stream(request, binary_images, image_digests), stream)
+
+    try:
+        return await _analyze(request, binary_images, image_digests)
     except HTTPException:
         raise  # 已经是 HTTPException 的直接透传
+    except UpstreamRejected as exc:
+        logger.warning("pydanticai 上游调用被拒绝", extra={"status": exc.status_code, "retry_after": exc.retry_after})
+        raise exc.to_http_exception()  # 429/503 + Retry-After，提示客户端退避而不是立即重试
     except Exception as exc:  # noqa: BLE001
-        print(f"pydanticai 调用失败: {exc}")  # 打印日志便于排查
+        logger.exception("pydanticai 调用失败")  # 记录异常堆栈便于排查
         raise HTTPException(status_code=500, detail=str(exc))
+
+
+async def _run_batch_item(
+    index: int,
+    item: PydanticAISentimentRequest,
+    loaded: Dict[str, Union[LoadedImage, Exception]],
+    slots: asyncio.Semaphore,
+) -> BatchItemResult:
+    async with stage_timer("pydanticai", "image_decode"):
+        binaries, digests, errors = await _collect_images(item, loaded)
+    if errors:  # 图片问题只影响当前这一条，不拖垮整批
+        return BatchItemResult(index=index, error="; ".join(errors))
+    async with stage_timer("pydanticai", "image_preprocess"):
+        binaries = await _preprocess_images(item, binaries, digests)
+    async with slots:
+        try:
+            return BatchItemResult(index=index, result=await _analyze(item, binaries, digests))
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("pydanticai 批量调用失败", extra={"index": index, "error": str(exc)})
+            return BatchItemResult(index=index, error=str(exc))
+
+
+async def _batch_item_tasks(request: PydanticAIBatchSentimentRequest) -> List["asyncio.Task[BatchItemResult]"]:
+    # 整批图片先去重并发加载一次，后续各条帖子直接取用
+    async with stage_timer("pydanticai", "image_fetch"):
+        loaded = await _load_sources(
+            [src for item in request.items for src in (*item.image_urls, *item.image_sources)]
+        )
+
+    # 请求可以调低并行度，但不能超过部署上限
+    parallelism = min(request.max_concurrency or PYDANTICAI_BATCH_CONCURRENCY, PYDANTICAI_BATCH_CONCURRENCY)
+    slots = asyncio.Semaphore(parallelism)
+    return [
+        asyncio.ensure_future(_run_batch_item(idx, item, loaded, slots))
+        for idx, item in enumerate(request.items)
+    ]
+
+
+async def _batch_events(request: PydanticAIBatchSentimentRequest) -> AsyncIterator[Dict[str, Any]]:
+    tasks = await _batch_item_tasks(request)
+    failed = 0
+    try:
+        # 哪条先完成就先推送哪条，index 字段用于前端对号入座
+        for next_done in asyncio.as_completed(tasks):
+            item = await next_done
+            failed += item.error is not None
+            yield {"type": "item", **item.model_dump()}
+    finally:
+        for task in tasks:  # 客户端中途断开时取消尚未完成的模型调用
+            task.cancel()
+    yield {"type": "done", "succeeded": len(tasks) - failed, "failed": failed}
+
+
+@router.post("/api/vibe/pydanticai/sentiment/batch", response_model=PydanticAIBatchSentimentResponse)
+async def analyze_sentiment_batch(
+    request: PydanticAIBatchSentimentRequest, stream: Optional[StreamFormat] = None
+):
+    if not DASHSCOPE_API_KEY:
+        raise HTTPException(status_code=500, detail="缺少 DASHSCOPE_API_KEY 环境变量")
+    if len(request.items) > PYDANTICAI_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"单批最多 {PYDANTICAI_BATCH_MAX_ITEMS} 条")
+    _ensure_upstream_available()
+
+    if stream:  # ?stream=ndjson|sse：每条结果完成即推送，最后附一条 done 汇总
+        return stream_events(_batch_events(request), stream)
+
+    results = await asyncio.gather(*await _batch_item_tasks(request))
+    failed = sum(1 for item in results if item.error is not None)
+    return PydanticAIBatchSentimentResponse(results=results, succeeded=len(results) - failed, failed=failed)
+
+
+async def _run_sentiment_job(payload: Dict[str, Any]) -> SentimentAnalysis:
+    # 后台 worker 执行：与同步接口走同一条图片处理、结果缓存与模型路由链路
+    request = PydanticAISentimentRequest.model_validate(payload)
+    binary_images, image_digests = await _gather_images(request)
+    return await _analyze(request, binary_images, image_digests)
+
+
+job_queue.register("pydanticai_sentiment", _run_sentiment_job)
+
+
+@router.post("/api/vibe/pydanticai/sentiment/jobs", status_code=202, response_model=SentimentJob)
+async def submit_sentiment_job(request: PydanticAISentimentRequest):
+    # 提交后立即返回任务 ID，模型调用由后台 worker 完成，不占用当前 HTTP 连接
+    if not DASHSCOPE_API_KEY:
+        raise HTTPException(status_code=500, detail="缺少 DASHSCOPE_API_KEY 环境变量")
+    job_id = await job_queue.submit("pydanticai_sentiment", request.model_dump(mode="json"))
+    return await job_queue.get(job_id)
+
+
+@router.get("/api/vibe/pydanticai/sentiment/jobs/{job_id}", response_model=SentimentJob)
+async def get_sentiment_job(job_id: str, wait: float = Query(default=0, ge=0, le=PYDANTICAI_JOB_MAX_WAIT)):
+    # wait > 0 时长轮询：任务结束或超时才返回，减少客户端轮询次数
+    job = await (job_queue.wait(job_id, wait) if wait else job_queue.get(job_id))
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+
+@router.get("/api/vibe/pydanticai/sentiment/jobs/{job_id}/events")
+async def subscribe_sentiment_job(job_id: str, stream: StreamFormat = "sse"):
+    # 订阅任务状态：queued -> running -> succeeded/failed，每次变化推送一条事件
+    if await job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return stream_events(job_queue.subscribe(job_id), stream)
+
+
+@router.get("/api/vibe/pydanticai/image-cache/stats")
+async def image_cache_stats():
+    # 图片缓存命中/未命中、内存占用等指标，便于观察重复图片的节省效果
+    return image_cache.stats()
+
+
+@router.get("/api/vibe/pydanticai/result-cache/stats")
+async def result_cache_stats():
+    # 分析结果缓存的命中率与条目数，以及在途请求合并的次数
+    return {**sentiment_cache.stats(), "single_flight": _analysis_flights.stats()}
+
+
+@router.get("/api/vibe/pydanticai/routing/stats")
+async def routing_stats():
+    # 各模型调用次数、升级次数与原因、平均耗时、token 用量与估算成本
+    return resources.model_router.stats()
+
+
+@router.get("/api/vibe/pydanticai/upstream/stats")
+async def upstream_stats():
+    # 两条链路共享的上游治理状态：调用/重试/拒绝次数、熔断状态、剩余重试预算
+    return dashscope_governor.stats()
+
+
+@router.get("/api/vibe/pydanticai/job-queue/stats")
+async def job_queue_stats():
+    # 后台 worker 数与各状态的任务数
+    return await asyncio.to_thread(job_queue.stats)
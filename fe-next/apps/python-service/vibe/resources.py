@@ -0,0 +1,152 @@
+import asyncio  # 并发预热多条连接
+import logging  # 结构化日志
+import os  # 读取 Key、Base URL 与连接池配置
+from contextlib import asynccontextmanager  # FastAPI lifespan
+from typing import AsyncIterator, Optional  # 类型注解
+
+import httpx  # DashScope 兼容接口与图片下载共用的 HTTP 客户端实现
+from fastapi import FastAPI  # lifespan 的参数类型
+from openai import AsyncOpenAI  # OpenAI 官方 async 客户端（兼容 DashScope OpenAI 模式）
+from pydantic_ai import Agent  # Pydantic AI 的核心 Agent 抽象
+from pydantic_ai.models.openai import OpenAIChatModel  # 封装 OpenAI Chat 接口的模型定义
+from pydantic_ai.providers.openai import OpenAIProvider  # 适配 OpenAI 协议的 Provider（可替换后端）
+
+from .image_loader import image_loader  # 图片下载连接池，随应用一起关闭
+from .image_preprocess import image_preprocessor  # 图片预处理进程池，随应用一起关闭
+from .job_queue import job_queue  # 后台任务 worker，随应用启动与停止
+from .model_router import ModelRouter  # flash / plus 自适应路由
+from .schemas import SentimentAnalysis  # Agent 的输出结构
+from .upstream import dashscope_governor  # 与 dashscope 原生链路共享配额与熔断状态
+
+# 进程级资源层：DashScope 连接池、OpenAI 客户端与 Agent 在每个 worker 内只创建一次，
+# 启动时预先建立 TLS 连接，关闭时统一释放；部署或扩容后的第一个请求不再承担握手开销
+
+logger = logging.getLogger(__name__)
+
+DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
+DASHSCOPE_COMPAT_BASE_URL = os.getenv(
+    "DASHSCOPE_COMPAT_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"
+)
+
+DASHSCOPE_HTTP_MAX_CONNECTIONS = int(os.getenv("DASHSCOPE_HTTP_MAX_CONNECTIONS", "100"))  # 连接池总连接数
+DASHSCOPE_HTTP_MAX_KEEPALIVE = int(os.getenv("DASHSCOPE_HTTP_MAX_KEEPALIVE", "20"))  # 空闲时保留的长连接数
+DASHSCOPE_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("DASHSCOPE_HTTP_KEEPALIVE_EXPIRY", "60"))  # 空闲连接保留时长（秒）
+DASHSCOPE_HTTP_CONNECT_TIMEOUT = float(os.getenv("DASHSCOPE_HTTP_CONNECT_TIMEOUT", "10"))  # 建连超时（秒）
+DASHSCOPE_HTTP_TIMEOUT = float(os.getenv("DASHSCOPE_HTTP_TIMEOUT", "120"))  # 读写超时（秒），多模态推理较慢
+DASHSCOPE_WARMUP_CONNECTIONS = int(os.getenv("DASHSCOPE_WARMUP_CONNECTIONS", "2"))  # 启动时预建的连接数，0 关闭预热
+
+SENTIMENT_SYSTEM_PROMPT = (
+    "你是一名专业的消费市场分析师。综合文本与可访问的图片链接，给出简洁的商业价值分析。"
+    "直接输出 JSON，字段需满足定义的 Pydantic Schema，confidence 填写你对结论的把握程度。"
+)
+
+# 提前提醒缺少 Key，方便部署时排查
+if not DASHSCOPE_API_KEY:
+    logger.warning("未找到 DASHSCOPE_API_KEY 环境变量")
+
+
+def _build_agent(model_name: str, provider: OpenAIProvider) -> Agent:
+    # 构造一个 Pydantic AI Agent，绑定模型、系统提示和输出 Schema
+    return Agent(
+        model=OpenAIChatModel(model_name, provider=provider),  # 选用通义千问多模态版本
+        system_prompt=SENTIMENT_SYSTEM_PROMPT,
+        output_type=SentimentAnalysis,  # 要求返回的结构体类型，Agent 会自动校验/解析
+    )
+
+
+class ServiceResources:
+    def __init__(self, api_key: Optional[str] = DASHSCOPE_API_KEY, base_url: str = DASHSCOPE_COMPAT_BASE_URL) -> None:
+        self.api_key = api_key
+        self.base_url = base_url
+        # 均在首次使用时创建：lifespan 启动时会主动触发，未走 lifespan（如脚本直接调用）时按需创建
+        self._http: Optional[httpx.AsyncClient] = None
+        self._openai: Optional[AsyncOpenAI] = None
+        self._router: Optional[ModelRouter] = None
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(DASHSCOPE_HTTP_TIMEOUT, connect=DASHSCOPE_HTTP_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=DASHSCOPE_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=DASHSCOPE_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=DASHSCOPE_HTTP_KEEPALIVE_EXPIRY,
+                ),
+            )
+        return self._http
+
+    @property
+    def openai_client(self) -> AsyncOpenAI:
+        if self._openai is None:
+            # 复用同一个连接池；api_key 在这里传入，不依赖任何全局状态
+            # max_retries=0：重试统一交给 dashscope_governor，避免 SDK 内部重试绕过重试预算
+            self._openai = AsyncOpenAI(
+                api_key=self.api_key, base_url=self.base_url, http_client=self.http_client, max_retries=0
+            )
+        return self._openai
+
+    @property
+    def model_router(self) -> ModelRouter:
+        if self._router is None:
+            # 将客户端包装成 Provider，flash / plus 两个 Agent 共用；flash 为默认层，plus 只在策略判定需要时使用
+            provider = OpenAIProvider(openai_client=self.openai_client)
+            self._router = ModelRouter(
+                {
+                    "flash": _build_agent("qwen3-vl-flash", provider),
+                    "plus": _build_agent("qwen3-vl-plus", provider),
+                },
+                governor=dashscope_governor,
+            )
+        return self._router
+
+    async def warmup(self, connections: int = DASHSCOPE_WARMUP_CONNECTIONS) -> int:
+        """并发发起若干个轻量请求，把 DNS、TCP 与 TLS 握手提前做掉；返回成功建立的连接数。"""
+        if connections <= 0:
+            return 0
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+        async def ping() -> bool:
+            try:
+                # 只关心连接是否建立，状态码（401/404 等）无所谓；响应读完后连接回到池中保持 keep-alive
+                await self.http_client.get(f"{self.base_url.rstrip('/')}/models", headers=headers)
+                return True
+            except httpx.HTTPError as exc:
+                logger.warning("DashScope 连接预热失败", extra={"error": repr(exc)})
+                return False
+
+        results = await asyncio.gather(*(ping() for _ in range(connections)))
+        return sum(results)
+
+    async def startup(self) -> None:
+        if not self.api_key:
+            return  # 没有 Key 时路由会直接返回 500，不必建连
+        self.model_router  # noqa: B018 - 提前构造客户端与 Agent
+        warmed = await self.warmup()
+        logger.info("DashScope 连接预热完成", extra={"warmed": warmed, "requested": DASHSCOPE_WARMUP_CONNECTIONS})
+
+    async def aclose(self) -> None:
+        if self._openai is not None:
+            await self._openai.close()  # 会一并关闭传入的 http_client，下面重复关闭无副作用
+        if self._http is not None:
+            await self._http.aclose()
+        self._http = None
+        self._openai = None
+        self._router = None
+
+
+# 进程内共享实例，各路由通过它获取客户端与 Agent
+resources = ServiceResources()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    await resources.startup()
+    job_queue.start()  # 上次进程退出时放回队列的任务在这里继续执行
+    try:
+        yield
+    finally:
+        await job_queue.stop()
+        await resources.aclose()
+        await image_loader.aclose()
+        image_preprocessor.shutdown()
@@ -0,0 +1,182 @@
+import asyncio  # SQLite 读写放到线程池，避免阻塞事件循环
+import hashlib  # 生成缓存 key
+import json  # 序列化 key 的组成部分
+import os  # 读取缓存配置
+import re  # 归一化空白字符
+import sqlite3  # 本地持久化后端
+import threading  # 内存/SQLite 后端都可能被多个线程访问
+import time  # TTL 计算
+import unicodedata  # 全角/半角等 Unicode 归一化
+from collections import OrderedDict  # 内存后端的 LRU 顺序
+from pathlib import Path  # SQLite 文件路径
+from typing import Any, Dict, Iterable, Optional, Protocol  # 类型注解
+
+from .schemas import SentimentAnalysis  # 缓存的值：已通过校验的分析结果
+from .settings import VIBE_DATA_DIR  # SQLite 文件的默认目录
+
+# 情绪分析结果缓存：同一帖子（归一化文本 + 图片内容哈希 + 模型名）重复提交时直接返回上次的结构化结果
+# 后端可插拔：进程内 LRU（默认）或本地 SQLite（多 worker 共享、重启不丢）
+
+SENTIMENT_CACHE_BACKEND = os.getenv("SENTIMENT_CACHE_BACKEND", "memory")  # memory / sqlite / off
+SENTIMENT_CACHE_TTL = float(os.getenv("SENTIMENT_CACHE_TTL", str(24 * 3600)))  # 结果有效期（秒）
+SENTIMENT_CACHE_MAX_ENTRIES = int(os.getenv("SENTIMENT_CACHE_MAX_ENTRIES", "10000"))  # 条目上限
+SENTIMENT_CACHE_PATH = os.getenv("SENTIMENT_CACHE_PATH") or str(VIBE_DATA_DIR / "sentiment_results.sqlite3")
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    # NFKC 统一全角/半角与兼容字符，折叠空白，忽略大小写：爬虫重试带来的细微差异不影响命中
+    normalized = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE_RE.sub(" ", normalized).strip().casefold()
+
+
+def result_cache_key(model: str, text: str, image_digests: Iterable[str]) -> str:
+    # 图片按内容哈希排序参与计算：同一组图片换个顺序仍视为同一帖子
+    payload = json.dumps([model, normalize_text(text), sorted(image_digests)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCacheBackend(Protocol):
+    blocking: bool  # 为 True 时调用方应在线程池中访问
+
+    def get(self, key: str) -> Optional[str]: ...
+
+    def set(self, key: str, value: str, ttl: float) -> None: ...
+
+    def __len__(self) -> int: ...
+
+
+class MemoryResultBackend:
+    blocking = False
+
+    def __init__(self, max_entries: int = SENTIMENT_CACHE_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple[float, str]]" = OrderedDict()  # key -> (过期时间, JSON)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteResultBackend:
+    blocking = True
+
+    def __init__(self, path: str = SENTIMENT_CACHE_PATH, max_entries: int = SENTIMENT_CACHE_MAX_ENTRIES) -> None:
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # check_same_thread=False：连接由线程池中的不同线程复用，并发由 _lock 串行化
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sentiment_results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sentiment_results_accessed ON sentiment_results (accessed_at)"
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM sentiment_results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM sentiment_results WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE sentiment_results SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sentiment_results (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now),
+            )
+            self._conn.execute("DELETE FROM sentiment_results WHERE expires_at < ?", (now,))
+            # 超出上限时按最近访问时间淘汰最旧的条目
+            self._conn.execute(
+                "DELETE FROM sentiment_results WHERE key IN ("
+                "SELECT key FROM sentiment_results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sentiment_results").fetchone()[0]
+
+
+class SentimentResultCache:
+    def __init__(self, backend: Optional[ResultCacheBackend], ttl: float = SENTIMENT_CACHE_TTL) -> None:
+        self.backend = backend  # None 表示关闭缓存
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    async def _call(self, fn, *args):
+        if self.backend is not None and self.backend.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def get(self, key: str) -> Optional[SentimentAnalysis]:
+        if self.backend is None:
+            return None
+        raw = await self._call(self.backend.get, key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return SentimentAnalysis.model_validate_json(raw)
+
+    async def set(self, key: str, analysis: SentimentAnalysis) -> None:
+        if self.backend is None:
+            return
+        await self._call(self.backend.set, key, analysis.model_dump_json(), self.ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__ if self.backend is not None else "off",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self.backend) if self.backend is not None else 0,
+        }
+
+
+def build_result_cache(backend: str = SENTIMENT_CACHE_BACKEND) -> SentimentResultCache:
+    if backend == "off":
+        return SentimentResultCache(None)
+    if backend == "sqlite":
+        return SentimentResultCache(SqliteResultBackend())
+    if backend == "memory":
+        return SentimentResultCache(MemoryResultBackend())
+    raise ValueError(f"未知的 SENTIMENT_CACHE_BACKEND: {backend}")
+
+
+# 进程内共享实例，两个情绪分析路由共用
+sentiment_cache = build_result_cache()
@@ -0,0 +1,19 @@
+from typing import List, Optional  # 类型注解
+
+from pydantic import BaseModel, Field  # Pydantic 数据模型与字段校验
+
+# 两条情绪分析链路（dashscope 原生 / pydantic-ai）共用的输出结构
+
+
+class SentimentAnalysis(BaseModel):
+    # 输出的情绪/商业分析结构
+    summary: str  # 总结
+    sentiment_score: float = Field(ge=0, le=10)  # 0-10 的情绪得分，使用 Field 校验范围
+    sentiment_keywords: List[str]  # 关键词
+    user_persona: str  # 用户画像
+    pain_points: List[str]  # 痛点
+    gain_points: List[str]  # 亮点/收获点
+    marketing_suspicion: str  # 是否有营销嫌疑
+    verdict: str  # 结论
+    # 模型对本次判断的自评置信度（0-1），用于 flash -> plus 的升级判断；旧数据可能没有该字段
+    confidence: Optional[float] = Field(default=None, ge=0, le=1, description="对本次分析结论的置信度，0-1")
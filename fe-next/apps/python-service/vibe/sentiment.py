@@ -19,27 +19,46 @@ JSON Response (200):
 JSON Response (500 - 模型或解析异常):
 {"detail": "AI 分析结果格式错误"}
 
+JSON Response (429/503 - 上游限流或熔断，响应头带 Retry-After):
+{"detail": "上游服务暂时不可用（熔断中），请稍后重试"}
+
 Curl Command:
 curl -X POST http://localhost:8000/api/analyze/sentiment \\
   -H \"Content-Type: application/json\" \\
   -d '{\"text\":\"分析这条社交媒体帖子文本\",\"image_urls\":[\"https://example.com/poster.png\"]}'
 """
+import asyncio
 import json
+import logging
 import os
+from contextlib import aclosing
 from http import HTTPStatus
-from typing import List
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 import dashscope
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
-router = APIRouter()
+from .json_extract import JsonObjectExtractor, extract_json_object
+from .logging_setup import log_payload, truncate
+from .metrics import MODEL_CALLS, MODEL_INFLIGHT, record_tokens, stage_timer
+from .resources import DASHSCOPE_API_KEY
+from .result_cache import result_cache_key, sentiment_cache
+from .schemas import SentimentAnalysis
+from .single_flight import SingleFlight
+from .streaming import StreamFormat, stream_events
+from .upstream import UpstreamError, UpstreamRejected, dashscope_governor
 
-DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
+router = APIRouter()
+logger = logging.getLogger(__name__)
 
-if not DASHSCOPE_API_KEY:
-    print("警告: 未找到 DASHSCOPE_API_KEY 环境变量")
-dashscope.api_key = DASHSCOPE_API_KEY
+# 单个 worker 同时在途的模型调用上限，超出的请求在事件循环上排队等待而不是阻塞
+DASHSCOPE_MAX_CONCURRENCY = int(os.getenv("DASHSCOPE_MAX_CONCURRENCY", "32"))
+_dashscope_slots = asyncio.Semaphore(DASHSCOPE_MAX_CONCURRENCY)
+# 模型输出无法解析或不符合 Schema 时，最多追加几次纯文本的修复调用（0 表示不修复）
+SENTIMENT_REPAIR_ATTEMPTS = int(os.getenv("SENTIMENT_REPAIR_ATTEMPTS", "1"))
+# 相同 cache_key 的在途请求只调用一次模型
+_analysis_flights = SingleFlight()
 
 
 class SentimentRequest(BaseModel):
@@ -47,11 +66,7 @@ class SentimentRequest(BaseModel):
     image_urls: List[str] = []
 
 
-@router.post("/api/analyze/sentiment")
-async def analyze_sentiment(request: SentimentRequest):
-    print(
-        f"收到分析请求: Text length={len(request.text)}, Images={len(request.image_urls)}"
-    )
+def _build_messages(request: SentimentRequest) -> list:
     prompt = f"""
     你是一名专业的消费市场分析师。请结合用户提供的文本和图片（如果有），分析这篇社交媒体帖子的商业价值。
     
@@ -77,30 +92,183 @@ async def analyze_sentiment(request: SentimentRequest):
         content_list.append({"image": url})
 
     content_list.append({"text": prompt})
-    messages = [{"role": "user", "content": content_list}]
+    return [{"role": "user", "content": content_list}]
 
-    try:
-        response = dashscope.MultiModalConversation.call(
+
+def _check_response(response) -> None:
+    if response.status_code != HTTPStatus.OK:
+        raise UpstreamError(response.status_code, f"Model Error: {response.code} - {response.message}")
+
+
+def _record_usage(response) -> None:
+    # 流式增量输出时每个分片的 usage 都是累计值，取最后一个分片即可
+    usage = getattr(response, "usage", None)
+    if usage:
+        record_tokens("qwen3-vl-flash", getattr(usage, "input_tokens", 0), getattr(usage, "output_tokens", 0))
+
+
+async def _request_repair(candidate: str, error: Exception) -> str:
+    # 只重试修复这一步：纯文本调用，不再携带图片重新做一次多模态分析
+    prompt = (
+        "下面这段文本本应是符合约定字段的 JSON 对象，但解析或校验失败。\n"
+        f"错误信息：{error}\n"
+        "请只返回修正后的纯 JSON 对象，不要包含任何解释或 Markdown 代码块：\n"
+        f"{candidate}"
+    )
+
+    async def call():
+        response = await dashscope.AioMultiModalConversation.call(
             model="qwen3-vl-flash",
-            messages=messages,
+            api_key=DASHSCOPE_API_KEY,
+            messages=[{"role": "user", "content": [{"text": prompt}]}],
         )
+        _check_response(response)
+        return response
+
+    async with _dashscope_slots, stage_timer("dashscope", "repair"):
+        # 修复调用同样计入模型调用次数与在途数，与主调用的指标口径一致
+        with MODEL_INFLIGHT.labels("qwen3-vl-flash").track_inprogress():
+            try:
+                response = await dashscope_governor.call(call)
+            except Exception:
+                MODEL_CALLS.labels("qwen3-vl-flash", "error").inc()
+                raise
+        MODEL_CALLS.labels("qwen3-vl-flash", "ok").inc()
+    _record_usage(response)
+    raw_content = response.output.choices[0].message.content[0]["text"]
+    log_payload(logger, "Qwen Repair Output", raw_content)
+    return extract_json_object(raw_content) or raw_content
 
-        if response.status_code == HTTPStatus.OK:
-            raw_content = response.output.choices[0].message.content[0]["text"]
-            print("Qwen Raw Output:", raw_content)
 
-            clean_json = raw_content.replace("```json", "").replace("```", "").strip()
+async def _parse_and_cache(candidate: str, cache_key: str) -> SentimentAnalysis:
+    for attempt in range(SENTIMENT_REPAIR_ATTEMPTS + 1):
+        try:
+            with stage_timer("dashscope", "json_parse"):
+                analysis = SentimentAnalysis.model_validate(json.loads(candidate))
+        except (json.JSONDecodeError, ValidationError) as exc:
+            if attempt == SENTIMENT_REPAIR_ATTEMPTS:
+                raise  # 修复次数用尽仍不符合 Schema，按格式错误处理，不把未校验的结果当作成功返回
+            logger.warning("模型输出未通过校验，尝试修复", extra={"attempt": attempt + 1, "error": truncate(exc)})
+            candidate = await _request_repair(candidate, exc)
+            continue
+        await sentiment_cache.set(cache_key, analysis)
+        return analysis
 
-            result = json.loads(clean_json)
-            return result
-        else:
-            error_msg = f"Model Error: {response.code} - {response.message}"
-            print(error_msg)
-            raise HTTPException(status_code=500, detail=error_msg)
 
-    except json.JSONDecodeError:
-        print("JSON 解析失败，模型返回了非 JSON 格式")
+def _json_candidate(raw_content: str, extractor: JsonObjectExtractor) -> str:
+    # 优先使用提取到的第一个完整对象；没有时退回去掉代码块标记的原文，交给解析与修复
+    return extractor.result or raw_content.replace("```json", "").replace("```", "").strip()
+
+
+async def _open_stream(request: SentimentRequest):
+    # incremental_output：每个分片只包含新增文本；SDK 在首次迭代时才真正发出请求，
+    # 因此把“建立连接 + 取到第一个分片”作为一次可重试的调用，限流/5xx 通常都在这里暴露
+    responses = await dashscope.AioMultiModalConversation.call(
+        model="qwen3-vl-flash",
+        api_key=DASHSCOPE_API_KEY,  # 按调用传入，不修改 dashscope 的全局状态
+        messages=_build_messages(request),
+        stream=True,
+        incremental_output=True,
+    )
+    try:
+        first = await anext(responses, None)
+        if first is not None:
+            _check_response(first)
+    except BaseException:
+        await responses.aclose()
+        raise
+    return responses, first
+
+
+async def _model_deltas(request: SentimentRequest, extractor: JsonObjectExtractor) -> AsyncIterator[str]:
+    async with _dashscope_slots:
+        with MODEL_INFLIGHT.labels("qwen3-vl-flash").track_inprogress():
+            try:
+                responses, response = await dashscope_governor.call(lambda: _open_stream(request))
+                last = response
+                async with aclosing(responses):
+                    while response is not None:
+                        _check_response(response)  # 已有内容推送给客户端后不再重试，错误直接抛出
+                        last = response
+                        content = response.output.choices[0].message.content
+                        delta = content[0].get("text", "") if content else ""
+                        if delta:
+                            yield delta
+                            if extractor.feed(delta) is not None:
+                                break  # JSON 对象已完整，提前断开，不再等待对象之后的多余输出
+                        response = await anext(responses, None)
+            except Exception:
+                MODEL_CALLS.labels("qwen3-vl-flash", "error").inc()
+                raise
+        MODEL_CALLS.labels("qwen3-vl-flash", "ok").inc()
+        _record_usage(last)
+
+
+async def _stream_analysis(request: SentimentRequest, cache_key: str) -> AsyncIterator[Dict[str, Any]]:
+    async with stage_timer("dashscope", "cache_lookup"):
+        cached = await sentiment_cache.get(cache_key)
+    if cached is not None:
+        yield {"type": "result", "data": cached}
+        return
+
+    chunks: List[str] = []
+    extractor = JsonObjectExtractor()
+    async for delta in _model_deltas(request, extractor):
+        chunks.append(delta)
+        yield {"type": "delta", "text": delta}  # 直接转发给客户端
+
+    raw_content = "".join(chunks)
+    log_payload(logger, "Qwen Raw Output", raw_content, cache_key=cache_key)
+    try:
+        result = await _parse_and_cache(_json_candidate(raw_content, extractor), cache_key)
+    except (json.JSONDecodeError, ValidationError) as exc:
+        logger.warning("模型输出无法解析或不符合 Schema", extra={"error": truncate(exc)})
+        yield {"type": "error", "detail": "AI 分析结果格式错误"}
+        return
+    yield {"type": "result", "data": result}
+
+
+async def _call_model(request: SentimentRequest, cache_key: str):
+    # AioMultiModalConversation 基于 aiohttp，等待模型期间不会占用事件循环；
+    # 内部同样以流式接收，JSON 对象一完整就停止，不必等模型把结尾的说明文字也生成完
+    chunks: List[str] = []
+    extractor = JsonObjectExtractor()
+    async with stage_timer("dashscope", "model"):
+        async for delta in _model_deltas(request, extractor):
+            chunks.append(delta)
+
+    raw_content = "".join(chunks)
+    log_payload(logger, "Qwen Raw Output", raw_content, cache_key=cache_key)
+    return await _parse_and_cache(_json_candidate(raw_content, extractor), cache_key)
+
+
+@router.post("/api/analyze/sentiment")
+async def analyze_sentiment(request: SentimentRequest, stream: Optional[StreamFormat] = None):
+    logger.info("收到分析请求", extra={"text_length": len(request.text), "images": len(request.image_urls)})
+    # 图片由 dashscope 自行拉取，本路由拿不到内容，因此以 URL 作为图片标识参与 key
+    cache_key = result_cache_key("qwen3-vl-flash", request.text, request.image_urls)
+
+    if stream:  # ?stream=ndjson|sse：逐段推送模型输出（delta），结束时推送解析后的结果（result）
+        try:
+            dashscope_governor.ensure_available()  # 熔断中时在发出响应头之前返回 503
+        except UpstreamRejected as exc:
+            raise exc.to_http_exception()
+        return stream_events(_stream_analysis(request, cache_key), stream)
+
+    async with stage_timer("dashscope", "cache_lookup"):
+        cached = await sentiment_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        # 缓存未命中但同一帖子正在分析中时，等待那一次调用的结果（包括其错误）
+        return await _analysis_flights.do(cache_key, lambda: _call_model(request, cache_key))
+    except UpstreamRejected as exc:
+        logger.warning("上游调用被拒绝", extra={"status": exc.status_code, "retry_after": exc.retry_after})
+        raise exc.to_http_exception()  # 429/503 + Retry-After，提示客户端退避而不是立即重试
+    except (json.JSONDecodeError, ValidationError) as exc:
+        logger.warning("模型输出无法解析或不符合 Schema", extra={"error": truncate(exc)})
         raise HTTPException(status_code=500, detail="AI 分析结果格式错误")
     except Exception as e:
-        print(f"System Error: {e}")
+        logger.exception("System Error")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,8 @@
+import os  # 读取数据目录配置
+from pathlib import Path  # 默认路径基于服务目录而不是启动时的工作目录
+
+# 运行期数据（任务队列、结果缓存、提示词索引等）的根目录
+# 默认放在服务目录下的 .cache/（已加入 .gitignore），无论从哪个目录启动 uvicorn 都写到同一处
+
+SERVICE_ROOT = Path(__file__).resolve().parent.parent
+VIBE_DATA_DIR = Path(os.getenv("VIBE_DATA_DIR") or SERVICE_ROOT / ".cache").expanduser()
@@ -0,0 +1,38 @@
+import asyncio  # 在途任务共享与取消隔离
+from typing import Any, Awaitable, Callable, Dict, Generic, TypeVar  # 类型注解
+
+# 请求合并（single-flight）：同一 key 的调用在途时，后来者直接等待同一个结果，不再重复请求上游
+# 热门帖子被多个爬虫在几秒内同时提交时，只会产生一次模型调用
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    def __init__(self) -> None:
+        self._inflight: Dict[str, "asyncio.Future[T]"] = {}  # key -> 正在执行的任务
+        self.leaders = 0  # 真正发起上游调用的次数
+        self.followers = 0  # 直接复用在途结果的次数
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.followers += 1
+        # 发起者断开连接时不取消上游调用，其他等待者仍能拿到结果；异常同样共享给所有等待者
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: "asyncio.Future[T]") -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # 所有等待者都已离开时，避免 "exception was never retrieved" 警告
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,48 @@
+import json  # 事件序列化
+import logging  # 结构化日志
+from typing import Any, AsyncIterator, Dict, Literal  # 类型注解
+
+from fastapi.encoders import jsonable_encoder  # 把 Pydantic 模型等转换为可 JSON 序列化的结构
+from fastapi.responses import StreamingResponse  # 边生成边发送的响应
+
+# 流式响应：把事件逐条以 NDJSON 或 Server-Sent Events 的形式推给客户端，前端可以渐进渲染
+# 事件统一为 {"type": "...", ...} 的字典，type 在 SSE 模式下同时作为 event 名称
+
+logger = logging.getLogger(__name__)
+
+StreamFormat = Literal["ndjson", "sse"]
+
+_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def _encode(event: Dict[str, Any], fmt: StreamFormat) -> str:
+    payload = json.dumps(jsonable_encoder(event), ensure_ascii=False)
+    if fmt == "sse":
+        return f"event: {event.get('type', 'message')}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+
+def stream_events(events: AsyncIterator[Dict[str, Any]], fmt: StreamFormat) -> StreamingResponse:
+    async def body() -> AsyncIterator[str]:
+        try:
+            async for event in events:
+                yield _encode(event, fmt)
+        except Exception as exc:  # noqa: BLE001 - 响应头已发出，只能以事件形式告知错误
+            logger.warning("流式响应中断", extra={"error": str(exc)})
+            event = {"type": "error", "detail": str(exc)}
+            retry_after = getattr(exc, "retry_after", None)
+            if retry_after is not None:  # 上游限流/熔断时告知客户端多久后再试
+                event["retry_after"] = retry_after
+            yield _encode(event, fmt)
+
+    return StreamingResponse(
+        body(),
+        media_type=_MEDIA_TYPES[fmt],
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # 关闭 Nginx 等反向代理的缓冲，保证事件及时到达
+        },
+    )
@@ -0,0 +1,289 @@
+import asyncio  # 限流等待与重试退避
+import os  # 读取配额与熔断配置
+import random  # 重试退避加抖动，避免所有请求同时重试
+import time  # 令牌桶与熔断计时
+from contextlib import asynccontextmanager  # 流式调用的准入与结果记录
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar  # 类型注解
+
+import httpx  # OpenAI 兼容链路的网络异常
+from fastapi import HTTPException  # 拒绝时转换为带 Retry-After 的 429/503
+from pydantic_ai.exceptions import ModelAPIError  # pydantic-ai 包装后的连接类错误
+
+try:  # dashscope SDK 基于 aiohttp；未安装时只是少识别一类网络异常
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# 上游治理：两个路由共享同一份 DashScope 配额，统一经过 令牌桶限流 -> 熔断检查 -> 带预算的抖动重试
+# 超出配额或上游持续故障时快速返回 429/503 + Retry-After，而不是堆积请求、全部 500 后被客户端立即重试
+
+DASHSCOPE_RATE_LIMIT = float(os.getenv("DASHSCOPE_RATE_LIMIT", "10"))  # 每秒允许发往上游的调用数，0 表示不限流
+DASHSCOPE_RATE_BURST = int(os.getenv("DASHSCOPE_RATE_BURST", str(max(1, int(DASHSCOPE_RATE_LIMIT)))))  # 令牌桶容量
+DASHSCOPE_RATE_MAX_WAIT = float(os.getenv("DASHSCOPE_RATE_MAX_WAIT", "5"))  # 排队等令牌的最长时间，超过直接 429
+DASHSCOPE_RETRY_ATTEMPTS = int(os.getenv("DASHSCOPE_RETRY_ATTEMPTS", "2"))  # 单次调用最多重试次数
+DASHSCOPE_RETRY_BASE_DELAY = float(os.getenv("DASHSCOPE_RETRY_BASE_DELAY", "0.5"))  # 退避基数（秒）
+DASHSCOPE_RETRY_MAX_DELAY = float(os.getenv("DASHSCOPE_RETRY_MAX_DELAY", "8"))  # 单次退避上限（秒）
+DASHSCOPE_RETRY_BUDGET_RATIO = float(os.getenv("DASHSCOPE_RETRY_BUDGET_RATIO", "0.1"))  # 重试量占调用量的比例上限
+DASHSCOPE_RETRY_BUDGET_MIN = float(os.getenv("DASHSCOPE_RETRY_BUDGET_MIN", "10"))  # 低流量时也保留的重试额度
+DASHSCOPE_BREAKER_FAILURES = int(os.getenv("DASHSCOPE_BREAKER_FAILURES", "5"))  # 连续失败多少次后熔断
+DASHSCOPE_BREAKER_RESET = float(os.getenv("DASHSCOPE_BREAKER_RESET", "30"))  # 熔断持续时间（秒），之后放行一次探测
+
+T = TypeVar("T")
+
+_TRANSIENT_ERRORS: tuple = (httpx.TransportError, asyncio.TimeoutError, ConnectionError, ModelAPIError)
+if aiohttp is not None:
+    _TRANSIENT_ERRORS += (aiohttp.ClientError,)
+
+
+class UpstreamError(Exception):
+    """上游返回的非 2xx 结果（dashscope SDK 以响应对象而非异常返回错误，这里统一转成异常）。"""
+
+    def __init__(self, status_code: int, message: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class UpstreamRejected(Exception):
+    """本地拒绝：限流排队超时（429）、熔断中或重试耗尽（503）。"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+    def to_http_exception(self) -> HTTPException:
+        return HTTPException(
+            status_code=self.status_code,
+            detail=self.detail,
+            headers={"Retry-After": str(max(1, int(self.retry_after + 0.999)))},  # 向上取整到秒
+        )
+
+
+def _status_of(exc: BaseException) -> Optional[int]:
+    # UpstreamError、pydantic-ai 的 ModelHTTPError、openai 的 APIStatusError 都带 status_code
+    return getattr(exc, "status_code", None)
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    status = _status_of(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(exc, _TRANSIENT_ERRORS)
+
+
+def _retry_after_of(exc: BaseException) -> Optional[float]:
+    retry_after = getattr(exc, "retry_after", None)
+    if retry_after is not None:
+        return retry_after
+    # ModelHTTPError 的 __cause__ 是 openai.APIStatusError，可以拿到原始响应头
+    for candidate in (exc, exc.__cause__):
+        response = getattr(candidate, "response", None)
+        value = response.headers.get("retry-after") if response is not None else None
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return None
+
+
+class TokenBucket:
+    def __init__(self, rate: float = DASHSCOPE_RATE_LIMIT, burst: int = DASHSCOPE_RATE_BURST) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def reserve(self, max_wait: float) -> float:
+        """预约一个令牌，返回需要等待的秒数；等待超过 max_wait 时不预约并抛出 429。"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        wait = max(0.0, (1 - self._tokens) / self.rate)
+        if wait > max_wait:
+            raise UpstreamRejected(429, "上游调用超出配额，请稍后重试", wait)
+        self._tokens -= 1  # 允许为负：排在后面的请求按顺序等待更久
+        return wait
+
+
+class RetryBudget:
+    # 每次首发调用存入 ratio 个额度，每次重试消耗 1 个；上游整体故障时重试量不会超过正常流量的 ratio 倍
+    def __init__(self, ratio: float = DASHSCOPE_RETRY_BUDGET_RATIO, minimum: float = DASHSCOPE_RETRY_BUDGET_MIN) -> None:
+        self.ratio = ratio
+        self.cap = minimum
+        self._balance = minimum
+
+    def deposit(self) -> None:
+        self._balance = min(self.cap, self._balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self._balance < 1:
+            return False
+        self._balance -= 1
+        return True
+
+    @property
+    def balance(self) -> float:
+        return self._balance
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = DASHSCOPE_BREAKER_FAILURES, reset_after: float = DASHSCOPE_BREAKER_RESET) -> None:
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._failures = 0  # 连续失败次数
+        self._opened_at: Optional[float] = None  # 熔断开始时间，None 表示闭合
+        self._probing = False  # 半开状态下是否已有探测请求在途
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self._opened_at >= self.reset_after else "open"
+
+    def check(self) -> None:
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and not self._probing:
+            self._probing = True  # 只放行一个探测请求，其余继续快速失败
+            return
+        remaining = max(0.0, self.reset_after - (time.monotonic() - self._opened_at))
+        raise UpstreamRejected(503, "上游服务暂时不可用（熔断中），请稍后重试", remaining or self.reset_after)
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def abandon(self) -> None:
+        self._probing = False  # 探测请求被取消（客户端断开等），允许下一个请求继续探测
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._probing or self._failures >= self.threshold:
+            self._opened_at = time.monotonic()  # 探测失败或连续失败达到阈值：重新开始计时
+        self._probing = False
+
+
+class UpstreamGovernor:
+    def __init__(
+        self,
+        bucket: Optional[TokenBucket] = None,
+        budget: Optional[RetryBudget] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        max_attempts: int = DASHSCOPE_RETRY_ATTEMPTS,
+        max_wait: float = DASHSCOPE_RATE_MAX_WAIT,
+    ) -> None:
+        self.bucket = bucket or TokenBucket()
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self.max_attempts = max_attempts
+        self.max_wait = max_wait
+        self._counters = {"calls": 0, "retries": 0, "rejected": 0, "upstream_errors": 0}
+
+    def ensure_available(self) -> None:
+        """熔断打开时立即拒绝；流式接口在发出响应头之前调用，以便返回真正的 503。"""
+        if self.breaker.state == "open":
+            self._counters["rejected"] += 1
+            self.breaker.check()
+
+    async def _admit(self) -> None:
+        try:
+            self.breaker.check()
+        except UpstreamRejected:
+            self._counters["rejected"] += 1
+            raise
+        try:
+            wait = self.bucket.reserve(self.max_wait)
+            if wait:
+                await asyncio.sleep(wait)
+        except BaseException as exc:
+            self.breaker.abandon()  # 探测请求没能发出，交还探测资格
+            if isinstance(exc, UpstreamRejected):
+                self._counters["rejected"] += 1
+            raise
+        self._counters["calls"] += 1
+
+    def _record(self, exc: Optional[BaseException]) -> None:
+        if exc is None:
+            self.breaker.record_success()
+        elif _is_retryable(exc):
+            self._counters["upstream_errors"] += 1
+            self.breaker.record_failure()
+        else:
+            # 其余异常（4xx、解析失败等）与上游健康无关，不影响熔断计数；
+            # 但半开状态下的探测请求要交还资格，否则探测标记永远不会清除，之后的调用全部 503
+            self.breaker.abandon()
+
+    def _backoff(self, attempt: int, exc: BaseException) -> float:
+        # full jitter：在 [0, min(上限, 基数 * 2^n)] 内随机；上游给了 Retry-After 时至少等这么久
+        delay = random.uniform(0, min(DASHSCOPE_RETRY_MAX_DELAY, DASHSCOPE_RETRY_BASE_DELAY * 2**attempt))
+        return max(delay, _retry_after_of(exc) or 0.0)
+
+    def _give_up(self, exc: BaseException) -> UpstreamRejected:
+        self._counters["rejected"] += 1
+        retry_after = _retry_after_of(exc) or DASHSCOPE_RETRY_MAX_DELAY
+        if _status_of(exc) == 429:
+            return UpstreamRejected(429, "上游调用超出配额，请稍后重试", retry_after)
+        if self.breaker.state == "open":
+            retry_after = self.breaker.reset_after
+        return UpstreamRejected(503, f"上游服务暂时不可用: {exc}", retry_after)
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """经过限流与熔断后执行 fn；遇到 429/5xx/网络错误时在重试预算内抖动重试。"""
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            await self._admit()
+            try:
+                result = await fn()
+            except Exception as exc:  # noqa: BLE001 - 按类型区分是否重试，其余原样抛出
+                self._record(exc)
+                if not _is_retryable(exc):
+                    raise
+                if attempt >= self.max_attempts or self.breaker.state != "closed" or not self.budget.withdraw():
+                    raise self._give_up(exc) from exc
+                delay = self._backoff(attempt, exc)
+                attempt += 1
+                self._counters["retries"] += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.abandon()
+                raise
+            self._record(None)
+            return result
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """流式调用使用：只做准入与结果记录，不重试（已推送给客户端的内容无法撤回）。"""
+        self.budget.deposit()
+        await self._admit()
+        try:
+            yield
+        except Exception as exc:
+            self._record(exc)
+            if _is_retryable(exc):
+                raise self._give_up(exc) from exc
+            raise
+        except BaseException:
+            self.breaker.abandon()
+            raise
+        self._record(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._counters,
+            "breaker_state": self.breaker.state,
+            "retry_budget": round(self.budget.balance, 2),
+            "rate_limit": self.bucket.rate,
+        }
+
+
+# 进程内共享实例：dashscope 原生与 OpenAI 兼容两条链路共用同一份配额与熔断状态
+dashscope_governor = UpstreamGovernor()